@@ -0,0 +1,141 @@
+"""
+Fakes used by the benchmark: a synthetic media library, a Plex server and a
+Home Assistant webhook receiver served from local threads, and a stub
+subsync executable.
+"""
+import json
+import os
+import random
+import stat
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from xml.sax.saxutils import quoteattr
+
+# Sidecar name suffixes, mixing ISO-639-1 and -2 tags, forced and untagged files
+SIDECAR_TAGS = (("en",), ("eng",), ("es",), ("spa",), ("fr",), ("en", "forced"), ("de", "sdh"), ())
+
+# Path prefix the fake Plex server reports for library files
+PLEX_PREFIX = "/plex-media"
+
+
+def make_library(root: str, videos: int, per_dir: int = 20, seed: int = 1) -> dict[int, str]:
+    """
+    Create `videos` empty video files with random sidecar subtitles under
+    root, grouped in folders of per_dir videos. Every video gets an English
+    subtitle so it can be synced. Returns rating key -> path relative to root.
+    """
+    rng = random.Random(seed)
+    items = {}
+    for i in range(videos):
+        directory = os.path.join(f"Show {i // per_dir:04d}", "Season 01")
+        os.makedirs(os.path.join(root, directory), exist_ok=True)
+        stem = f"Show {i // per_dir:04d} - s01e{i % per_dir + 1:02d}"
+        rel_path = os.path.join(directory, stem + ".mkv")
+        open(os.path.join(root, rel_path), "wb").close()
+        tags = {("en",)} | set(rng.sample(SIDECAR_TAGS, rng.randint(0, 3)))
+        for tag in tags:
+            with open(os.path.join(root, directory, ".".join((stem, *tag, "srt"))), "w") as f:
+                f.write("1\n00:00:01,000 --> 00:00:02,000\nHello\n")
+        items[1000 + i] = rel_path
+    return items
+
+
+class _Server:
+    """A ThreadingHTTPServer on a free local port, served from a daemon thread."""
+
+    def __init__(self, handler):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class FakePlex(_Server):
+    """Answers /library/metadata/{ratingKey} for the synthetic library after `latency` seconds."""
+
+    def __init__(self, items: dict[int, str], latency: float = 0.0):
+        self.items = items
+        self.latency = latency
+        self.requests = 0
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                fake.requests += 1
+                time.sleep(fake.latency)
+                parts = self.path.split("?")[0].strip("/").split("/")
+                rel_path = None
+                if len(parts) == 3 and parts[:2] == ["library", "metadata"] and parts[2].isdigit():
+                    rel_path = fake.items.get(int(parts[2]))
+                if rel_path is None:
+                    self.send_error(404)
+                    return
+                file = quoteattr(f"{PLEX_PREFIX}/{rel_path}")
+                title = quoteattr(os.path.splitext(os.path.basename(rel_path))[0])
+                body = (
+                    f'<MediaContainer size="1"><Video ratingKey="{parts[2]}" title={title} type="episode">'
+                    f'<Media><Part file={file} duration="2700000">'
+                    f'<Stream streamType="1" index="0" codec="h264"/>'
+                    f'<Stream streamType="2" index="1" codec="aac" languageCode="eng" languageTag="en"/>'
+                    f"</Part></Media></Video></MediaContainer>"
+                ).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/xml")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        super().__init__(Handler)
+
+
+class FakeHomeAssistant(_Server):
+    """Counts webhook POSTs by stage."""
+
+    def __init__(self):
+        self.stages: dict[str, int] = {}
+        self._lock = threading.Lock()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                stage = json.loads(body or b"{}").get("stage", "")
+                with fake._lock:
+                    fake.stages[stage] = fake.stages.get(stage, 0) + 1
+                self.send_response(200)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        super().__init__(Handler)
+
+
+_STUB = '''#!{python}
+"""Stub subsync: copies --sub to --out after sleeping SUBSYNC_STUB_SECONDS."""
+import os, shutil, sys, time
+args = sys.argv[1:]
+time.sleep(float(os.environ.get("SUBSYNC_STUB_SECONDS", "0")))
+shutil.copyfile(args[args.index("--sub") + 1], args[args.index("--out") + 1])
+print("Synchronization: correlation=99.50%, 40 points", flush=True)
+'''
+
+
+def install_stub_subsync(directory: str) -> str:
+    """Write the stub subsync executable into directory and return its path."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, "subsync")
+    with open(path, "w") as f:
+        f.write(_STUB.format(python=sys.executable))
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    return path
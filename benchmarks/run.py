@@ -0,0 +1,276 @@
+"""
+Benchmark of the sync service.
+
+Runs the FastAPI app under uvicorn against a fake Plex server, a fake Home
+Assistant receiver, a synthetic library and a stub subsync executable, then
+reports request throughput, debounce delay, queue wait, per-stage latency
+percentiles and the cost of find_matching_srt versus directory size as JSON.
+
+    python benchmarks/run.py --videos 2000 --concurrency 32 --output results.json
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from fixtures import PLEX_PREFIX, FakeHomeAssistant, FakePlex, install_stub_subsync, make_library  # noqa: E402
+
+
+def percentiles(values: list[float]) -> dict:
+    """Return count, mean and the 50th, 90th, 99th percentile and maximum of values."""
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 6)
+
+    return {
+        "count": len(ordered),
+        "mean": round(sum(ordered) / len(ordered), 6),
+        "p50": pick(0.5),
+        "p90": pick(0.9),
+        "p99": pick(0.99),
+        "max": round(ordered[-1], 6),
+    }
+
+
+def configure(work: str, plex: FakePlex, home_assistant: FakeHomeAssistant, args) -> None:
+    """Point the service at the fakes; must run before subsync_plex is imported."""
+    os.environ.update({
+        "PLEX_URL": plex.url,
+        "PLEX_TOKEN": "benchmark",
+        "HOME_ASSISTANT_WEBHOOK_URL": f"{home_assistant.url}/api/webhook/subsync",
+        "PLEX_LIBRARY_DIR": os.path.join(work, "library"),
+        "PLEX_API_PATH_PREFIX": PLEX_PREFIX,
+        "SYNC_WORKERS": str(args.workers),
+        "SYNC_QUEUE_SIZE": str(args.videos * 2),
+        "JOB_HISTORY_SIZE": str(args.videos * 2),
+        "SUBSYNC_EFFORTS": "1",
+        "SUBSYNC_STUB_SECONDS": str(args.subsync_seconds),
+        "SUBTITLE_ALIGN": "false",
+        "AUDIO_CACHE_DIR": "",
+        "SYNC_CACHE_PATH": os.path.join(work, "config", "sync_cache.db"),
+        "JOB_STORE_PATH": os.path.join(work, "config", "jobs.db"),
+        "LIBRARY_INDEX_PATH": os.path.join(work, "config", "library_index.db"),
+        "SUBTITLE_BACKUP_DIR": os.path.join(work, "config", "subtitle_backups"),
+        "NOTIFY_BATCH_SIZE": "1",
+        "PATH": os.path.join(work, "bin") + os.pathsep + os.environ.get("PATH", ""),
+    })
+    # The shipped debounce is measured unless overridden
+    if args.debounce is not None:
+        os.environ["SYNC_DEBOUNCE_SECONDS"] = str(args.debounce)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_app():
+    """Serve main:app with uvicorn in a background thread; returns (server, base URL)."""
+    import uvicorn
+    import main
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while not server.started:
+        if time.monotonic() > deadline:
+            raise RuntimeError("uvicorn did not start")
+        time.sleep(0.05)
+    return server, url
+
+
+def run_load(url: str, items: dict[int, str], concurrency: int, timeout: float) -> dict:
+    """Submit a sync for every item, wait for all jobs, and summarize their timings."""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=concurrency)
+    session.mount("http://", adapter)
+    latencies = []
+    rejected = 0
+
+    def submit(media_id):
+        nonlocal rejected
+        start = time.perf_counter()
+        response = session.post(f"{url}/subsync", json={"media_id": media_id, "sub_lang": "en"})
+        latencies.append(time.perf_counter() - start)
+        if response.status_code == 429:
+            rejected += 1
+            return None
+        response.raise_for_status()
+        return response.json()["job_id"]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        job_ids = [job_id for job_id in pool.map(submit, items) if job_id]
+    submit_seconds = time.perf_counter() - start
+
+    jobs = {}
+    deadline = time.monotonic() + timeout
+    pending = list(job_ids)
+    while pending and time.monotonic() < deadline:
+        with ThreadPoolExecutor(concurrency) as pool:
+            results = list(pool.map(lambda job_id: session.get(f"{url}/jobs/{job_id}").json(), pending))
+        for job in results:
+            if job.get("state") in ("finished", "failed"):
+                jobs[job["job_id"]] = job
+        pending = [job_id for job_id in pending if job_id not in jobs]
+        if pending:
+            time.sleep(0.2)
+    total_seconds = time.perf_counter() - start
+
+    stages: dict[str, list[float]] = {}
+    for job in jobs.values():
+        for stage, seconds in (job.get("stages") or {}).items():
+            stages.setdefault(stage, []).append(seconds)
+    results: dict[str, int] = {}
+    for job in jobs.values():
+        results[job.get("result") or job["state"]] = results.get(job.get("result") or job["state"], 0) + 1
+    return {
+        "requests": len(items),
+        "rejected": rejected,
+        "submit_seconds": round(submit_seconds, 3),
+        "requests_per_second": round(len(items) / submit_seconds, 1) if submit_seconds else None,
+        "request_latency_seconds": percentiles(latencies),
+        "completed": len(jobs),
+        "timed_out": len(pending),
+        "total_seconds": round(total_seconds, 3),
+        "jobs_per_second": round(len(jobs) / total_seconds, 2) if total_seconds else None,
+        "results": results,
+        "delay_wait_seconds": percentiles([j["delay_wait"] for j in jobs.values() if j.get("delay_wait") is not None]),
+        "queue_wait_seconds": percentiles([j["queue_wait"] for j in jobs.values() if j.get("queue_wait") is not None]),
+        "job_seconds": percentiles([j["duration"] for j in jobs.values() if j.get("duration") is not None]),
+        "stage_seconds": {stage: percentiles(values) for stage, values in sorted(stages.items())},
+    }
+
+
+def bench_find_matching_srt(work: str, sizes: list[int], lookups: int) -> list[dict]:
+    """Time find_matching_srt in directories of increasing size, cold (first lookup) and warm."""
+    from subsync_plex import subtitle_finder
+    from subsync_plex.dir_index import directory_index
+
+    library = os.environ["PLEX_LIBRARY_DIR"]
+    rows = []
+    for size in sizes:
+        rel_dir = f"dirsize-{size}"
+        directory = os.path.join(library, rel_dir)
+        os.makedirs(directory, exist_ok=True)
+        # One video and one English subtitle per pair of files
+        for i in range(size // 2):
+            open(os.path.join(directory, f"Video {i:05d}.mkv"), "wb").close()
+            open(os.path.join(directory, f"Video {i:05d}.en.srt"), "wb").close()
+        # Age the directory so its listing is trusted by the index
+        past = time.time() - 60
+        os.utime(directory, (past, past))
+        video = f"{rel_dir}/Video {size // 4:05d}.mkv"
+        directory_index.clear()
+        start = time.perf_counter()
+        found = subtitle_finder.find_matching_srt(video, "en")
+        cold = time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in range(lookups):
+            subtitle_finder.find_matching_srt(video, "en")
+        warm = (time.perf_counter() - start) / lookups
+        rows.append({
+            "files": size,
+            "found": found is not None,
+            "cold_seconds": round(cold, 6),
+            "warm_seconds": round(warm, 7),
+        })
+    return rows
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run(args) -> dict:
+    """Run the whole benchmark and return its results."""
+    work = tempfile.mkdtemp(prefix="subsync-bench-")
+    try:
+        start = time.perf_counter()
+        items = make_library(os.path.join(work, "library"), args.videos)
+        library_seconds = time.perf_counter() - start
+        install_stub_subsync(os.path.join(work, "bin"))
+        plex = FakePlex(items, args.plex_latency)
+        home_assistant = FakeHomeAssistant()
+        configure(work, plex, home_assistant, args)
+
+        server, url = start_app()
+        from subsync_plex.config import SYNC_DEBOUNCE_SECONDS
+        load = run_load(url, items, args.concurrency, args.timeout)
+        server.should_exit = True
+
+        from subsync_plex.notifier import flush_notifications
+        flush_notifications(timeout=30)
+        lookups = bench_find_matching_srt(work, [int(s) for s in args.dir_sizes.split(",") if s], args.lookups)
+        results = {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "parameters": vars(args),
+            "debounce_seconds": SYNC_DEBOUNCE_SECONDS,
+            "library_seconds": round(library_seconds, 3),
+            "load": load,
+            "plex_requests": plex.requests,
+            "notifications": dict(sorted(home_assistant.stages.items())),
+            "find_matching_srt": lookups,
+        }
+        plex.close()
+        home_assistant.close()
+    finally:
+        if not args.keep:
+            shutil.rmtree(work, ignore_errors=True)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--videos", type=int, default=1000, help="videos in the synthetic library")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent HTTP clients")
+    parser.add_argument("--workers", type=int, default=4, help="SYNC_WORKERS of the service")
+    parser.add_argument("--subsync-seconds", type=float, default=0.05, help="runtime of the stub subsync")
+    parser.add_argument("--debounce", type=float, help="SYNC_DEBOUNCE_SECONDS of the service (default: its default)")
+    parser.add_argument("--plex-latency", type=float, default=0.0, help="seconds the fake Plex takes per request")
+    parser.add_argument("--dir-sizes", default="10,100,1000,10000", help="directory sizes for find_matching_srt")
+    parser.add_argument("--lookups", type=int, default=1000, help="warm find_matching_srt lookups per size")
+    parser.add_argument("--timeout", type=float, default=600, help="seconds to wait for all jobs")
+    parser.add_argument("--output", help="write the JSON results to this file instead of stdout")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary work directory")
+    args = parser.parse_args()
+
+    # The service logs to stdout, which is kept for the results
+    with contextlib.redirect_stdout(sys.stderr):
+        results = run(args)
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
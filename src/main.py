@@ -1,20 +1,218 @@
-from fastapi import FastAPI, BackgroundTasks
+import threading
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Form, HTTPException, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from pydantic import BaseModel
-from typing import Optional
-from subsync_plex.subsync_service import process_subsync
+from typing import List, Optional, Union
+from subsync_plex.subsync_service import process_subsync, sync_job_key
+from subsync_plex.jobs import JobQueue, QueueFullError
+from subsync_plex.job_store import JobStore
+from subsync_plex.metrics import REASON_NO_SUBTITLE, REASON_PLEX_LOOKUP_FAILED
+from subsync_plex.batch import BatchRunner, expand_batch_keys
+from subsync_plex.library_engine import shutdown_pool
+from subsync_plex.notifier import flush_notifications
+from subsync_plex.library_scanner import find_unsynced, load_library_index, scan_library, scan_status
+from subsync_plex.library_watcher import start_watcher
+from subsync_plex.plex_api import CONTAINER_TYPES
+from subsync_plex.plex_events import ignore_reason, parse_webhook
+from subsync_plex.subtitle_backup import RevertError, revert
+from subsync_plex.config import (
+    SYNC_WORKERS, SYNC_QUEUE_SIZE, JOB_HISTORY_SIZE, SYNC_DEBOUNCE_SECONDS, BATCH_CONCURRENCY, BATCH_HISTORY_SIZE,
+    JOB_STORE_PATH, JOB_RETRIES, JOB_RETRY_BACKOFF, PLEX_WEBHOOK_SUB_LANG, WATCH_LIBRARY,
+)
 
-app = FastAPI()
+job_store = JobStore(JOB_STORE_PATH)
+job_queue = JobQueue(
+    process_subsync,
+    SYNC_WORKERS,
+    SYNC_QUEUE_SIZE,
+    JOB_HISTORY_SIZE,
+    key_func=sync_job_key,
+    debounce=SYNC_DEBOUNCE_SECONDS,
+    journal=job_store,
+    # Plex may be restarting, or the subtitle may not have been downloaded yet
+    retry_reasons=(REASON_PLEX_LOOKUP_FAILED, REASON_NO_SUBTITLE),
+    max_retries=JOB_RETRIES,
+    retry_backoff=JOB_RETRY_BACKOFF,
+)
+# A batch syncs subtitles already in the library: one that is missing will not appear by retrying
+BATCH_RETRY_REASONS = (REASON_PLEX_LOOKUP_FAILED,)
+batch_runner = BatchRunner(job_queue, BATCH_CONCURRENCY, BATCH_HISTORY_SIZE, retry_reasons=BATCH_RETRY_REASONS)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    load_library_index()
+    if job_store.open():
+        recover_jobs()
+    job_queue.start()
+    observer = start_watcher(submit_new_subtitle) if WATCH_LIBRARY else None
+    yield
+    if observer is not None:
+        observer.stop()
+        observer.join(5)
+    job_queue.stop(timeout=5)
+    job_store.close()
+    shutdown_pool()
+    flush_notifications(timeout=5)
+
+def recover_jobs() -> None:
+    """Requeue the jobs that were queued or running when the service last stopped."""
+    recovered = 0
+    for job_id, fields, attempts, not_before in job_store.unfinished():
+        try:
+            data = PlexRequest(**fields)
+        except ValueError as e:
+            print(f"Skipping unreadable journaled job {job_id}: {e}", flush=True)
+            continue
+        batch = {"debounce": 0, "retry_reasons": BATCH_RETRY_REASONS} if data.batch_id else {}
+        job = job_queue.submit(data, job_id=job_id, attempts=attempts, not_before=not_before, force=True, **batch)
+        if job.id != job_id:
+            # Merged into an earlier journaled job for the same media and languages
+            job_store.discard(job_id)
+            continue
+        recovered += 1
+    if recovered:
+        print(f"Requeued {recovered} unfinished job(s) from the job store.", flush=True)
+
+def submit_new_subtitle(media_id: int, sub_lang: str) -> None:
+    """Queue a sync for a subtitle found by the library watcher."""
+    try:
+        job_queue.submit(PlexRequest(media_id=media_id, sub_lang=sub_lang))
+    except QueueFullError as e:
+        print(f"Dropping sync of new subtitle for {media_id}: {e}", flush=True)
+
+app = FastAPI(lifespan=lifespan)
 
 class PlexRequest(BaseModel):
     media_id: int
     entity_id: Optional[str] = None
     # ISO-639-1 audio language code; optional, defaults to environment or 'en'
     audio_lang: Optional[str] = None
-    # ISO-639-1 subtitle language code; optional, defaults to environment or 'en'
-    sub_lang: Optional[str] = None
-
-@app.post("/subsync")
-async def run_subsync(data: PlexRequest, background_tasks: BackgroundTasks):
-    """Schedule a subtitle sync in the background."""
-    background_tasks.add_task(process_subsync, data)
-    return ""
\ No newline at end of file
+    # ISO-639-1 subtitle language code, a list of codes, or "all" for every
+    # language-tagged subtitle next to the video; optional, defaults to environment or 'en'
+    sub_lang: Optional[Union[str, List[str]]] = None
+    # Optional overrides of the sync effort policy: a fixed subsync effort (0-1,
+    # disables escalation), the correlation needed to stop escalating, and the
+    # per-attempt timeout in seconds (0 for none)
+    effort: Optional[float] = None
+    min_correlation: Optional[float] = None
+    timeout: Optional[float] = None
+    # Try aligning to an embedded text track or an already synced subtitle
+    # before audio sync; defaults to SUBTITLE_ALIGN
+    align: Optional[bool] = None
+    # Notifications of requests sharing a batch ID are coalesced into summaries;
+    # set automatically for jobs of POST /subsync/batch
+    batch_id: Optional[str] = None
+
+@app.post("/subsync", status_code=202)
+async def run_subsync(data: PlexRequest):
+    """Queue a subtitle sync and return its job ID."""
+    try:
+        job = job_queue.submit(data)
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "30"})
+    return {
+        "job_id": job.id,
+        "state": job.state,
+        "position": job_queue.position(job),
+        "coalesced": job.coalesced > 0,
+    }
+
+@app.post("/subsync/{media_id}/revert")
+def revert_subsync(media_id: int, sub_lang: Optional[str] = None, force: bool = False):
+    """Restore the subtitles of a media item to their content before the last sync."""
+    try:
+        reverted = revert(media_id, sub_lang, force)
+    except RevertError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"media_id": media_id, "reverted": reverted}
+
+@app.post("/plex/webhook", status_code=202)
+async def plex_webhook(payload: str = Form(...)):
+    """Sync the item of a Plex webhook event; shows and seasons are synced as a batch."""
+    try:
+        event = parse_webhook(payload)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"Invalid webhook payload: {e}")
+    reason = ignore_reason(event)
+    if reason is not None:
+        return {"ignored": reason}
+    sub_lang = PLEX_WEBHOOK_SUB_LANG or None
+    if event.type in CONTAINER_TYPES:
+        keys = expand_batch_keys(parent_keys=[event.rating_key])
+        batch = batch_runner.start_batch(
+            keys, lambda media_id, batch_id: PlexRequest(media_id=media_id, sub_lang=sub_lang, batch_id=batch_id)
+        )
+        return batch.to_dict()
+    return await run_subsync(PlexRequest(media_id=event.rating_key, sub_lang=sub_lang))
+
+class BatchRequest(BaseModel):
+    # Rating keys of movies or episodes to sync
+    rating_keys: List[int] = []
+    # Rating keys of shows or seasons whose episodes should be synced
+    parent_keys: List[int] = []
+    # Library section IDs whose movies or episodes should be synced
+    section_ids: List[int] = []
+    entity_id: Optional[str] = None
+    audio_lang: Optional[str] = None
+    sub_lang: Optional[Union[str, List[str]]] = None
+    effort: Optional[float] = None
+    min_correlation: Optional[float] = None
+    timeout: Optional[float] = None
+    align: Optional[bool] = None
+    # Maximum jobs of this batch queued or running at once; defaults to BATCH_CONCURRENCY
+    concurrency: Optional[int] = None
+
+@app.post("/subsync/batch", status_code=202)
+async def run_subsync_batch(data: BatchRequest):
+    """Sync every item of the given rating keys, shows, seasons and library sections."""
+    if not (data.rating_keys or data.parent_keys or data.section_ids):
+        raise HTTPException(status_code=422, detail="No rating_keys, parent_keys or section_ids given")
+    keys = expand_batch_keys(data.rating_keys, data.parent_keys, data.section_ids)
+
+    def make_request(media_id: int, batch_id: str) -> PlexRequest:
+        return PlexRequest(media_id=media_id, entity_id=data.entity_id, audio_lang=data.audio_lang,
+                           sub_lang=data.sub_lang, effort=data.effort, min_correlation=data.min_correlation,
+                           timeout=data.timeout, align=data.align, batch_id=batch_id)
+
+    batch = batch_runner.start_batch(keys, make_request, data.concurrency)
+    return batch.to_dict()
+
+@app.get("/batches/{batch_id}")
+async def get_batch(batch_id: str):
+    """Return the aggregate progress of a batch sync."""
+    batch = batch_runner.get(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return batch.to_dict()
+
+@app.post("/scan", status_code=202)
+async def run_scan():
+    """Start an incremental scan of the library in the background."""
+    if scan_status()["running"]:
+        raise HTTPException(status_code=409, detail="A library scan is already running")
+    threading.Thread(target=scan_library, name="library-scan", daemon=True).start()
+    return scan_status()
+
+@app.get("/scan")
+async def get_scan():
+    """Return the state of the library scan."""
+    return scan_status()
+
+@app.get("/scan/unsynced")
+def get_unsynced():
+    """List indexed subtitles that have not been synced since they last changed."""
+    return find_unsynced()
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Return the state and timing of a sync job."""
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+@app.get("/metrics")
+def metrics():
+    """Expose Prometheus metrics."""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
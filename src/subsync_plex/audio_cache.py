@@ -0,0 +1,156 @@
+"""
+Cache of reference audio extracted from video files.
+
+subsync decodes the whole reference file before running speech recognition.
+Extracting the selected audio track once as low-rate mono FLAC and passing
+that file as the reference means syncing several subtitle languages for the
+same video decodes the video only once.
+"""
+import hashlib
+import os
+import subprocess
+import threading
+from contextlib import contextmanager
+
+from .config import AUDIO_CACHE_DIR, AUDIO_CACHE_MAX_BYTES, AUDIO_EXTRACT_TIMEOUT
+from .plex_api import PlexMetadata, STREAM_AUDIO
+from .scheduling import priority_prefix
+from .subtitle_finder import ISO_639_1_TO_2
+
+# Sample rate used by the speech recognizer
+SAMPLE_RATE = 16000
+
+_locks_lock = threading.Lock()
+# Lock of each key being looked up or extracted, and how many jobs hold or wait for it
+_locks: dict[str, tuple[threading.Lock, int]] = {}
+_evict_lock = threading.Lock()
+
+
+def select_audio_stream(metadata: PlexMetadata | None, audio_lang: str) -> int | None:
+    """Return the file stream index of the first audio stream in audio_lang, if Plex reports one."""
+    if metadata is None or not metadata.parts:
+        return None
+    iso1 = audio_lang.lower()
+    iso2 = ISO_639_1_TO_2.get(iso1)
+    for stream in metadata.parts[0].streams:
+        if stream.stream_type != STREAM_AUDIO or stream.index is None:
+            continue
+        if (stream.language_tag or "").lower().split("-")[0] == iso1 or stream.language_code == iso2:
+            return stream.index
+    return None
+
+
+def cache_key(video_path: str, stream_index: int | None) -> str | None:
+    """Key the extracted audio on the video's path, size and mtime and the selected stream."""
+    try:
+        st = os.stat(video_path)
+    except OSError:
+        return None
+    ident = f"{video_path}\0{st.st_size}\0{st.st_mtime_ns}\0{stream_index}"
+    return hashlib.sha256(ident.encode("utf-8")).hexdigest()
+
+
+@contextmanager
+def _key_lock(key: str):
+    """Hold the lock of a cache key; it is forgotten once no job holds or waits for it."""
+    with _locks_lock:
+        lock, users = _locks.get(key, (None, 0))
+        lock = lock or threading.Lock()
+        _locks[key] = (lock, users + 1)
+    try:
+        with lock:
+            yield
+    finally:
+        with _locks_lock:
+            lock, users = _locks[key]
+            if users > 1:
+                _locks[key] = (lock, users - 1)
+            else:
+                del _locks[key]
+
+
+def _extract(video_path: str, stream_index: int | None, out_path: str) -> bool:
+    tmp_path = out_path + ".tmp.flac"
+    stream_map = f"0:{stream_index}" if stream_index is not None else "0:a:0"
+    try:
+        subprocess.run(
+            priority_prefix() + [
+                "ffmpeg", "-nostdin", "-v", "error", "-y",
+                "-i", video_path,
+                "-map", stream_map,
+                "-vn", "-ac", "1", "-ar", str(SAMPLE_RATE),
+                "-c:a", "flac",
+                tmp_path,
+            ],
+            check=True,
+            capture_output=True,
+            text=True,
+            timeout=AUDIO_EXTRACT_TIMEOUT,
+        )
+        os.replace(tmp_path, out_path)
+        return True
+    except (OSError, subprocess.SubprocessError) as e:
+        reason = getattr(e, "stderr", None) or str(e)
+        print(f"Reference audio extraction failed for {video_path}: {reason}", flush=True)
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        return False
+
+
+def evict(max_bytes: int | None = None) -> None:
+    """Delete the least recently used cached files until the cache fits in max_bytes."""
+    max_bytes = AUDIO_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    with _evict_lock:
+        try:
+            with os.scandir(AUDIO_CACHE_DIR) as entries:
+                files = [
+                    (entry.stat().st_mtime, entry.stat().st_size, entry.path)
+                    for entry in entries if entry.name.endswith(".flac") and not entry.name.endswith(".tmp.flac")
+                ]
+        except OSError:
+            return
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                print(f"Evicted cached reference audio {path}", flush=True)
+            except OSError:
+                pass
+
+
+def reference_audio(video_path: str, stream_index: int | None = None) -> str | None:
+    """
+    Return the path of the cached reference audio for video_path, extracting it
+    first if needed. Returns None when the cache is disabled or extraction fails,
+    in which case the caller should use the video itself as the reference.
+    """
+    if not AUDIO_CACHE_DIR:
+        return None
+    key = cache_key(video_path, stream_index)
+    if key is None:
+        return None
+    out_path = os.path.join(AUDIO_CACHE_DIR, key + ".flac")
+    # Concurrent jobs for the same video wait for a single extraction
+    with _key_lock(key):
+        try:
+            # Touch so eviction treats the file as recently used; fails if it was just evicted
+            os.utime(out_path)
+            print(f"Using cached reference audio {out_path}", flush=True)
+            return out_path
+        except OSError:
+            pass
+        try:
+            os.makedirs(AUDIO_CACHE_DIR, exist_ok=True)
+        except OSError as e:
+            print(f"Audio cache unavailable at {AUDIO_CACHE_DIR}: {e}", flush=True)
+            return None
+        print(f"Extracting reference audio from {video_path}", flush=True)
+        if not _extract(video_path, stream_index, out_path):
+            return None
+    evict()
+    return out_path if os.path.exists(out_path) else None
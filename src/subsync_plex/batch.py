@@ -0,0 +1,162 @@
+"""
+Batch syncs over lists of rating keys, shows, seasons or library sections.
+"""
+import itertools
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterable, Iterator
+
+from .config import BATCH_RUNNING, BATCH_FINISHED, BATCH_FAILED
+from .jobs import Job, JobQueue, QueueFullError
+from .plex_api import iter_leaf_rating_keys, iter_section_rating_keys
+
+
+def expand_batch_keys(rating_keys: Iterable[int] = (), parent_keys: Iterable[int] = (),
+                      section_ids: Iterable[int] = ()) -> Iterator[int]:
+    """
+    Lazily yield the rating keys to sync: explicit keys first, then the episodes
+    of each show or season, then every movie or episode of each library section.
+    """
+    return itertools.chain(
+        rating_keys,
+        itertools.chain.from_iterable(iter_leaf_rating_keys(key) for key in parent_keys),
+        itertools.chain.from_iterable(iter_section_rating_keys(section) for section in section_ids),
+    )
+
+
+@dataclass
+class Batch:
+    """Progress of a batch sync."""
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    state: str = BATCH_RUNNING
+    # Rating keys read from the expansion so far, and jobs submitted / completed
+    expanded: int = 0
+    submitted: int = 0
+    completed: int = 0
+    results: Counter = field(default_factory=Counter)
+    error: str | None = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: float | None = None
+
+    def to_dict(self) -> dict:
+        return {
+            "batch_id": self.id,
+            "state": self.state,
+            "expanded": self.expanded,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "in_flight": self.submitted - self.completed,
+            "results": dict(self.results),
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class _Outstanding:
+    """Number of jobs of a batch not yet recorded, and the finished ones waiting to be recorded."""
+
+    def __init__(self):
+        self.count = 0
+        self.finished: deque[Job] = deque()
+        self.cond = threading.Condition()
+
+    def add(self, job: Job) -> None:
+        with self.cond:
+            self.count += 1
+        job.add_done_callback(self._job_done)
+
+    def _job_done(self, job: Job) -> None:
+        with self.cond:
+            self.finished.append(job)
+            self.cond.notify()
+
+
+class BatchRunner:
+    """
+    Feeds batches through a JobQueue. Each batch runs in its own thread that
+    pulls rating keys from a lazy iterator and keeps at most `concurrency`
+    of its jobs queued or running, so large libraries are never materialized
+    in memory and a batch cannot monopolize the queue. A job waiting for a
+    retry keeps its slot, so retry_reasons, when given, replaces the queue's
+    retry reasons for batch jobs.
+    """
+
+    def __init__(self, job_queue: JobQueue, concurrency: int, history_size: int = 50, retry_delay: float = 5.0,
+                 retry_reasons: Iterable[str] | None = None):
+        self.job_queue = job_queue
+        self.concurrency = max(1, concurrency)
+        self.history_size = history_size
+        self.retry_delay = retry_delay
+        self.retry_reasons = retry_reasons
+        self._lock = threading.Lock()
+        self._batches: OrderedDict[str, Batch] = OrderedDict()
+
+    def start_batch(self, keys: Iterable[int], make_request: Callable[[int, str], Any],
+                    concurrency: int | None = None) -> Batch:
+        """
+        Start syncing every rating key from keys; make_request builds the job
+        data for a key and the batch ID.
+        """
+        batch = Batch()
+        with self._lock:
+            self._batches[batch.id] = batch
+            self._prune_history()
+        thread = threading.Thread(
+            target=self._run,
+            args=(batch, iter(keys), make_request, max(1, concurrency or self.concurrency)),
+            name=f"batch-{batch.id[:8]}",
+            daemon=True,
+        )
+        thread.start()
+        return batch
+
+    def get(self, batch_id: str) -> Batch | None:
+        with self._lock:
+            return self._batches.get(batch_id)
+
+    def _prune_history(self) -> None:
+        finished = [b.id for b in self._batches.values() if b.state != BATCH_RUNNING]
+        for batch_id in finished[:max(0, len(self._batches) - self.history_size)]:
+            del self._batches[batch_id]
+
+    def _submit(self, data: Any) -> Job:
+        # Wait for room instead of failing the whole batch when the queue is full.
+        # Debouncing merges bursts of webhooks; a batch lists each key once.
+        while True:
+            try:
+                return self.job_queue.submit(data, debounce=0, retry_reasons=self.retry_reasons)
+            except QueueFullError:
+                time.sleep(self.retry_delay)
+
+    def _collect(self, batch: Batch, outstanding: _Outstanding, limit: int) -> None:
+        """Wait until fewer than limit jobs are outstanding, recording jobs in the order they finish."""
+        with outstanding.cond:
+            while outstanding.count >= max(1, limit):
+                while not outstanding.finished:
+                    outstanding.cond.wait()
+                while outstanding.finished:
+                    job = outstanding.finished.popleft()
+                    outstanding.count -= 1
+                    batch.completed += 1
+                    batch.results[job.result or job.state] += 1
+
+    def _run(self, batch: Batch, keys: Iterator[int], make_request: Callable[[int, str], Any],
+             concurrency: int) -> None:
+        outstanding = _Outstanding()
+        try:
+            for key in keys:
+                batch.expanded += 1
+                self._collect(batch, outstanding, concurrency)
+                outstanding.add(self._submit(make_request(key, batch.id)))
+                batch.submitted += 1
+        except Exception as e:
+            batch.error = str(e)
+            print(f"Batch {batch.id} stopped expanding: {e}", flush=True)
+        self._collect(batch, outstanding, 1)
+        batch.state = BATCH_FAILED if batch.error else BATCH_FINISHED
+        batch.finished_at = time.time()
+        print(f"Batch {batch.id} finished: {batch.completed} job(s), results {dict(batch.results)}", flush=True)
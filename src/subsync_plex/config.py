@@ -5,11 +5,50 @@ PLEX_URL = os.getenv("PLEX_URL")
 PLEX_TOKEN = os.getenv("PLEX_TOKEN")
 HOME_ASSISTANT_WEBHOOK_URL = os.getenv("HOME_ASSISTANT_WEBHOOK_URL")
 
+# Home Assistant notifications: request timeout in seconds, retries of failed
+# deliveries and the initial backoff in seconds (doubled per retry), and the
+# number of notifications waiting for delivery before new ones are dropped
+NOTIFY_TIMEOUT = float(os.getenv("NOTIFY_TIMEOUT", "10"))
+NOTIFY_RETRIES = int(os.getenv("NOTIFY_RETRIES", "3"))
+NOTIFY_BACKOFF = float(os.getenv("NOTIFY_BACKOFF", "1"))
+NOTIFY_QUEUE_SIZE = int(os.getenv("NOTIFY_QUEUE_SIZE", "1000"))
+# Notifications of a batch are sent as one summary per NOTIFY_BATCH_SIZE
+# completed syncs, or after NOTIFY_BATCH_INTERVAL seconds; 1 disables coalescing
+NOTIFY_BATCH_SIZE = int(os.getenv("NOTIFY_BATCH_SIZE", "25"))
+NOTIFY_BATCH_INTERVAL = float(os.getenv("NOTIFY_BATCH_INTERVAL", "60"))
+
+# Plex API client: request timeout in seconds, retries on connection errors and
+# 5xx responses, and the metadata cache size and lifetime in seconds
+PLEX_TIMEOUT = float(os.getenv("PLEX_TIMEOUT", "10"))
+PLEX_RETRIES = int(os.getenv("PLEX_RETRIES", "3"))
+PLEX_CACHE_SIZE = int(os.getenv("PLEX_CACHE_SIZE", "1024"))
+PLEX_CACHE_TTL = float(os.getenv("PLEX_CACHE_TTL", "300"))
+# Items requested per page when listing library sections, shows and seasons
+PLEX_PAGE_SIZE = int(os.getenv("PLEX_PAGE_SIZE", "200"))
+
 # Local library directory mount point (container mount). Can be overridden via environment variable.
 PLEX_LIBRARY_DIR = os.getenv("PLEX_LIBRARY_DIR", "/media")
 # Prefix of Plex API returned file paths to strip when mapping to container path.
 # Example: "\\server\share\plex\movies" or "/mnt/plexdrive/movies".
 PLEX_API_PATH_PREFIX = os.getenv("PLEX_API_PATH_PREFIX", "")
+# Number of directory listings kept in memory for subtitle lookups
+DIR_INDEX_SIZE = int(os.getenv("DIR_INDEX_SIZE", "16384"))
+# SQLite database holding the library scan (POST /scan); empty disables persistence
+LIBRARY_INDEX_PATH = os.getenv("LIBRARY_INDEX_PATH", "/config/library_index.db")
+# Top-level library folders scanned in parallel
+SCAN_WORKERS = int(os.getenv("SCAN_WORKERS", "8"))
+
+# Plex webhooks (POST /plex/webhook): events that trigger a sync, library
+# section IDs and media types to accept (empty accepts every section), and the
+# subtitle language(s) synced for them (comma-separated codes or "all")
+PLEX_WEBHOOK_EVENTS = [e.strip() for e in os.getenv("PLEX_WEBHOOK_EVENTS", "library.new,media.play").split(",") if e.strip()]
+PLEX_WEBHOOK_SECTIONS = [int(s) for s in os.getenv("PLEX_WEBHOOK_SECTIONS", "").split(",") if s.strip()]
+PLEX_WEBHOOK_TYPES = [t.strip() for t in os.getenv("PLEX_WEBHOOK_TYPES", "movie,episode,show,season").split(",") if t.strip()]
+PLEX_WEBHOOK_SUB_LANG = [l.strip() for l in os.getenv("PLEX_WEBHOOK_SUB_LANG", "").split(",") if l.strip()]
+# Watch PLEX_LIBRARY_DIR for new subtitle files and sync them as they appear
+WATCH_LIBRARY = os.getenv("WATCH_LIBRARY", "false").lower() in ("1", "true", "yes")
+# Minimum seconds between rebuilds of the file path to rating key index
+PATH_INDEX_REFRESH = float(os.getenv("PATH_INDEX_REFRESH", "300"))
 
 # Notification message templates
 NOTIFICATION_MESSAGE_TEMPLATE = "SubSync finished for: {}"
@@ -18,11 +57,117 @@ START_MESSAGE_TEMPLATE = "SubSync started for: {}"
 # Failure template for failure notifications, includes error cause
 FAILURE_MESSAGE_TEMPLATE = "SubSync failed for: {}. Reason: {}"
 
+# Sent when the subtitle is already synced against the unchanged video
+SKIPPED_MESSAGE_TEMPLATE = "SubSync skipped for: {}. Subtitle already synced"
+
+# Summary of coalesced batch notifications: batch ID, count and per-stage counts
+BATCH_MESSAGE_TEMPLATE = "SubSync batch {}: {} subtitle(s) processed ({})"
+
 # Sync stage
 STAGE_SYNC_START = "sync-started"
 STAGE_SYNC_FINISHED = "sync-success"
 STAGE_SYNC_FAILED = "sync-failed"
+STAGE_SYNC_SKIPPED = "sync-skipped"
+STAGE_SYNC_BATCH = "sync-batch"
 
 # Default language codes (ISO-639-1); can be overridden via environment variables
 DEFAULT_AUDIO_LANG = os.getenv("DEFAULT_AUDIO_LANG", "en")
-DEFAULT_SUB_LANG = os.getenv("DEFAULT_SUB_LANG", "en")
\ No newline at end of file
+DEFAULT_SUB_LANG = os.getenv("DEFAULT_SUB_LANG", "en")
+# sub_lang value requesting every language-tagged subtitle next to the video
+SUB_LANG_ALL = "all"
+
+# Sync job results returned by process_subsync
+RESULT_SYNCED = "synced"
+RESULT_ALREADY_SYNCED = "already-synced"
+RESULT_FAILED = "failed"
+
+# Sync job states
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_FINISHED = "finished"
+JOB_FAILED = "failed"
+
+# Threads a single subsync run may use; the worker pool is sized so that
+# SYNC_WORKERS * SUBSYNC_JOB_THREADS roughly matches the number of cores.
+SUBSYNC_JOB_THREADS = max(1, int(os.getenv("SUBSYNC_JOB_THREADS", "2")))
+# subsync efforts tried in order; a higher effort is only used when the previous
+# attempt failed or reported a correlation or point count below the thresholds
+SUBSYNC_EFFORTS = [float(e) for e in os.getenv("SUBSYNC_EFFORTS", "0.2,0.5,1").split(",") if e.strip()]
+SUBSYNC_MIN_CORRELATION = float(os.getenv("SUBSYNC_MIN_CORRELATION", "0.99"))
+SUBSYNC_MIN_POINTS = int(os.getenv("SUBSYNC_MIN_POINTS", "20"))
+# Wall-clock limit in seconds for each subsync attempt; 0 disables it
+SUBSYNC_TIMEOUT = float(os.getenv("SUBSYNC_TIMEOUT", "1800"))
+# How subsync is run: "cli" starts the subsync command for every attempt,
+# "library" runs its command line entry point inside long-lived worker processes
+# that keep subsync imported and its dictionaries and speech models loaded
+# (falling back to the CLI if subsync cannot be imported)
+ENGINE_CLI = "cli"
+ENGINE_LIBRARY = "library"
+SUBSYNC_ENGINE = os.getenv("SUBSYNC_ENGINE", ENGINE_CLI).lower()
+SYNC_WORKERS = int(os.getenv("SYNC_WORKERS", "0")) or max(1, (os.cpu_count() or 1) // SUBSYNC_JOB_THREADS)
+# Maximum number of jobs waiting for a worker before new requests are rejected
+SYNC_QUEUE_SIZE = int(os.getenv("SYNC_QUEUE_SIZE", "100"))
+# Number of finished jobs kept in memory for GET /jobs/{id}
+JOB_HISTORY_SIZE = int(os.getenv("JOB_HISTORY_SIZE", "500"))
+# Requests for the same media and languages arriving within this many seconds
+# of each other (or of the previous run finishing) are merged into one job
+SYNC_DEBOUNCE_SECONDS = float(os.getenv("SYNC_DEBOUNCE_SECONDS", "10"))
+# SQLite journal of sync jobs, requeued after a restart; empty disables it.
+# Changes are written every JOB_STORE_FLUSH_INTERVAL seconds and finished jobs
+# are kept for JOB_STORE_RETENTION_DAYS
+JOB_STORE_PATH = os.getenv("JOB_STORE_PATH", "/config/jobs.db")
+JOB_STORE_FLUSH_INTERVAL = float(os.getenv("JOB_STORE_FLUSH_INTERVAL", "0.5"))
+JOB_STORE_RETENTION = float(os.getenv("JOB_STORE_RETENTION_DAYS", "7")) * 86400
+# Jobs failing for a transient reason (Plex unreachable, subtitle not there yet)
+# are retried up to JOB_RETRIES times, waiting JOB_RETRY_BACKOFF seconds
+# before the first retry and doubling the wait for each further one
+JOB_RETRIES = int(os.getenv("JOB_RETRIES", "3"))
+JOB_RETRY_BACKOFF = float(os.getenv("JOB_RETRY_BACKOFF", "60"))
+# Priority of the subsync and ffmpeg processes a sync starts, so syncs yield to
+# Plex: SYNC_NICE is added to their niceness, SYNC_IONICE is an I/O scheduling
+# class ("idle", "best-effort" or "best-effort:<0-7>") and SYNC_CPUS a CPU list
+# in taskset syntax ("2-5,7"); empty values leave the setting unchanged
+SYNC_NICE = int(os.getenv("SYNC_NICE", "0"))
+SYNC_IONICE = os.getenv("SYNC_IONICE", "").strip().lower()
+SYNC_CPUS = os.getenv("SYNC_CPUS", "").strip()
+# Maximum number of jobs running at once against the same mount under
+# PLEX_LIBRARY_DIR (top-level folders on one filesystem share the limit); 0 is unlimited
+SYNC_MOUNT_CONCURRENCY = int(os.getenv("SYNC_MOUNT_CONCURRENCY", "0"))
+# Hold back new jobs while Plex is transcoding; Plex sessions are checked at
+# most every TRANSCODE_CHECK_INTERVAL seconds and held jobs retry after that long
+PAUSE_WHILE_TRANSCODING = os.getenv("PAUSE_WHILE_TRANSCODING", "false").lower() in ("1", "true", "yes")
+TRANSCODE_CHECK_INTERVAL = float(os.getenv("TRANSCODE_CHECK_INTERVAL", "30"))
+# Maximum number of jobs a single batch keeps queued or running at once
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "0")) or SYNC_WORKERS
+# Number of finished batches kept in memory for GET /batches/{id}
+BATCH_HISTORY_SIZE = int(os.getenv("BATCH_HISTORY_SIZE", "50"))
+
+# Batch states
+BATCH_RUNNING = "running"
+BATCH_FINISHED = "finished"
+BATCH_FAILED = "failed"
+
+# SQLite database recording completed syncs so unchanged subtitles are skipped;
+# set to an empty string to always re-sync
+SYNC_CACHE_PATH = os.getenv("SYNC_CACHE_PATH", "/config/sync_cache.db")
+
+# Originals of synced subtitles, stored once per content hash, and the number
+# of versions kept per subtitle for POST /subsync/{media_id}/revert; set
+# SUBTITLE_BACKUP_DIR empty to disable backups
+SUBTITLE_BACKUP_DIR = os.getenv("SUBTITLE_BACKUP_DIR", "/config/subtitle_backups")
+SUBTITLE_BACKUP_VERSIONS = int(os.getenv("SUBTITLE_BACKUP_VERSIONS", "5"))
+
+# Cache of reference audio extracted from videos, reused when several subtitles
+# are synced against the same file; set AUDIO_CACHE_DIR empty to disable
+AUDIO_CACHE_DIR = os.getenv("AUDIO_CACHE_DIR", "/config/audio_cache")
+AUDIO_CACHE_MAX_BYTES = int(os.getenv("AUDIO_CACHE_MAX_BYTES", str(5 * 1024 ** 3)))
+AUDIO_EXTRACT_TIMEOUT = float(os.getenv("AUDIO_EXTRACT_TIMEOUT", "1800"))
+
+# Align subtitles to an embedded text track or an already synced subtitle of
+# the same video before falling back to audio sync; alignments whose cue timing
+# correlates with the reference less than SUBTITLE_ALIGN_MIN_SCORE (0-1) are
+# rejected (unrelated subtitles score near 0), and
+# offsets are searched up to SUBTITLE_ALIGN_MAX_OFFSET seconds
+SUBTITLE_ALIGN = os.getenv("SUBTITLE_ALIGN", "true").lower() in ("1", "true", "yes")
+SUBTITLE_ALIGN_MIN_SCORE = float(os.getenv("SUBTITLE_ALIGN_MIN_SCORE", "0.5"))
+SUBTITLE_ALIGN_MAX_OFFSET = float(os.getenv("SUBTITLE_ALIGN_MAX_OFFSET", "600"))
@@ -0,0 +1,23 @@
+"""
+Helpers for the SQLite databases kept under /config.
+"""
+import os
+import sqlite3
+
+
+def open_database(path: str, schema: str, name: str) -> sqlite3.Connection | None:
+    """
+    Open a SQLite database in WAL mode, creating its directory and schema.
+    The connection may be shared between threads provided callers serialize
+    access. Returns None (after logging) if the database cannot be opened.
+    """
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        conn = sqlite3.connect(path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(schema)
+        conn.commit()
+    except (OSError, sqlite3.Error) as e:
+        print(f"{name} unavailable at {path}: {e}", flush=True)
+        return None
+    return conn
@@ -0,0 +1,112 @@
+"""
+Shared cache of subtitle files per directory, invalidated by directory mtime.
+"""
+import bisect
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from .config import DIR_INDEX_SIZE
+
+SUBTITLE_EXTENSIONS = (".srt", ".ass", ".ssa", ".vtt")
+
+# Listings taken within this many nanoseconds of the directory's mtime are not
+# trusted, as a file created in the same timestamp tick would go unnoticed
+RACY_WINDOW_NS = 2_000_000_000
+
+
+class DirectoryListing:
+    """Subtitle file names of one directory, grouped lazily by video stem."""
+
+    def __init__(self, path: str, mtime_ns: int, subtitles: list[str], scanned_ns: int):
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self.scanned_ns = scanned_ns
+        self.subtitles = sorted(subtitles)
+        self._by_stem: dict[str, list[tuple[str, list[str]]]] = {}
+        self._lock = threading.Lock()
+
+    def is_current(self, mtime_ns: int) -> bool:
+        return mtime_ns == self.mtime_ns and self.scanned_ns - mtime_ns > RACY_WINDOW_NS
+
+    def subtitles_for(self, stem: str) -> list[tuple[str, list[str]]]:
+        """
+        Return (file name, tags) for each subtitle whose name starts with stem,
+        where tags are the lower-cased dot-separated parts between the stem and
+        the extension (e.g. ['en', 'forced'] for 'Movie.en.forced.srt').
+        """
+        with self._lock:
+            group = self._by_stem.get(stem)
+            if group is None:
+                group = []
+                # Names are sorted, so all names starting with stem are contiguous
+                start = bisect.bisect_left(self.subtitles, stem)
+                for name in self.subtitles[start:]:
+                    if not name.startswith(stem):
+                        break
+                    middle = os.path.splitext(name)[0][len(stem):]
+                    group.append((name, [t.lower() for t in middle.split(".") if t]))
+                self._by_stem[stem] = group
+            return group
+
+
+class DirectoryIndex:
+    """
+    LRU cache of DirectoryListing objects shared by all jobs. A lookup costs one
+    stat of the directory; it is only listed again when its mtime changes.
+    """
+
+    def __init__(self, max_size: int = 4096):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._listings: OrderedDict[str, DirectoryListing] = OrderedDict()
+
+    def listing(self, path: str) -> DirectoryListing | None:
+        """Return the listing of path, or None if it is not a readable directory."""
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            self.invalidate(path)
+            return None
+        with self._lock:
+            cached = self._listings.get(path)
+            if cached is not None and cached.is_current(mtime_ns):
+                self._listings.move_to_end(path)
+                return cached
+        listing = self._scan(path, mtime_ns)
+        if listing is None:
+            return None
+        self.store(listing)
+        return listing
+
+    def store(self, listing: DirectoryListing) -> None:
+        with self._lock:
+            self._listings[listing.path] = listing
+            self._listings.move_to_end(listing.path)
+            while len(self._listings) > self.max_size:
+                self._listings.popitem(last=False)
+
+    def invalidate(self, path: str) -> None:
+        with self._lock:
+            self._listings.pop(path, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._listings.clear()
+
+    @staticmethod
+    def _scan(path: str, mtime_ns: int) -> DirectoryListing | None:
+        scanned_ns = time.time_ns()
+        try:
+            with os.scandir(path) as entries:
+                subtitles = [
+                    entry.name for entry in entries
+                    if entry.name.lower().endswith(SUBTITLE_EXTENSIONS)
+                ]
+        except (FileNotFoundError, NotADirectoryError, PermissionError):
+            return None
+        return DirectoryListing(path, mtime_ns, subtitles, scanned_ns)
+
+
+directory_index = DirectoryIndex(DIR_INDEX_SIZE)
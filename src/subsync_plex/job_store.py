@@ -0,0 +1,175 @@
+"""
+Durable journal of sync jobs, so queued and running syncs survive restarts.
+
+Job state changes are collected in memory and written by a background thread
+in one transaction per flush interval, which keeps submitting a job cheap
+even during large imports. On startup the jobs that were queued or running
+are read back and requeued; finished jobs are deleted once they are older
+than the retention period.
+"""
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Callable
+
+from .config import (
+    JOB_QUEUED, JOB_RUNNING, JOB_FINISHED, JOB_FAILED, JOB_STORE_FLUSH_INTERVAL, JOB_STORE_RETENTION,
+)
+from .db import open_database
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL,
+    result TEXT,
+    reason TEXT,
+    error TEXT,
+    submitted_at REAL NOT NULL,
+    not_before REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, updated_at);
+"""
+
+# Seconds between deletions of expired finished jobs
+_COMPACT_INTERVAL = 3600
+
+
+def _encode(data: Any) -> str:
+    if hasattr(data, "model_dump"):
+        data = data.model_dump()
+    elif not isinstance(data, dict):
+        data = vars(data)
+    return json.dumps(data)
+
+
+class JobStore:
+    """SQLite WAL journal of job states, written in batches by a background thread."""
+
+    def __init__(self, path: str, flush_interval: float = JOB_STORE_FLUSH_INTERVAL,
+                 retention: float = JOB_STORE_RETENTION, encode: Callable[[Any], str] = _encode):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.retention = retention
+        self.encode = encode
+        self._conn: sqlite3.Connection | None = None
+        self._db_lock = threading.Lock()
+        self._cond = threading.Condition()
+        # Latest unwritten row per job ID
+        self._dirty: dict[str, tuple] = {}
+        self._thread: threading.Thread | None = None
+        self._closing = False
+
+    def open(self) -> bool:
+        """Open the database and start the writer; returns False if the journal is unavailable."""
+        if not self.path:
+            return False
+        self._conn = open_database(self.path, _SCHEMA, "Job store")
+        if self._conn is None:
+            return False
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._closing = False
+        self._thread = threading.Thread(target=self._writer, name="job-store", daemon=True)
+        self._thread.start()
+        return True
+
+    def close(self) -> None:
+        """Write outstanding changes and stop the writer."""
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def record(self, job) -> None:
+        """Queue the current state of a job for writing."""
+        if self._conn is None:
+            return
+        try:
+            data = self.encode(job.data)
+        except (TypeError, ValueError) as e:
+            print(f"Job {job.id} cannot be journaled: {e}", flush=True)
+            return
+        row = (job.id, data, job.state, job.attempts, job.result, job.reason, job.error,
+               job.submitted_at, job.not_before, time.time())
+        with self._cond:
+            self._dirty[job.id] = row
+
+    def flush(self) -> None:
+        """Write all recorded changes in a single transaction."""
+        with self._cond:
+            rows, self._dirty = list(self._dirty.values()), {}
+        if not rows or self._conn is None:
+            return
+        try:
+            with self._db_lock, self._conn:
+                self._conn.executemany("INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        except sqlite3.Error as e:
+            print(f"Job store write failed: {e}", flush=True)
+
+    def unfinished(self) -> list[tuple[str, dict, int, float]]:
+        """Return (id, data, attempts, not_before) of jobs that were queued or running, oldest first."""
+        if self._conn is None:
+            return []
+        try:
+            with self._db_lock:
+                rows = self._conn.execute(
+                    "SELECT id, data, attempts, not_before FROM jobs WHERE state IN (?, ?) ORDER BY submitted_at",
+                    (JOB_QUEUED, JOB_RUNNING),
+                ).fetchall()
+        except sqlite3.Error as e:
+            print(f"Job store read failed: {e}", flush=True)
+            return []
+        return [(job_id, json.loads(data), attempts, not_before) for job_id, data, attempts, not_before in rows]
+
+    def discard(self, job_id: str) -> None:
+        """Delete a job, e.g. one merged into a duplicate during recovery."""
+        with self._cond:
+            self._dirty.pop(job_id, None)
+        if self._conn is None:
+            return
+        try:
+            with self._db_lock, self._conn:
+                self._conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+        except sqlite3.Error as e:
+            print(f"Job store write failed: {e}", flush=True)
+
+    def compact(self) -> int:
+        """Delete finished jobs older than the retention period; returns the number deleted."""
+        if self._conn is None:
+            return 0
+        cutoff = time.time() - self.retention
+        try:
+            with self._db_lock:
+                with self._conn:
+                    deleted = self._conn.execute(
+                        "DELETE FROM jobs WHERE state IN (?, ?) AND updated_at < ?",
+                        (JOB_FINISHED, JOB_FAILED, cutoff),
+                    ).rowcount
+                if deleted:
+                    self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        except sqlite3.Error as e:
+            print(f"Job store compaction failed: {e}", flush=True)
+            return 0
+        if deleted:
+            print(f"Removed {deleted} expired job(s) from the job store.", flush=True)
+        return deleted
+
+    def _writer(self) -> None:
+        next_compact = time.monotonic()
+        while True:
+            with self._cond:
+                if not self._closing:
+                    self._cond.wait(self.flush_interval)
+                closing = self._closing
+            self.flush()
+            if time.monotonic() >= next_compact:
+                self.compact()
+                next_compact = time.monotonic() + _COMPACT_INTERVAL
+            if closing:
+                return
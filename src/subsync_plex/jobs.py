@@ -0,0 +1,373 @@
+"""
+In-process sync job queue served by a bounded pool of worker threads.
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Hashable, Iterable
+
+from .config import JOB_QUEUED, JOB_RUNNING, JOB_FINISHED, JOB_FAILED, RESULT_FAILED
+from .metrics import (
+    JOB_SECONDS, JOBS_DEFERRED, JOBS_IN_FLIGHT, JOBS_TOTAL, QUEUE_WAIT_SECONDS, REASON_EXCEPTION, job_context,
+    log_event,
+)
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at capacity."""
+
+
+class JobDeferred(Exception):
+    """
+    Raised by a handler that cannot start its job yet; the job goes back to
+    the queue for `delay` seconds without counting as a retry.
+    """
+
+    def __init__(self, reason: str, delay: float):
+        super().__init__(f"{reason}, retrying in {delay:g}s")
+        self.reason = reason
+        self.delay = delay
+
+
+# Guards the done event of jobs together with their completion callbacks
+_done_lock = threading.Lock()
+
+
+@dataclass
+class Job:
+    """A single queued subtitle sync request and its timing."""
+    data: Any
+    key: Hashable = None
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    state: str = JOB_QUEUED
+    result: str | None = None
+    error: str | None = None
+    # Why the job ended as it did, and seconds spent in each stage of the sync
+    reason: str | None = None
+    stages: dict = field(default_factory=dict)
+    submitted_at: float = field(default_factory=time.time)
+    started_at: float | None = None
+    finished_at: float | None = None
+    # When the job was last put in the queue (submitted, retried or deferred)
+    enqueued_at: float = field(default_factory=time.time)
+    # Earliest time a worker may start the job; pushed back by duplicates
+    not_before: float = 0.0
+    # Number of duplicate requests merged into this job
+    coalesced: int = 0
+    # Number of times the job has been retried after a transient failure
+    attempts: int = 0
+    # Failure reasons this job is retried for, instead of the queue's
+    retry_reasons: frozenset | None = None
+    done: threading.Event = field(default_factory=threading.Event, repr=False, compare=False)
+    _done_callbacks: list = field(default_factory=list, repr=False, compare=False)
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """Block until the job has finished or failed; returns False on timeout."""
+        return self.done.wait(timeout)
+
+    def add_done_callback(self, callback: Callable[["Job"], None]) -> None:
+        """Call callback(job) once the job has finished or failed, right away if it already has."""
+        with _done_lock:
+            if not self.done.is_set():
+                self._done_callbacks.append(callback)
+                return
+        callback(self)
+
+    def _set_done(self) -> None:
+        with _done_lock:
+            self.done.set()
+            callbacks, self._done_callbacks = self._done_callbacks, []
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception as e:
+                print(f"Error in completion callback of job {self.id}: {e}", flush=True)
+
+    @property
+    def queue_wait(self) -> float | None:
+        """Seconds the job waited for a worker since it was last queued and allowed to start."""
+        if self.started_at is None:
+            return None
+        return max(0.0, self.started_at - max(self.enqueued_at, self.not_before))
+
+    @property
+    def delay_wait(self) -> float | None:
+        """Seconds the job was held back by its debounce, retry backoff or deferral since it was last queued."""
+        if self.started_at is None:
+            return None
+        return max(0.0, min(self.started_at, self.not_before) - self.enqueued_at)
+
+    @property
+    def duration(self) -> float | None:
+        if self.started_at is None or self.finished_at is None:
+            return None
+        return self.finished_at - self.started_at
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "media_id": getattr(self.data, "media_id", None),
+            "state": self.state,
+            "result": self.result,
+            "error": self.error,
+            "reason": self.reason,
+            "stages": self.stages,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "queue_wait": self.queue_wait,
+            "delay_wait": self.delay_wait,
+            "duration": self.duration,
+            "coalesced": self.coalesced,
+            "attempts": self.attempts,
+        }
+
+
+class JobQueue:
+    """
+    Bounded FIFO of sync jobs processed by a fixed number of worker threads.
+    The handler is called with the job's data and its return value is stored
+    as the job result; an exception or a RESULT_FAILED result marks the job
+    as failed.
+
+    When key_func is given, requests with the same key are coalesced: a
+    duplicate of a queued or running job, or of one that finished less than
+    debounce seconds ago, returns the existing job instead of queuing a new
+    one. Queued jobs wait until no duplicate has arrived for debounce seconds
+    before they start, so a burst of events produces a single run.
+
+    A failed job whose reason is in retry_reasons is queued again up to
+    max_retries times, after retry_backoff seconds doubled per retry. A job
+    whose handler raises JobDeferred is queued again after the requested
+    delay, as often as needed. submit can override the retry reasons and
+    the debounce of a single request. When a journal is given, every state change
+    is passed to journal.record(job).
+    """
+
+    def __init__(self, handler: Callable[[Any], Any], workers: int, max_size: int, history_size: int = 500,
+                 key_func: Callable[[Any], Hashable] | None = None, debounce: float = 0.0, journal=None,
+                 retry_reasons: Iterable[str] = (), max_retries: int = 0, retry_backoff: float = 60.0):
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.max_size = max_size
+        self.history_size = history_size
+        self.key_func = key_func
+        self.debounce = debounce
+        self.journal = journal
+        self.retry_reasons = frozenset(retry_reasons)
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self._cond = threading.Condition()
+        self._pending: deque[Job] = deque()
+        self._jobs: OrderedDict[str, Job] = OrderedDict()
+        # Latest job per key, kept until it has been finished for `debounce` seconds
+        self._by_key: dict[Hashable, Job] = {}
+        self._threads: list[threading.Thread] = []
+        self._running = 0
+        self._stopping = False
+
+    def start(self) -> None:
+        """Start the worker threads."""
+        with self._cond:
+            if self._threads:
+                return
+            self._stopping = False
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f"sync-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        print(f"Started {self.workers} sync worker(s).", flush=True)
+
+    def stop(self, timeout: float | None = None) -> None:
+        """Stop accepting work and wait for running jobs to finish."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+            threads, self._threads = self._threads, []
+        for thread in threads:
+            thread.join(timeout)
+
+    def submit(self, data: Any, job_id: str | None = None, attempts: int = 0, not_before: float = 0.0,
+               force: bool = False, debounce: float | None = None,
+               retry_reasons: Iterable[str] | None = None) -> Job:
+        """
+        Queue a job, or return the existing job for a duplicate request.
+        Raises QueueFullError when the queue is at capacity, unless force is
+        set; job_id, attempts and not_before restore a job from the journal.
+        debounce and retry_reasons override the queue's for this request.
+        """
+        key = self.key_func(data) if self.key_func else None
+        debounce = self.debounce if debounce is None else debounce
+        with self._cond:
+            now = time.time()
+            existing = self._find_duplicate(key, now)
+            if existing is not None:
+                existing.coalesced += 1
+                if existing.state == JOB_QUEUED:
+                    # Never brings forward a retry waiting for its backoff
+                    existing.not_before = max(existing.not_before, now + debounce)
+                print(f"Coalesced duplicate request {key} into job {existing.id} ({existing.state}).", flush=True)
+                return existing
+            if len(self._pending) >= self.max_size and not force:
+                raise QueueFullError(f"Sync queue is full ({self.max_size} jobs waiting)")
+            job = Job(data, key=key, submitted_at=now, enqueued_at=now,
+                      not_before=max(not_before, now + debounce), attempts=attempts,
+                      retry_reasons=None if retry_reasons is None else frozenset(retry_reasons))
+            if job_id is not None:
+                job.id = job_id
+            self._record(job)
+            self._pending.append(job)
+            self._jobs[job.id] = job
+            if key is not None:
+                self._by_key[key] = job
+            self._prune_history()
+            self._cond.notify()
+        return job
+
+    def join(self, timeout: float | None = None) -> bool:
+        """Wait until no jobs are queued or running; returns False on timeout."""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._pending and not self._running, timeout)
+
+    def get(self, job_id: str) -> Job | None:
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def position(self, job: Job) -> int | None:
+        """Return the 1-based position of a queued job, or None if it is not waiting."""
+        with self._cond:
+            for index, pending in enumerate(self._pending):
+                if pending is job:
+                    return index + 1
+        return None
+
+    def pending_count(self) -> int:
+        with self._cond:
+            return len(self._pending)
+
+    def _record(self, job: Job) -> None:
+        if self.journal is not None:
+            self.journal.record(job)
+
+    def _find_duplicate(self, key: Hashable, now: float) -> Job | None:
+        if key is None:
+            return None
+        job = self._by_key.get(key)
+        if job is None:
+            return None
+        if job.finished_at is not None and now - job.finished_at >= self.debounce:
+            del self._by_key[key]
+            return None
+        return job
+
+    def _prune_history(self) -> None:
+        # Drop the oldest finished jobs once the history is over its limit
+        excess = len(self._jobs) - len(self._pending) - self.history_size
+        if excess <= 0:
+            return
+        for job_id in list(self._jobs):
+            if excess <= 0:
+                break
+            job = self._jobs[job_id]
+            if job.state in (JOB_FINISHED, JOB_FAILED):
+                del self._jobs[job_id]
+                if self._by_key.get(job.key) is job:
+                    del self._by_key[job.key]
+                excess -= 1
+
+    def _next_job(self) -> Job | None:
+        with self._cond:
+            while True:
+                if self._stopping:
+                    return None
+                now = time.time()
+                job = next((j for j in self._pending if j.not_before <= now), None)
+                if job is not None:
+                    break
+                # Sleep until the earliest debounced job becomes ready
+                timeout = min((j.not_before for j in self._pending), default=now) - now
+                self._cond.wait(timeout if self._pending else None)
+            self._pending.remove(job)
+            self._running += 1
+            job.state = JOB_RUNNING
+            job.started_at = time.time()
+            self._record(job)
+            return job
+
+    def _worker(self) -> None:
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            self._run(job)
+
+    def _run(self, job: Job) -> None:
+        QUEUE_WAIT_SECONDS.observe(job.queue_wait or 0.0)
+        JOBS_IN_FLIGHT.inc()
+        deferred = None
+        with job_context(job.id, job.attempts) as context:
+            log_event("job-started", media_id=getattr(job.data, "media_id", None), queue_wait=job.queue_wait,
+                      attempt=job.attempts)
+            try:
+                job.result = self.handler(job.data)
+                job.state = JOB_FAILED if job.result == RESULT_FAILED else JOB_FINISHED
+            except JobDeferred as e:
+                deferred = e
+            except Exception as e:
+                job.error = str(e)
+                job.state = JOB_FAILED
+                context.reason = REASON_EXCEPTION
+                print(f"Sync job {job.id} failed: {e}", flush=True)
+            finally:
+                JOBS_IN_FLIGHT.dec()
+            if deferred is not None:
+                JOBS_DEFERRED.labels(reason=deferred.reason).inc()
+                log_event("job-deferred", reason=deferred.reason, delay=deferred.delay)
+                self._defer(job, deferred.delay)
+                return
+            job.finished_at = time.time()
+            job.reason = context.reason or job.result
+            job.stages = {stage: round(seconds, 3) for stage, seconds in context.stages.items()}
+            JOB_SECONDS.observe(job.duration or 0.0)
+            log_event("job-finished", state=job.state, result=job.result, reason=job.reason,
+                      duration=job.duration, stages=job.stages)
+            if self._finish(job):
+                # Only the final outcome of a job is counted and reported
+                JOBS_TOTAL.labels(result=job.result or job.state, reason=job.reason or job.state).inc()
+                for callback in context.on_final:
+                    try:
+                        callback()
+                    except Exception as e:
+                        print(f"Error finishing job {job.id}: {e}", flush=True)
+                job._set_done()
+
+    def _defer(self, job: Job, delay: float) -> None:
+        with self._cond:
+            self._running -= 1
+            job.state = JOB_QUEUED
+            job.started_at = None
+            job.enqueued_at = time.time()
+            job.not_before = job.enqueued_at + delay
+            self._pending.append(job)
+            self._record(job)
+            self._cond.notify_all()
+
+    def _finish(self, job: Job) -> bool:
+        """Retry the job if its failure is transient; returns True if it has ended for good."""
+        with self._cond:
+            self._running -= 1
+            retry_reasons = self.retry_reasons if job.retry_reasons is None else job.retry_reasons
+            if job.state == JOB_FAILED and job.reason in retry_reasons and job.attempts < self.max_retries:
+                delay = self.retry_backoff * 2 ** job.attempts
+                job.attempts += 1
+                job.state = JOB_QUEUED
+                job.enqueued_at = time.time()
+                job.not_before = job.enqueued_at + delay
+                job.started_at = job.finished_at = None
+                self._pending.append(job)
+                print(f"Retrying job {job.id} ({job.reason}) in {delay:g}s, attempt {job.attempts}.", flush=True)
+            self._record(job)
+            self._cond.notify_all()
+        return job.state != JOB_QUEUED
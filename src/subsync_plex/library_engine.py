@@ -0,0 +1,259 @@
+"""
+In-process subsync engine.
+
+Instead of starting the subsync CLI for every sync, long-lived worker
+processes import sc0ty/subsync once and call its command line entry point
+for each job, so the interpreter start-up, module imports and native
+extension loading are paid once per worker rather than once per job. The
+worker also memoizes subsync's dictionary and speech model loaders, so
+the assets of a language are read from /config/assets once per worker and
+reused by later jobs; the pocketsphinx decoder itself is still set up by
+each sync. Each worker runs a single sync at a time; a worker that exceeds
+the timeout is killed together with its process group and replaced.
+"""
+import contextlib
+import functools
+import importlib
+import io
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+import traceback
+
+from .config import SYNC_WORKERS
+from .scheduling import apply_priority
+
+# Seconds allowed for a new worker to import subsync
+_STARTUP_TIMEOUT = 120
+# subsync's asset loaders whose results a worker keeps for later jobs, by arguments (languages)
+_CACHED_LOADERS = (
+    ("subsync.synchro.dictionary", "loadDictionary"),
+    ("subsync.synchro.speech", "loadSpeechModel"),
+)
+
+
+class _Tee(io.TextIOBase):
+    """Writes to the worker's real stream while capturing the text."""
+
+    def __init__(self, stream, buffer: io.StringIO):
+        self._stream = stream
+        self._buffer = buffer
+
+    def write(self, text: str) -> int:
+        self._buffer.write(text)
+        self._stream.write(text)
+        self._stream.flush()
+        return len(text)
+
+    def flush(self) -> None:
+        self._stream.flush()
+
+
+def _load_entry():
+    """Import subsync and return its command line entry point."""
+    module = importlib.import_module("subsync.__main__")
+    for name in ("subsync", "main"):
+        entry = getattr(module, name, None)
+        if callable(entry):
+            return entry
+    raise ImportError("subsync.__main__ has no subsync() or main() entry point")
+
+
+def _memoize(loader):
+    cache = {}
+
+    @functools.wraps(loader)
+    def load(*args, **kwargs):
+        key = (args, tuple(sorted(kwargs.items())))
+        try:
+            return cache[key]
+        except KeyError:
+            pass
+        except TypeError:
+            # Unhashable arguments are not cached
+            return loader(*args, **kwargs)
+        cache[key] = result = loader(*args, **kwargs)
+        return result
+
+    return load
+
+
+def _cache_assets() -> list[str]:
+    """
+    Replace subsync's asset loaders with memoized versions in every loaded
+    subsync module referring to them; returns the names of the loaders cached.
+    """
+    cached = []
+    for module_name, name in _CACHED_LOADERS:
+        try:
+            loader = getattr(importlib.import_module(module_name), name)
+        except (ImportError, AttributeError):
+            continue
+        memoized = _memoize(loader)
+        # Modules may have imported the loader by name rather than through its module
+        for module in list(sys.modules.values()):
+            if getattr(module, "__name__", "").partition(".")[0] == "subsync" \
+                    and getattr(module, name, None) is loader:
+                setattr(module, name, memoized)
+        cached.append(f"{module_name}.{name}")
+    return cached
+
+
+def _run_entry(entry, args: list[str]) -> tuple[int, str]:
+    buffer = io.StringIO()
+    returncode = 0
+    # subsync parses sys.argv like the CLI would
+    argv, sys.argv = sys.argv, ["subsync", *args]
+    with contextlib.redirect_stdout(_Tee(sys.__stdout__, buffer)), \
+            contextlib.redirect_stderr(_Tee(sys.__stderr__, buffer)):
+        try:
+            result = entry()
+            if isinstance(result, int):
+                returncode = result
+        except SystemExit as e:
+            returncode = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+        except Exception:
+            traceback.print_exc()
+            returncode = 1
+        finally:
+            sys.argv = argv
+    return returncode, buffer.getvalue()
+
+
+def _worker_main(conn) -> None:
+    # Own process group so a timed out sync can be killed with its children
+    os.setsid()
+    apply_priority()
+    try:
+        entry = _load_entry()
+    except Exception as e:
+        conn.send(("unavailable", f"{type(e).__name__}: {e}"))
+        return
+    cached = _cache_assets()
+    print(f"subsync worker {os.getpid()} caches {', '.join(cached) if cached else 'no assets'} across jobs.",
+          flush=True)
+    conn.send(("ready", None))
+    while True:
+        try:
+            args = conn.recv()
+        except (EOFError, OSError):
+            return
+        if args is None:
+            return
+        conn.send(_run_entry(entry, args))
+
+
+class _Worker:
+    def __init__(self, context):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def wait_ready(self) -> str | None:
+        """Return None when the worker is ready, or the reason it cannot run subsync."""
+        if not self.conn.poll(_STARTUP_TIMEOUT):
+            self.kill()
+            return "worker did not start in time"
+        try:
+            status, reason = self.conn.recv()
+        except EOFError:
+            return "worker exited during start-up"
+        return None if status == "ready" else reason
+
+    def kill(self) -> None:
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            self.process.kill()
+        self.process.join(5)
+        self.conn.close()
+
+    def stop(self) -> None:
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(5)
+        if self.process.is_alive():
+            self.kill()
+
+
+class LibraryEnginePool:
+    """Up to `size` subsync worker processes, started on demand and reused across jobs."""
+
+    def __init__(self, size: int):
+        self.size = max(1, size)
+        self.available = True
+        self._context = multiprocessing.get_context("spawn")
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._lock = threading.Lock()
+        self._idle: list[_Worker] = []
+
+    def _acquire_worker(self) -> _Worker | None:
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        worker = _Worker(self._context)
+        reason = worker.wait_ready()
+        if reason is not None:
+            worker.kill()
+            self.available = False
+            print(f"In-process subsync engine unavailable ({reason}); falling back to the CLI.", flush=True)
+            return None
+        return worker
+
+    def run(self, args: list[str], timeout: float | None) -> tuple[int | None, str, bool] | None:
+        """
+        Run subsync with the given arguments (without the program name) in a
+        worker. Returns (returncode, output, timed_out) like
+        sync_engine.run_process, or None when the engine is unavailable.
+        """
+        if not self.available:
+            return None
+        with self._slots:
+            worker = self._acquire_worker()
+            if worker is None:
+                return None
+            try:
+                worker.conn.send(args)
+                if not worker.conn.poll(timeout):
+                    print(f"Timed out after {timeout}s; killing subsync worker (pid {worker.process.pid}).", flush=True)
+                    worker.kill()
+                    return None, "", True
+                returncode, output = worker.conn.recv()
+            except (EOFError, OSError) as e:
+                # The worker died (e.g. a crash in native code); replace it on the next job
+                worker.kill()
+                return 1, f"subsync worker exited unexpectedly: {e}", False
+            with self._lock:
+                self._idle.append(worker)
+            return returncode, output, False
+
+    def shutdown(self) -> None:
+        with self._lock:
+            workers, self._idle = self._idle, []
+        for worker in workers:
+            worker.stop()
+
+
+_pool: LibraryEnginePool | None = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> LibraryEnginePool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = LibraryEnginePool(SYNC_WORKERS)
+        return _pool
+
+
+def shutdown_pool() -> None:
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown()
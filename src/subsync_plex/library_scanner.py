@@ -0,0 +1,294 @@
+"""
+Library-wide inventory of video files and their sidecar subtitles.
+
+The scan walks PLEX_LIBRARY_DIR in parallel across top-level folders and
+persists one row per directory. On later scans a directory whose mtime is
+unchanged is not listed again; its stored entries are reused. The stored
+listings also prime the shared directory index so find_matching_srt does
+not have to touch the filesystem beyond a single stat.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from .config import PLEX_LIBRARY_DIR, LIBRARY_INDEX_PATH, SCAN_WORKERS
+from .db import open_database
+from .dir_index import DirectoryListing, SUBTITLE_EXTENSIONS, RACY_WINDOW_NS, directory_index
+from .subtitle_finder import parse_subtitle_tags
+from .sync_cache import synced_subtitles
+
+VIDEO_EXTENSIONS = (
+    ".mkv", ".mp4", ".m4v", ".avi", ".mov", ".wmv", ".ts", ".m2ts", ".mpg", ".mpeg", ".webm",
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS directories (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    scanned_ns INTEGER NOT NULL,
+    subdirs TEXT NOT NULL,
+    videos TEXT NOT NULL,
+    subtitles TEXT NOT NULL
+);
+"""
+
+_db_lock = threading.Lock()
+_scan_lock = threading.Lock()
+_conn: sqlite3.Connection | None = None
+_conn_path: str | None = None
+_last_result: "ScanResult | None" = None
+
+
+@dataclass
+class DirectoryEntry:
+    """Stored listing of one library directory."""
+    path: str
+    mtime_ns: int
+    scanned_ns: int
+    subdirs: list[str]
+    videos: list[str]
+    # (file name, mtime_ns) of each subtitle file
+    subtitles: list[tuple[str, int]]
+
+    def is_current(self, mtime_ns: int) -> bool:
+        return mtime_ns == self.mtime_ns and self.scanned_ns - mtime_ns > RACY_WINDOW_NS
+
+
+@dataclass
+class ScanResult:
+    """Summary of a library scan."""
+    root: str
+    directories: int = 0
+    rescanned: int = 0
+    removed: int = 0
+    videos: int = 0
+    subtitles: int = 0
+    duration: float = 0.0
+    finished_at: float = field(default_factory=time.time)
+
+    def to_dict(self) -> dict:
+        return dict(self.__dict__)
+
+
+def _connection() -> sqlite3.Connection | None:
+    global _conn, _conn_path
+    path = LIBRARY_INDEX_PATH
+    if not path:
+        return None
+    if _conn is not None and _conn_path == path:
+        return _conn
+    conn = open_database(path, _SCHEMA, "Library index")
+    if conn is None:
+        return None
+    _conn, _conn_path = conn, path
+    return conn
+
+
+def load_entries(root: str | None = None) -> dict[str, DirectoryEntry]:
+    """Load the stored directory entries, optionally limited to those under root."""
+    with _db_lock:
+        conn = _connection()
+        if conn is None:
+            return {}
+        rows = conn.execute("SELECT path, mtime_ns, scanned_ns, subdirs, videos, subtitles FROM directories").fetchall()
+    entries = {}
+    prefix = root.rstrip(os.sep) + os.sep if root else None
+    for path, mtime_ns, scanned_ns, subdirs, videos, subtitles in rows:
+        if prefix and path != root.rstrip(os.sep) and not path.startswith(prefix):
+            continue
+        entries[path] = DirectoryEntry(
+            path, mtime_ns, scanned_ns, json.loads(subdirs), json.loads(videos),
+            [tuple(s) for s in json.loads(subtitles)],
+        )
+    return entries
+
+
+def _save(changed: list[DirectoryEntry], removed: list[str]) -> None:
+    with _db_lock:
+        conn = _connection()
+        if conn is None:
+            return
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO directories VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (e.path, e.mtime_ns, e.scanned_ns, json.dumps(e.subdirs), json.dumps(e.videos),
+                     json.dumps(e.subtitles))
+                    for e in changed
+                ],
+            )
+            conn.executemany("DELETE FROM directories WHERE path = ?", [(path,) for path in removed])
+
+
+def _visit(path: str, previous: dict[str, DirectoryEntry]) -> tuple[DirectoryEntry | None, bool]:
+    """Return the entry for path and whether it had to be listed again."""
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+    except OSError:
+        return None, False
+    old = previous.get(path)
+    if old is not None and old.is_current(mtime_ns):
+        return old, False
+    scanned_ns = time.time_ns()
+    subdirs, videos, subtitles = [], [], []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                name = entry.name
+                lower = name.lower()
+                if entry.is_dir(follow_symlinks=False):
+                    # Skip hidden and NAS metadata folders (.grab, @eaDir, ...)
+                    if not name.startswith((".", "@")):
+                        subdirs.append(name)
+                elif lower.endswith(VIDEO_EXTENSIONS):
+                    videos.append(name)
+                elif lower.endswith(SUBTITLE_EXTENSIONS):
+                    subtitles.append((name, entry.stat().st_mtime_ns))
+    except OSError as e:
+        print(f"Unable to scan {path}: {e}", flush=True)
+        return None, False
+    return DirectoryEntry(path, mtime_ns, scanned_ns, sorted(subdirs), sorted(videos), sorted(subtitles)), True
+
+
+def _walk(top: str, previous: dict[str, DirectoryEntry]) -> tuple[list[DirectoryEntry], list[DirectoryEntry]]:
+    """Walk one top-level folder; returns (all entries, entries that were listed again)."""
+    entries, changed = [], []
+    stack = [top]
+    while stack:
+        path = stack.pop()
+        entry, rescanned = _visit(path, previous)
+        if entry is None:
+            continue
+        entries.append(entry)
+        if rescanned:
+            changed.append(entry)
+        stack.extend(os.path.join(path, name) for name in entry.subdirs)
+    return entries, changed
+
+
+def prime_directory_index(entries) -> None:
+    """Seed the shared directory index with stored listings."""
+    for entry in entries:
+        directory_index.store(
+            DirectoryListing(entry.path, entry.mtime_ns, [name for name, _ in entry.subtitles], entry.scanned_ns)
+        )
+
+
+def load_library_index() -> int:
+    """Prime the directory index from the persisted scan; returns the number of directories loaded."""
+    entries = load_entries(PLEX_LIBRARY_DIR)
+    prime_directory_index(entries.values())
+    return len(entries)
+
+
+def scan_library(root: str | None = None, workers: int | None = None) -> ScanResult:
+    """
+    Scan the library incrementally and persist the result. Only one scan runs
+    at a time; concurrent callers wait for the running scan to finish first.
+    """
+    global _last_result
+    root = (root or PLEX_LIBRARY_DIR).rstrip(os.sep) or os.sep
+    with _scan_lock:
+        started = time.monotonic()
+        previous = load_entries(root)
+        root_entry, root_rescanned = _visit(root, previous)
+        result = ScanResult(root=root)
+        if root_entry is None:
+            print(f"Library directory {root} is not readable.", flush=True)
+            return result
+        entries, changed = [root_entry], [root_entry] if root_rescanned else []
+        tops = [os.path.join(root, name) for name in root_entry.subdirs]
+        with ThreadPoolExecutor(max_workers=max(1, workers or SCAN_WORKERS)) as pool:
+            for top_entries, top_changed in pool.map(lambda top: _walk(top, previous), tops):
+                entries.extend(top_entries)
+                changed.extend(top_changed)
+        seen = {entry.path for entry in entries}
+        removed = [path for path in previous if path not in seen]
+        _save(changed, removed)
+        prime_directory_index(entries)
+        result.directories = len(entries)
+        result.rescanned = len(changed)
+        result.removed = len(removed)
+        result.videos = sum(len(entry.videos) for entry in entries)
+        result.subtitles = sum(len(entry.subtitles) for entry in entries)
+        result.duration = time.monotonic() - started
+        result.finished_at = time.time()
+        _last_result = result
+    print(
+        f"Library scan of {root}: {result.directories} directories ({result.rescanned} rescanned, "
+        f"{result.removed} removed), {result.videos} videos, {result.subtitles} subtitles "
+        f"in {result.duration:.2f}s",
+        flush=True,
+    )
+    return result
+
+
+def scan_status() -> dict:
+    """Return whether a scan is running and the summary of the last completed scan."""
+    return {
+        "running": _scan_lock.locked(),
+        "last_scan": _last_result.to_dict() if _last_result else None,
+    }
+
+
+def _match_video(name: str, stems: list[str]) -> str | None:
+    # stems are sorted longest first so 'Movie.Part.2' wins over 'Movie'
+    for stem in stems:
+        if name.startswith(stem + "."):
+            return stem
+    return None
+
+
+def find_unsynced(root: str | None = None) -> list[dict]:
+    """
+    Return the sidecar subtitles in the index that have never been synced, or
+    that changed after their last recorded sync.
+    """
+    root = (root or PLEX_LIBRARY_DIR).rstrip(os.sep) or os.sep
+    synced = synced_subtitles()
+    unsynced = []
+    for entry in load_entries(root).values():
+        if not entry.videos or not entry.subtitles:
+            continue
+        stems = sorted((os.path.splitext(v)[0] for v in entry.videos), key=len, reverse=True)
+        videos = {os.path.splitext(v)[0]: v for v in entry.videos}
+        for name, mtime_ns in entry.subtitles:
+            stem = _match_video(name, stems)
+            if stem is None:
+                continue
+            subtitle_path = os.path.join(entry.path, name)
+            synced_at = synced.get(subtitle_path)
+            if synced_at is not None and synced_at * 1e9 >= mtime_ns:
+                continue
+            tags = [t.lower() for t in os.path.splitext(name)[0][len(stem):].split(".") if t]
+            language, forced = parse_subtitle_tags(tags)
+            unsynced.append({
+                "video": os.path.relpath(os.path.join(entry.path, videos[stem]), root),
+                "subtitle": subtitle_path,
+                "language": language,
+                "forced": forced,
+                "synced_at": synced_at,
+            })
+    return unsynced
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Scan the Plex library for videos and sidecar subtitles.")
+    parser.add_argument("--root", help="library directory (default: PLEX_LIBRARY_DIR)")
+    parser.add_argument("--workers", type=int, help="parallel top-level folders (default: SCAN_WORKERS)")
+    parser.add_argument("--unsynced", action="store_true", help="print subtitles that have not been synced")
+    args = parser.parse_args(argv)
+    result = scan_library(args.root, args.workers)
+    output = {"scan": result.to_dict()}
+    if args.unsynced:
+        output["unsynced"] = find_unsynced(args.root)
+    print(json.dumps(output, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Filesystem watcher syncing subtitles as soon as they are written.
+
+Uses watchdog (inotify on Linux) to watch PLEX_LIBRARY_DIR. When a subtitle
+file appears next to a video, the video is resolved to its Plex rating key
+through the path index and a sync for the subtitle's language is requested.
+Network filesystems usually do not deliver inotify events for changes made
+by other hosts; use the library scan for those.
+"""
+import os
+from typing import Callable
+
+from .config import PLEX_LIBRARY_DIR
+from .dir_index import SUBTITLE_EXTENSIONS
+from .library_scanner import VIDEO_EXTENSIONS
+from .plex_events import path_index
+from .subtitle_finder import parse_subtitle_tags
+
+
+def video_for_subtitle(subtitle_path: str) -> tuple[str, list[str]] | None:
+    """
+    Return the video a subtitle file belongs to and the subtitle's tags
+    (e.g. ['en', 'forced'] for 'Movie.en.forced.srt' next to 'Movie.mkv').
+    """
+    directory, name = os.path.split(subtitle_path)
+    try:
+        videos = [n for n in os.listdir(directory) if n.lower().endswith(VIDEO_EXTENSIONS)]
+    except OSError:
+        return None
+    # The longest matching stem wins ('Movie 2.mkv' over 'Movie.mkv' for 'Movie 2.en.srt')
+    best = None
+    for video in videos:
+        stem = os.path.splitext(video)[0]
+        if name.startswith(stem + ".") and (best is None or len(stem) > len(os.path.splitext(best)[0])):
+            best = video
+    if best is None:
+        return None
+    middle = os.path.splitext(name)[0][len(os.path.splitext(best)[0]):]
+    return os.path.join(directory, best), [t.lower() for t in middle.split(".") if t]
+
+
+def handle_subtitle(path: str, submit: Callable[[int, str], None]) -> bool:
+    """Request a sync for a new subtitle file; returns True if one was requested."""
+    name = os.path.basename(path)
+    # Hidden files include the attempt files subsync writes before they replace the subtitle
+    if name.startswith(".") or not name.lower().endswith(SUBTITLE_EXTENSIONS):
+        return False
+    match = video_for_subtitle(path)
+    if match is None:
+        return False
+    video_path, tags = match
+    language, forced = parse_subtitle_tags(tags)
+    if language is None or forced:
+        return False
+    rating_key = path_index.lookup(video_path)
+    if rating_key is None:
+        print(f"New subtitle {path}: video not found in Plex yet.", flush=True)
+        return False
+    print(f"New subtitle {path}: syncing {language} for rating key {rating_key}.", flush=True)
+    submit(rating_key, language)
+    return True
+
+
+def start_watcher(submit: Callable[[int, str], None], root: str = PLEX_LIBRARY_DIR):
+    """Start watching root and return the watchdog observer, or None if watching is unavailable."""
+    try:
+        from watchdog.events import FileSystemEventHandler
+        from watchdog.observers import Observer
+    except ImportError:
+        print("Library watcher unavailable: the watchdog package is not installed.", flush=True)
+        return None
+
+    class SubtitleHandler(FileSystemEventHandler):
+        def on_created(self, event):
+            if not event.is_directory:
+                self._handle(event.src_path)
+
+        def on_moved(self, event):
+            # A sync moves its hidden attempt file over the subtitle; that must not trigger another sync
+            if not event.is_directory and not os.path.basename(event.src_path).startswith("."):
+                self._handle(event.dest_path)
+
+        def _handle(self, path):
+            try:
+                handle_subtitle(os.fsdecode(path), submit)
+            except Exception as e:
+                print(f"Error handling new subtitle {path}: {e}", flush=True)
+
+    observer = Observer()
+    try:
+        observer.schedule(SubtitleHandler(), root, recursive=True)
+        observer.start()
+    except OSError as e:
+        print(f"Library watcher unavailable for {root}: {e}", flush=True)
+        return None
+    print(f"Watching {root} for new subtitles.", flush=True)
+    return observer
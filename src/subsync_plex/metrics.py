@@ -0,0 +1,125 @@
+"""
+Prometheus metrics and per-stage timing of sync jobs.
+
+Each job runs inside a JobContext that collects how long every stage took
+and why the job ended; stage timings are also exported as histograms, and
+job start and end are logged as JSON lines carrying the job ID.
+"""
+import contextvars
+import json
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable
+
+from prometheus_client import Counter, Gauge, Histogram
+
+# Stage durations range from a cached lookup to an hour long sync
+_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+PLEX_LOOKUP_SECONDS = Histogram(
+    "plex_lookup_seconds", "Time spent fetching Plex metadata", buckets=_BUCKETS)
+SUBTITLE_SEARCH_SECONDS = Histogram(
+    "subtitle_search_seconds", "Time spent looking for subtitle files next to the video", buckets=_BUCKETS)
+AUDIO_EXTRACT_SECONDS = Histogram(
+    "audio_extract_seconds", "Time spent preparing the reference audio", buckets=_BUCKETS)
+SUBTITLE_ALIGN_SECONDS = Histogram(
+    "subtitle_align_seconds", "Time spent aligning subtitles to reference subtitles", buckets=_BUCKETS)
+SUBSYNC_SECONDS = Histogram(
+    "subsync_seconds", "Duration of subsync runs", ["engine"], buckets=_BUCKETS)
+NOTIFY_SECONDS = Histogram(
+    "notify_seconds", "Time spent delivering Home Assistant webhooks", buckets=_BUCKETS)
+QUEUE_WAIT_SECONDS = Histogram(
+    "queue_wait_seconds", "Time jobs waited in the queue before a worker picked them up", buckets=_BUCKETS)
+JOB_SECONDS = Histogram(
+    "job_seconds", "Duration of sync jobs from start to finish", buckets=_BUCKETS)
+JOBS_TOTAL = Counter(
+    "jobs", "Finished sync jobs by result and reason", ["result", "reason"])
+JOBS_IN_FLIGHT = Gauge(
+    "jobs_in_flight", "Sync jobs currently running")
+JOBS_DEFERRED = Counter(
+    "jobs_deferred", "Sync job starts put back in the queue because resources were busy", ["reason"])
+
+# Reasons recorded by the sync workflow, used as the job outcome label
+REASON_PLEX_LOOKUP_FAILED = "plex-lookup-failed"
+REASON_NO_SUBTITLE = "no-subtitle"
+REASON_SUBSYNC_FAILED = "subsync-failed"
+REASON_SUBSYNC_TIMEOUT = "subsync-timeout"
+REASON_EXCEPTION = "exception"
+# Reasons a job start is deferred
+REASON_PLEX_TRANSCODING = "plex-transcoding"
+REASON_MOUNT_BUSY = "mount-busy"
+
+
+@dataclass
+class JobContext:
+    """
+    Stage timings and failure reason of the job running in the current thread,
+    which attempt of the job this is, and callbacks to run once it ends for good.
+    """
+    job_id: str
+    attempt: int = 0
+    stages: dict[str, float] = field(default_factory=dict)
+    reason: str | None = None
+    on_final: list[Callable[[], None]] = field(default_factory=list)
+
+
+_current: contextvars.ContextVar[JobContext | None] = contextvars.ContextVar("subsync_job", default=None)
+
+
+def current_job() -> JobContext | None:
+    return _current.get()
+
+
+@contextmanager
+def job_context(job_id: str, attempt: int = 0):
+    """Make a new JobContext current for the duration of a job."""
+    context = JobContext(job_id, attempt)
+    token = _current.set(context)
+    try:
+        yield context
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def timed(stage: str, histogram):
+    """Observe the duration of the block and add it to the current job's stage timings."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        histogram.observe(elapsed)
+        context = _current.get()
+        if context is not None:
+            context.stages[stage] = context.stages.get(stage, 0.0) + elapsed
+
+
+def set_reason(reason: str) -> None:
+    """Record why the current job failed; the first reason recorded is kept."""
+    context = _current.get()
+    if context is not None and context.reason is None:
+        context.reason = reason
+
+
+def when_final(callback: Callable[[], None]) -> None:
+    """
+    Run callback once the current job has ended and will not be retried, or
+    right away outside a job; it is dropped when the job is retried.
+    """
+    context = _current.get()
+    if context is None:
+        callback()
+    else:
+        context.on_final.append(callback)
+
+
+def log_event(event: str, **fields) -> None:
+    """Print a JSON log line for event, tagged with the current job ID."""
+    context = _current.get()
+    record = {"ts": round(time.time(), 3), "event": event}
+    if context is not None:
+        record["job_id"] = context.job_id
+    record.update(fields)
+    print(json.dumps(record, default=str), flush=True)
@@ -1,14 +1,138 @@
 """
 Home Assistant notification functions.
+
+Notifications are queued and delivered by a background thread over a pooled
+HTTP session, so a slow or unreachable webhook never holds up a sync.
+Notifications belonging to a batch can be coalesced into summary payloads.
 """
+import queue
+import threading
+import time
+
 import requests
-from .config import HOME_ASSISTANT_WEBHOOK_URL
+from .config import (
+    HOME_ASSISTANT_WEBHOOK_URL, NOTIFY_TIMEOUT, NOTIFY_RETRIES, NOTIFY_BACKOFF, NOTIFY_QUEUE_SIZE,
+    NOTIFY_BATCH_SIZE, NOTIFY_BATCH_INTERVAL, STAGE_SYNC_START, STAGE_SYNC_BATCH, BATCH_MESSAGE_TEMPLATE,
+)
+from .metrics import NOTIFY_SECONDS
+
+_session = requests.Session()
+_queue: queue.Queue = queue.Queue(maxsize=NOTIFY_QUEUE_SIZE)
+_thread: threading.Thread | None = None
+_thread_lock = threading.Lock()
+# Pending notifications per batch id: (time the first one was queued, payloads)
+_batches: dict[str, tuple[float, list[dict]]] = {}
+
+
+def deliver(payload: dict) -> bool:
+    """POST a payload to the webhook, retrying transient failures with exponential backoff."""
+    for attempt in range(NOTIFY_RETRIES + 1):
+        try:
+            with NOTIFY_SECONDS.time():
+                response = _session.post(HOME_ASSISTANT_WEBHOOK_URL, json=payload, timeout=NOTIFY_TIMEOUT)
+            response.raise_for_status()
+            print("Home Assistant webhook sent successfully.", flush=True)
+            return True
+        except requests.RequestException as e:
+            print(f"Failed to send Home Assistant webhook: {e}", flush=True)
+            status = getattr(getattr(e, "response", None), "status_code", None)
+            # Client errors other than rate limiting will not succeed on retry
+            if status is not None and 400 <= status < 500 and status != 429:
+                return False
+        if attempt < NOTIFY_RETRIES:
+            time.sleep(NOTIFY_BACKOFF * 2 ** attempt)
+    return False
+
+
+def _summary(batch_id: str, payloads: list[dict]) -> dict:
+    counts: dict[str, int] = {}
+    for payload in payloads:
+        counts[payload["stage"]] = counts.get(payload["stage"], 0) + 1
+    return {
+        "stage": STAGE_SYNC_BATCH,
+        "message": BATCH_MESSAGE_TEMPLATE.format(
+            batch_id, len(payloads), ", ".join(f"{n} {stage}" for stage, n in sorted(counts.items()))
+        ),
+        "batch_id": batch_id,
+        "entity_id": payloads[0].get("entity_id"),
+        "counts": counts,
+        "items": payloads,
+    }
+
+
+def _flush_batches(force: bool = False) -> None:
+    now = time.monotonic()
+    for batch_id, (first_at, payloads) in list(_batches.items()):
+        if force or len(payloads) >= NOTIFY_BATCH_SIZE or now - first_at >= NOTIFY_BATCH_INTERVAL:
+            del _batches[batch_id]
+            deliver(_summary(batch_id, payloads))
+
 
-def send_home_assistant_notification(stage: str, message: str, media_id: int, entity_id: str):
-    """Send a notification via the Home Assistant webhook."""
+def _worker() -> None:
+    while True:
+        try:
+            payload = _queue.get(timeout=1.0 if _batches else None)
+        except queue.Empty:
+            _flush_batches()
+            continue
+        try:
+            if payload is None:
+                _flush_batches(force=True)
+            elif payload.get("batch_id") and NOTIFY_BATCH_SIZE > 1:
+                # Start notifications add nothing to a batch summary
+                if payload["stage"] != STAGE_SYNC_START:
+                    first_at, payloads = _batches.setdefault(payload["batch_id"], (time.monotonic(), []))
+                    payloads.append(payload)
+                _flush_batches()
+            else:
+                deliver(payload)
+        except Exception as e:
+            print(f"Error delivering Home Assistant webhook: {e}", flush=True)
+        finally:
+            _queue.task_done()
+
+
+def _ensure_worker() -> None:
+    global _thread
+    with _thread_lock:
+        if _thread is None or not _thread.is_alive():
+            _thread = threading.Thread(target=_worker, name="notifier", daemon=True)
+            _thread.start()
+
+
+def send_home_assistant_notification(stage: str, message: str, media_id: int, entity_id: str,
+                                     sub_lang: str | None = None, batch_id: str | None = None):
+    """Queue a notification for delivery via the Home Assistant webhook."""
+    if not HOME_ASSISTANT_WEBHOOK_URL:
+        return
+    payload = { "stage": stage, "message": message, "media_id": media_id, "entity_id": entity_id }
+    if sub_lang is not None:
+        payload["sub_lang"] = sub_lang
+    if batch_id is not None:
+        payload["batch_id"] = batch_id
+    _ensure_worker()
     try:
-        response = requests.post(HOME_ASSISTANT_WEBHOOK_URL, json={ "stage": stage, "message": message, "media_id": media_id, "entity_id": entity_id })
-        response.raise_for_status()
-        print("Home Assistant webhook sent successfully.", flush=True)
-    except requests.RequestException as e:
-        print(f"Failed to send Home Assistant webhook: {e}", flush=True)
\ No newline at end of file
+        _queue.put_nowait(payload)
+    except queue.Full:
+        print(f"Notification queue full; dropping '{stage}' notification for {media_id}.", flush=True)
+
+
+def flush_notifications(timeout: float | None = None) -> bool:
+    """
+    Deliver everything queued so far, including partially filled batch
+    summaries; returns False if delivery did not finish within timeout.
+    """
+    if _thread is None:
+        return True
+    try:
+        _queue.put(None, timeout=timeout)
+    except queue.Full:
+        return False
+    done = threading.Event()
+
+    def wait():
+        _queue.join()
+        done.set()
+
+    threading.Thread(target=wait, daemon=True).start()
+    return done.wait(timeout)
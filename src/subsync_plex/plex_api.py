@@ -1,37 +1,280 @@
 """
 Plex API client functions.
 """
-import requests
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Iterator
 from xml.etree import ElementTree as ET
-from .config import PLEX_URL, PLEX_TOKEN
 
-def get_plex_file_path(rating_key: int) -> str | None:
-    """Retrieve the file path for a given Plex metadata rating_key."""
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .config import (
+    PLEX_URL, PLEX_TOKEN, PLEX_TIMEOUT, PLEX_RETRIES, PLEX_CACHE_SIZE, PLEX_CACHE_TTL, PLEX_PAGE_SIZE,
+)
+
+# Plex item types that are synced directly, and containers expanded to their leaves
+LEAF_TYPES = ("movie", "episode")
+CONTAINER_TYPES = ("show", "season")
+
+# Plex stream types
+STREAM_VIDEO = 1
+STREAM_AUDIO = 2
+STREAM_SUBTITLE = 3
+
+
+@dataclass(frozen=True)
+class PlexStream:
+    """An audio, video or subtitle stream of a media part."""
+    id: int | None
+    stream_type: int
+    index: int | None
+    codec: str | None
+    # ISO-639-2 code as reported by Plex (e.g. 'eng') and the newer BCP-47 tag (e.g. 'en')
+    language_code: str | None
+    language_tag: str | None
+    forced: bool
+    # Set for sidecar subtitles; relative URL to download the stream
+    key: str | None
+
+
+@dataclass(frozen=True)
+class PlexPart:
+    """A single file backing a Plex item."""
+    file: str
+    duration: int | None
+    streams: tuple[PlexStream, ...]
+
+
+@dataclass(frozen=True)
+class PlexMetadata:
+    """Metadata for a Plex item as returned by /library/metadata/{rating_key}."""
+    rating_key: int
+    title: str | None
+    type: str | None
+    # Duration in milliseconds
+    duration: int | None
+    parts: tuple[PlexPart, ...]
+
+    @property
+    def files(self) -> list[str]:
+        return [part.file for part in self.parts]
+
+    def languages(self, stream_type: int) -> list[str]:
+        """Return the distinct language codes of the given stream type, in stream order."""
+        seen = []
+        for part in self.parts:
+            for stream in part.streams:
+                code = stream.language_code
+                if stream.stream_type == stream_type and code and code not in seen:
+                    seen.append(code)
+        return seen
+
+    @property
+    def audio_languages(self) -> list[str]:
+        return self.languages(STREAM_AUDIO)
+
+    @property
+    def subtitle_languages(self) -> list[str]:
+        return self.languages(STREAM_SUBTITLE)
+
+
+def _build_session() -> requests.Session:
+    """Create a keep-alive session that retries idempotent requests on transient errors."""
+    session = requests.Session()
+    retry = Retry(
+        total=PLEX_RETRIES,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=("GET",),
+    )
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=4, pool_maxsize=16)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+_session = _build_session()
+_cache_lock = threading.Lock()
+_cache: OrderedDict[int, tuple[float, PlexMetadata]] = OrderedDict()
+
+
+def plex_get(path: str, params: dict | None = None) -> ET.Element:
+    """GET a Plex API path and return the parsed XML root."""
+    response = _session.get(
+        f"{PLEX_URL}{path}",
+        params={**(params or {}), "X-Plex-Token": PLEX_TOKEN},
+        timeout=PLEX_TIMEOUT,
+    )
+    response.raise_for_status()
+    return ET.fromstring(response.text)
+
+
+def _int_attr(elem: ET.Element, name: str) -> int | None:
+    value = elem.attrib.get(name)
+    try:
+        return int(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _parse_metadata(rating_key: int, root: ET.Element) -> PlexMetadata:
+    # Look for Video element (movies, episodes) or Directory
+    item = None
+    for tag in ("Video", "Directory"):
+        item = root.find(f".//{tag}")
+        if item is not None:
+            break
+    parts = []
+    for part in root.iter("Part"):
+        if "file" not in part.attrib:
+            continue
+        streams = tuple(
+            PlexStream(
+                id=_int_attr(stream, "id"),
+                stream_type=_int_attr(stream, "streamType") or 0,
+                index=_int_attr(stream, "index"),
+                codec=stream.attrib.get("codec"),
+                language_code=stream.attrib.get("languageCode"),
+                language_tag=stream.attrib.get("languageTag"),
+                forced=stream.attrib.get("forced") == "1",
+                key=stream.attrib.get("key"),
+            )
+            for stream in part.iter("Stream")
+        )
+        parts.append(PlexPart(part.attrib["file"], _int_attr(part, "duration"), streams))
+    return PlexMetadata(
+        rating_key=rating_key,
+        title=item.attrib.get("title") if item is not None else None,
+        type=item.attrib.get("type") if item is not None else None,
+        duration=_int_attr(item, "duration") if item is not None else None,
+        parts=tuple(parts),
+    )
+
+
+def get_plex_metadata(rating_key: int) -> PlexMetadata | None:
+    """
+    Retrieve the metadata for a given Plex rating_key with a single request.
+    Results are cached for PLEX_CACHE_TTL seconds (up to PLEX_CACHE_SIZE items).
+    """
+    now = time.monotonic()
+    with _cache_lock:
+        cached = _cache.get(rating_key)
+        if cached is not None and cached[0] > now:
+            _cache.move_to_end(rating_key)
+            return cached[1]
     try:
-        url = f"{PLEX_URL}/library/metadata/{rating_key}?X-Plex-Token={PLEX_TOKEN}"
-        response = requests.get(url)
-        response.raise_for_status()
-
-        root = ET.fromstring(response.text)
-        part_element = root.find(".//Part")
-        if part_element is not None:
-            return part_element.attrib.get("file")
+        metadata = _parse_metadata(rating_key, plex_get(f"/library/metadata/{rating_key}"))
     except Exception as e:
-        print(f"Error getting Plex metadata: {e}")
-    return None
- 
+        print(f"Error getting Plex metadata: {e}", flush=True)
+        return None
+    if PLEX_CACHE_TTL > 0:
+        with _cache_lock:
+            _cache[rating_key] = (now + PLEX_CACHE_TTL, metadata)
+            _cache.move_to_end(rating_key)
+            while len(_cache) > PLEX_CACHE_SIZE:
+                _cache.popitem(last=False)
+    return metadata
+
+
+def clear_plex_cache() -> None:
+    """Forget all cached metadata."""
+    with _cache_lock:
+        _cache.clear()
+
+
+def get_plex_file_path(rating_key: int) -> str | None:
+    """Retrieve the file path for a given Plex metadata rating_key."""
+    metadata = get_plex_metadata(rating_key)
+    if metadata is None or not metadata.parts:
+        return None
+    return metadata.parts[0].file
+
+
 def get_plex_media_title(rating_key: int) -> str | None:
     """Retrieve the media title for a given Plex metadata rating_key."""
-    try:
-        url = f"{PLEX_URL}/library/metadata/{rating_key}?X-Plex-Token={PLEX_TOKEN}"
-        response = requests.get(url)
-        response.raise_for_status()
-        root = ET.fromstring(response.text)
-        # Look for Video element (movies, episodes) or Directory
-        for tag in ("Video", "Directory"):
-            elem = root.find(f".//{tag}")
-            if elem is not None and "title" in elem.attrib:
-                return elem.attrib.get("title")
-    except Exception as e:
-        print(f"Error getting Plex media title: {e}")
-    return None
\ No newline at end of file
+    metadata = get_plex_metadata(rating_key)
+    return metadata.title if metadata is not None else None
+
+
+def iter_plex_items(path: str, params: dict | None = None, page_size: int | None = None) -> Iterator[ET.Element]:
+    """
+    Yield the Video and Directory children of a Plex listing, fetching it in
+    pages of page_size items so only one page is held in memory at a time.
+    """
+    page_size = page_size or PLEX_PAGE_SIZE
+    start = 0
+    while True:
+        root = plex_get(path, {
+            **(params or {}),
+            "X-Plex-Container-Start": start,
+            "X-Plex-Container-Size": page_size,
+        })
+        items = [elem for elem in root if elem.tag in ("Video", "Directory")]
+        yield from items
+        start += len(items)
+        total = _int_attr(root, "totalSize")
+        if len(items) < page_size or (total is not None and start >= total):
+            return
+
+
+def iter_leaves(rating_key: int) -> Iterator[ET.Element]:
+    """Yield the Video elements of all episodes of a show or season."""
+    yield from iter_plex_items(f"/library/metadata/{rating_key}/allLeaves")
+
+
+def iter_leaf_rating_keys(rating_key: int) -> Iterator[int]:
+    """Yield the rating keys of all episodes of a show or season."""
+    for elem in iter_leaves(rating_key):
+        key = _int_attr(elem, "ratingKey")
+        if key is not None:
+            yield key
+
+
+def iter_section_leaves(section_id: int) -> Iterator[ET.Element]:
+    """Yield the Video elements of all movies and episodes in a library section."""
+    for elem in iter_plex_items(f"/library/sections/{section_id}/all"):
+        item_type = elem.attrib.get("type")
+        if item_type in LEAF_TYPES:
+            yield elem
+        elif item_type in CONTAINER_TYPES:
+            key = _int_attr(elem, "ratingKey")
+            if key is not None:
+                yield from iter_leaves(key)
+
+
+def iter_section_rating_keys(section_id: int) -> Iterator[int]:
+    """Yield the rating keys of all movies and episodes in a library section."""
+    for elem in iter_section_leaves(section_id):
+        key = _int_attr(elem, "ratingKey")
+        if key is not None:
+            yield key
+
+
+def iter_section_files(section_id: int) -> Iterator[tuple[int, str]]:
+    """Yield (rating key, file path as reported by Plex) for every media part in a library section."""
+    for elem in iter_section_leaves(section_id):
+        key = _int_attr(elem, "ratingKey")
+        if key is None:
+            continue
+        for part in elem.iter("Part"):
+            if "file" in part.attrib:
+                yield key, part.attrib["file"]
+
+
+def get_library_sections() -> list[tuple[int, str]]:
+    """Return the (section ID, type) of every library section."""
+    sections = []
+    for elem in plex_get("/library/sections").iter("Directory"):
+        section_id = _int_attr(elem, "key")
+        if section_id is not None:
+            sections.append((section_id, elem.attrib.get("type", "")))
+    return sections
+
+
+def get_transcode_count() -> int:
+    """Return the number of Plex playback sessions currently being transcoded."""
+    return sum(1 for _ in plex_get("/status/sessions").iter("TranscodeSession"))
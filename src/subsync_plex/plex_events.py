@@ -0,0 +1,108 @@
+"""
+Ingestion of Plex webhook events and resolution of local files to Plex items.
+"""
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+
+from .config import (
+    PLEX_LIBRARY_DIR, PLEX_WEBHOOK_EVENTS, PLEX_WEBHOOK_SECTIONS, PLEX_WEBHOOK_TYPES, PATH_INDEX_REFRESH,
+)
+from .plex_api import get_library_sections, iter_section_files
+from .subsync_service import map_plex_path
+
+# Library section types holding movies or TV shows
+_VIDEO_SECTION_TYPES = ("movie", "show")
+
+
+@dataclass(frozen=True)
+class PlexEvent:
+    """The parts of a Plex webhook payload needed to decide whether to sync."""
+    event: str
+    rating_key: int | None
+    type: str | None
+    section_id: int | None
+
+
+def parse_webhook(payload: str) -> PlexEvent:
+    """Parse the JSON `payload` field of a Plex multipart webhook; raises ValueError if malformed."""
+    data = json.loads(payload)
+    if not isinstance(data, dict):
+        raise ValueError("Webhook payload is not a JSON object")
+    metadata = data.get("Metadata") or {}
+
+    def as_int(value):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+
+    return PlexEvent(
+        event=data.get("event") or "",
+        rating_key=as_int(metadata.get("ratingKey")),
+        type=metadata.get("type"),
+        section_id=as_int(metadata.get("librarySectionID")),
+    )
+
+
+def ignore_reason(event: PlexEvent) -> str | None:
+    """Return why the event should not trigger a sync, or None if it should."""
+    if event.event not in PLEX_WEBHOOK_EVENTS:
+        return f"event {event.event!r} not handled"
+    if event.rating_key is None:
+        return "no rating key"
+    if event.type not in PLEX_WEBHOOK_TYPES:
+        return f"media type {event.type!r} not handled"
+    if PLEX_WEBHOOK_SECTIONS and event.section_id not in PLEX_WEBHOOK_SECTIONS:
+        return f"library section {event.section_id} not handled"
+    return None
+
+
+class PathIndex:
+    """
+    Maps video files under PLEX_LIBRARY_DIR to Plex rating keys. The index is
+    built from the library section listings and rebuilt on a miss, at most
+    once every `refresh` seconds, so a new file is found once Plex has
+    scanned it without listing the library for every lookup.
+    """
+
+    def __init__(self, refresh: float = PATH_INDEX_REFRESH):
+        self.refresh = refresh
+        self._lock = threading.Lock()
+        self._keys: dict[str, int] = {}
+        self._built_at: float | None = None
+
+    def _rebuild(self) -> None:
+        keys = {}
+        for section_id, section_type in get_library_sections():
+            if section_type not in _VIDEO_SECTION_TYPES:
+                continue
+            if PLEX_WEBHOOK_SECTIONS and section_id not in PLEX_WEBHOOK_SECTIONS:
+                continue
+            for rating_key, file in iter_section_files(section_id):
+                keys[map_plex_path(file)] = rating_key
+        self._keys = keys
+        print(f"Indexed {len(keys)} Plex media file(s).", flush=True)
+
+    def lookup(self, video_path: str) -> int | None:
+        """Return the rating key of a video file, given its path inside PLEX_LIBRARY_DIR."""
+        rel_path = os.path.relpath(video_path, PLEX_LIBRARY_DIR).replace(os.sep, "/")
+        with self._lock:
+            key = self._keys.get(rel_path)
+            if key is not None:
+                return key
+            now = time.monotonic()
+            if self._built_at is not None and now - self._built_at < self.refresh:
+                return None
+            self._built_at = now
+            try:
+                self._rebuild()
+            except Exception as e:
+                print(f"Error indexing Plex library paths: {e}", flush=True)
+                return None
+            return self._keys.get(rel_path)
+
+
+path_index = PathIndex()
@@ -0,0 +1,159 @@
+"""
+Keeping syncs from competing with Plex for CPU and disk.
+
+Processes started by a sync run with the configured niceness, I/O class and
+CPU affinity; the number of jobs reading from one mount at a time is capped;
+and, optionally, jobs are held back while Plex is transcoding. Held jobs are
+not blocked in a worker: they raise JobDeferred and go back to the queue.
+"""
+import functools
+import os
+import shutil
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+
+from .config import (
+    PLEX_LIBRARY_DIR, SYNC_NICE, SYNC_IONICE, SYNC_CPUS, SYNC_MOUNT_CONCURRENCY, PAUSE_WHILE_TRANSCODING,
+    TRANSCODE_CHECK_INTERVAL,
+)
+from .jobs import JobDeferred
+from .metrics import REASON_MOUNT_BUSY, REASON_PLEX_TRANSCODING
+from .plex_api import get_transcode_count
+
+# ionice scheduling classes by name
+IONICE_CLASSES = {"realtime": "1", "best-effort": "2", "idle": "3"}
+# Seconds a job waits for a busy mount before trying again
+MOUNT_RETRY_SECONDS = 5.0
+
+
+def parse_cpus(spec: str) -> set[int]:
+    """Parse a CPU list in taskset syntax ('0-3,6') into a set of CPU numbers."""
+    cpus = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        cpus.update(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def parse_ionice(spec: str) -> tuple[str, str | None] | None:
+    """Parse 'idle' or 'best-effort:4' into an ionice (class, level), or None when unset."""
+    if not spec:
+        return None
+    name, _, level = spec.partition(":")
+    io_class = IONICE_CLASSES.get(name.strip(), name.strip())
+    if io_class not in IONICE_CLASSES.values():
+        print(f"Ignoring unknown SYNC_IONICE class '{name}'.", flush=True)
+        return None
+    return io_class, level.strip() or None
+
+
+@functools.cache
+def _available(tool: str) -> bool:
+    if shutil.which(tool):
+        return True
+    print(f"'{tool}' is not installed; its process priority setting is ignored.", flush=True)
+    return False
+
+
+def priority_prefix() -> list[str]:
+    """Return the command prefix (nice, ionice, taskset) applying the configured priority to a process."""
+    prefix = []
+    if SYNC_NICE and _available("nice"):
+        prefix += ["nice", "-n", str(SYNC_NICE)]
+    ionice = parse_ionice(SYNC_IONICE)
+    if ionice and _available("ionice"):
+        io_class, level = ionice
+        prefix += ["ionice", "-c", io_class] + (["-n", level] if level else [])
+    if SYNC_CPUS and _available("taskset"):
+        prefix += ["taskset", "-c", SYNC_CPUS]
+    return prefix
+
+
+def apply_priority() -> None:
+    """Apply the configured priority to the current process, e.g. a long-lived subsync worker."""
+    try:
+        if SYNC_NICE:
+            os.nice(SYNC_NICE)
+        if SYNC_CPUS:
+            os.sched_setaffinity(0, parse_cpus(SYNC_CPUS))
+        ionice = parse_ionice(SYNC_IONICE)
+        if ionice and _available("ionice"):
+            io_class, level = ionice
+            subprocess.run(
+                ["ionice", "-c", io_class] + (["-n", level] if level else []) + ["-p", str(os.getpid())],
+                check=True,
+                capture_output=True,
+            )
+    except (OSError, ValueError, subprocess.SubprocessError) as e:
+        print(f"Could not apply process priority: {e}", flush=True)
+
+
+@functools.lru_cache(maxsize=256)
+def mount_key(top: str) -> str:
+    """Identify the filesystem a top-level library folder is on; folders on one mount share a key."""
+    try:
+        return f"dev:{os.stat(os.path.join(PLEX_LIBRARY_DIR, top)).st_dev}"
+    except OSError:
+        return top
+
+
+class MountLimiter:
+    """Counts running jobs per mount and defers jobs for mounts at their limit."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._running: dict[str, int] = {}
+
+    @contextmanager
+    def slot(self, video_file: str):
+        """Hold a slot of the mount the video (relative to PLEX_LIBRARY_DIR) is on; raises JobDeferred when none is free."""
+        if self.limit <= 0:
+            yield
+            return
+        key = mount_key(video_file.strip("/").split("/", 1)[0])
+        with self._lock:
+            if self._running.get(key, 0) >= self.limit:
+                raise JobDeferred(REASON_MOUNT_BUSY, MOUNT_RETRY_SECONDS)
+            self._running[key] = self._running.get(key, 0) + 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._running[key] -= 1
+                if not self._running[key]:
+                    del self._running[key]
+
+
+mount_limiter = MountLimiter(SYNC_MOUNT_CONCURRENCY)
+
+_transcode_lock = threading.Lock()
+_transcode_checked = float("-inf")
+_transcoding = False
+
+
+def plex_transcoding() -> bool:
+    """Return whether Plex is transcoding, checking at most every TRANSCODE_CHECK_INTERVAL seconds."""
+    global _transcode_checked, _transcoding
+    with _transcode_lock:
+        now = time.monotonic()
+        if now - _transcode_checked >= TRANSCODE_CHECK_INTERVAL:
+            try:
+                _transcoding = get_transcode_count() > 0
+            except Exception as e:
+                # Syncs are not held back when Plex cannot be asked
+                print(f"Could not check Plex sessions: {e}", flush=True)
+                _transcoding = False
+            _transcode_checked = now
+        return _transcoding
+
+
+def pause_while_transcoding() -> None:
+    """Raise JobDeferred when PAUSE_WHILE_TRANSCODING is set and Plex is transcoding."""
+    if PAUSE_WHILE_TRANSCODING and plex_transcoding():
+        raise JobDeferred(REASON_PLEX_TRANSCODING, TRANSCODE_CHECK_INTERVAL)
@@ -1,26 +1,57 @@
 """
 Core subtitle synchronization workflow.
 """
-import subprocess
+import functools
 import os
+import time
 
-from .plex_api import get_plex_file_path, get_plex_media_title
-from .subtitle_finder import find_matching_srt
+from .plex_api import get_plex_metadata
+from .subtitle_finder import best_match, rank_candidates, subtitle_candidates, subtitle_languages
 from .notifier import send_home_assistant_notification
+from .sync_cache import file_hash, is_already_synced, record_sync
+from .audio_cache import reference_audio, select_audio_stream
+from .sync_engine import SyncPolicy, sync_with_policy
+from .subtitle_backup import backup, record_version, release
+from .subtitle_align import align_subtitle, embedded_text_streams, extract_embedded, read_srt
+from .scheduling import mount_limiter, pause_while_transcoding
+from .metrics import (
+    PLEX_LOOKUP_SECONDS, SUBTITLE_SEARCH_SECONDS, AUDIO_EXTRACT_SECONDS, SUBTITLE_ALIGN_SECONDS,
+    REASON_PLEX_LOOKUP_FAILED,
+    REASON_NO_SUBTITLE, REASON_SUBSYNC_FAILED, REASON_SUBSYNC_TIMEOUT, current_job, set_reason, timed, when_final,
+)
 from .config import *
 
-def process_subsync(data) -> None:
+def requested_languages(sub_lang) -> list[str] | None:
     """
-    Retrieve video file path from Plex, find matching subtitle, and run subsync.
+    Normalize the requested subtitle language(s) to a list of ISO-639-1 codes.
+    Returns None for SUB_LANG_ALL, meaning every language found next to the video.
     """
-    # determine language codes (request overrides environment variable, fallback to 'en')
-    audio_lang = data.audio_lang or DEFAULT_AUDIO_LANG
-    sub_lang = data.sub_lang or DEFAULT_SUB_LANG
-    # Retrieve raw file path from Plex API
-    video_file_raw = get_plex_file_path(data.media_id)
-    if not video_file_raw:
-        print("Error: Unable to fetch file path from Plex.", flush=True)
-        return
+    if not sub_lang:
+        return [DEFAULT_SUB_LANG]
+    if isinstance(sub_lang, str):
+        sub_lang = [sub_lang]
+    languages = []
+    for lang in sub_lang:
+        lang = lang.strip().lower()
+        if lang == SUB_LANG_ALL:
+            return None
+        if lang and lang not in languages:
+            languages.append(lang)
+    return languages or [DEFAULT_SUB_LANG]
+
+def sync_job_key(data) -> tuple:
+    """Return the key identifying duplicate sync requests."""
+    languages = requested_languages(data.sub_lang)
+    if languages is None:
+        sub_key = SUB_LANG_ALL
+    elif len(languages) == 1:
+        sub_key = languages[0]
+    else:
+        sub_key = tuple(sorted(languages))
+    return (data.media_id, data.audio_lang or DEFAULT_AUDIO_LANG, sub_key)
+
+def map_plex_path(video_file_raw: str) -> str:
+    """Map a file path returned by the Plex API to a path relative to PLEX_LIBRARY_DIR."""
     # Map Plex API path to container path by stripping source prefix and joining with local mount
     # Normalize separators to '/'
     video_path_normalized = video_file_raw.replace("\\", "/")
@@ -28,72 +59,182 @@ def process_subsync(data) -> None:
         # Normalize prefix
         prefix_norm = PLEX_API_PATH_PREFIX.replace("\\", "/").rstrip("/") + "/"
         if video_path_normalized.startswith(prefix_norm):
-            relative_path = video_path_normalized[len(prefix_norm):]
-        else:
-            relative_path = video_path_normalized.lstrip("/")
-    else:
-        relative_path = video_path_normalized.lstrip("/")
-    # Use relative_path for local operations
-    video_file = relative_path
-    # Retrieve media title for notifications
-    title = get_plex_media_title(data.media_id)
-    if not title:
-        title = os.path.splitext(os.path.basename(video_file))[0]
-    srt_file = find_matching_srt(video_file, sub_lang)
-    if not srt_file:
-        # notify failure with reason when subtitle is missing
-        reason = "No matching SRT file found"
-        print(f"Error: {reason}.", flush=True)
+            return video_path_normalized[len(prefix_norm):]
+    return video_path_normalized.lstrip("/")
+
+def _notify(data, stage: str, message: str, sub_lang: str) -> None:
+    def send():
         send_home_assistant_notification(
-            STAGE_SYNC_FAILED,
-            FAILURE_MESSAGE_TEMPLATE.format(title, reason),
+            stage,
+            message,
             data.media_id,
             data.entity_id,
+            sub_lang=sub_lang,
+            batch_id=getattr(data, "batch_id", None),
         )
+
+    job = current_job()
+    if stage == STAGE_SYNC_FAILED:
+        # A failure is only reported once the job will not be retried
+        when_final(send)
+    elif stage == STAGE_SYNC_SKIPPED and job is not None and job.attempt:
+        # On a retry, subtitles skipped as synced were reported by an earlier attempt
         return
+    else:
+        send()
+
+def _overall_result(results: list[str]) -> str:
+    if not results or RESULT_FAILED in results:
+        return RESULT_FAILED
+    if RESULT_SYNCED in results:
+        return RESULT_SYNCED
+    return RESULT_ALREADY_SYNCED
+
+def process_subsync(data) -> str:
+    """
+    Retrieve video file path from Plex, find the matching subtitle for each
+    requested language, and sync it: against an embedded text track or an
+    already synced subtitle of the video when one aligns well, otherwise
+    against the audio with subsync. Plex metadata, the directory listing,
+    embedded tracks and the reference audio are resolved at most once and
+    shared by all languages; each language is reported through its own
+    notifications.
+    Returns RESULT_SYNCED if any subtitle was synced and none failed,
+    RESULT_ALREADY_SYNCED when every subtitle was already synced against the
+    unchanged video, or RESULT_FAILED otherwise. Raises JobDeferred while
+    Plex is transcoding or the video's mount is running its limit of jobs.
+    """
+    # Hold the job back while Plex needs the machine for playback
+    pause_while_transcoding()
+    # determine language codes (request overrides environment variable, fallback to 'en')
+    audio_lang = data.audio_lang or DEFAULT_AUDIO_LANG
+    languages = requested_languages(data.sub_lang)
+    # Retrieve file path and title from Plex API in a single request
+    with timed("plex_lookup", PLEX_LOOKUP_SECONDS):
+        metadata = get_plex_metadata(data.media_id)
+    if metadata is None or not metadata.parts:
+        print("Error: Unable to fetch file path from Plex.", flush=True)
+        set_reason(REASON_PLEX_LOOKUP_FAILED)
+        return RESULT_FAILED
+    # Use relative path for local operations
+    video_file = map_plex_path(metadata.parts[0].file)
+    # Use media title for notifications
+    title = metadata.title
+    if not title:
+        title = os.path.splitext(os.path.basename(video_file))[0]
+    # Defers the job while the mount holding the video is busy with other jobs
+    with mount_limiter.slot(video_file):
+        return _sync_video(data, metadata, video_file, title, audio_lang, languages)
+
+def _sync_video(data, metadata, video_file: str, title: str, audio_lang: str, languages: list[str] | None) -> str:
+    """Find and sync the subtitle of each requested language of a video; see process_subsync."""
+    # List the video's subtitles once for every language and alignment reference
+    print(f"Searching for subtitles next to {video_file}", flush=True)
+    with timed("subtitle_search", SUBTITLE_SEARCH_SECONDS):
+        candidates = subtitle_candidates(video_file)
+    if languages is None:
+        languages = subtitle_languages(candidates)
+        if not languages:
+            reason = "No language-tagged SRT files found"
+            set_reason(REASON_NO_SUBTITLE)
+            print(f"Error: {reason}.", flush=True)
+            _notify(data, STAGE_SYNC_FAILED, FAILURE_MESSAGE_TEMPLATE.format(title, reason), SUB_LANG_ALL)
+            return RESULT_FAILED
+        print(f"Syncing subtitle languages: {languages}", flush=True)
 
     ref_file = os.path.join(PLEX_LIBRARY_DIR, video_file)
     print(f"Reference video: {ref_file}", flush=True)
-    print(f"Subtitle file: {srt_file}", flush=True)
-    send_home_assistant_notification(
-        STAGE_SYNC_START,
-        START_MESSAGE_TEMPLATE.format(title),
-        data.media_id,
-        data.entity_id
-    )
-
-    try:
-        result = subprocess.run(
-            [
-                "subsync",
-                "--cli",
-                "sync",
-                "--ref", ref_file,
-                "--ref-lang", audio_lang,
-                "--sub", srt_file,
-                "--sub-lang", sub_lang,
-                "--out", srt_file,
-                "--overwrite",
-                "--effort", "1"
-            ],
-            check=True,
-            capture_output=False,
-            text=True
-        )
-        print(f"SubSync output: {result.stdout}", flush=True)
-        send_home_assistant_notification(
-            STAGE_SYNC_FINISHED,
-            NOTIFICATION_MESSAGE_TEMPLATE.format(title),
-            data.media_id,
-            data.entity_id
-        )
-    except subprocess.CalledProcessError as e:
-        # include subprocess error details in notification
-        reason = e.stderr or str(e)
-        print(f"SubSync error: {reason}", flush=True)
-        send_home_assistant_notification(
-            STAGE_SYNC_FAILED,
-            FAILURE_MESSAGE_TEMPLATE.format(title, reason),
-            data.media_id,
-            data.entity_id
-        )
\ No newline at end of file
+    results = []
+    pending = []
+    for sub_lang in languages:
+        label = f"{title} [{sub_lang}]" if len(languages) > 1 else title
+        srt_file = best_match(candidates, sub_lang)
+        if not srt_file:
+            # notify failure with reason when subtitle is missing
+            reason = "No matching SRT file found"
+            set_reason(REASON_NO_SUBTITLE)
+            print(f"Error: {reason} for '{sub_lang}'.", flush=True)
+            _notify(data, STAGE_SYNC_FAILED, FAILURE_MESSAGE_TEMPLATE.format(label, reason), sub_lang)
+            results.append(RESULT_FAILED)
+            continue
+        print(f"Subtitle file: {srt_file}", flush=True)
+        if is_already_synced(ref_file, srt_file, audio_lang, sub_lang):
+            print(f"Subtitle {srt_file} already synced against this video; skipping.", flush=True)
+            _notify(data, STAGE_SYNC_SKIPPED, SKIPPED_MESSAGE_TEMPLATE.format(label), sub_lang)
+            results.append(RESULT_ALREADY_SYNCED)
+            continue
+        pending.append((sub_lang, srt_file, label))
+
+    if pending:
+        # Decode the video's audio, and its embedded subtitle tracks, at most once
+        # and only when a subtitle needs them
+        @functools.cache
+        def ref_audio() -> str:
+            with timed("audio_extract", AUDIO_EXTRACT_SECONDS):
+                return reference_audio(ref_file, select_audio_stream(metadata, audio_lang)) or ref_file
+
+        @functools.cache
+        def embedded() -> list:
+            tracks = extract_embedded(ref_file, embedded_text_streams(metadata))
+            return [(f"embedded track {index}", track) for index, track in tracks.items()]
+
+        align = getattr(data, "align", None)
+        for sub_lang, srt_file, label in pending:
+            references = None
+            if SUBTITLE_ALIGN if align is None else align:
+                references = lambda: embedded() + _synced_sidecars(ref_file, candidates, audio_lang, srt_file)
+            results.append(
+                _sync_subtitle(data, ref_file, ref_audio, srt_file, audio_lang, sub_lang, label, references)
+            )
+    return _overall_result(results)
+
+def _synced_sidecars(ref_file: str, candidates: list, audio_lang: str, srt_file: str) -> list:
+    """Return the other subtitles of the video that are synced against it, as alignment references."""
+    references = []
+    for lang in subtitle_languages(candidates):
+        path = rank_candidates(candidates, lang)[0].path
+        if path == srt_file or not is_already_synced(ref_file, path, audio_lang, lang):
+            continue
+        subtitle = read_srt(path)
+        if subtitle is not None:
+            references.append((os.path.basename(path), subtitle))
+    return references
+
+def _sync_subtitle(data, ref_file: str, ref_audio, srt_file: str, audio_lang: str, sub_lang: str,
+                   label: str, references=None) -> str:
+    """
+    Sync a single subtitle file and report the outcome. references, when
+    given, returns the subtitles to try aligning against first; ref_audio
+    returns the reference for subsync.
+    """
+    input_hash = file_hash(srt_file)
+    # Keep the original so the sync can be reverted
+    backup(srt_file, input_hash)
+    _notify(data, STAGE_SYNC_START, START_MESSAGE_TEMPLATE.format(label), sub_lang)
+
+    alignment = None
+    if references is not None:
+        with timed("subtitle_align", SUBTITLE_ALIGN_SECONDS):
+            candidates = references()
+            alignment = align_subtitle(candidates, srt_file, srt_file) if candidates else None
+    if alignment is not None:
+        print(f"Aligned {srt_file} to {alignment.reference} (offset {alignment.offset:+.2f}s, "
+              f"scale {alignment.scale:.5f}, score {alignment.score:.3f}).", flush=True)
+        synced = True
+    else:
+        attempt = sync_with_policy(ref_audio(), audio_lang, srt_file, sub_lang, srt_file,
+                                   SyncPolicy.from_request(data))
+        synced = attempt.out_file is not None
+    if synced:
+        record_sync(ref_file, srt_file, audio_lang, sub_lang, input_hash, time.time())
+        record_version(data.media_id, srt_file, sub_lang, input_hash)
+        _notify(data, STAGE_SYNC_FINISHED, NOTIFICATION_MESSAGE_TEMPLATE.format(label), sub_lang)
+        return RESULT_SYNCED
+    # include subprocess error details in notification
+    reason = attempt.reason
+    print(f"SubSync error: {reason}", flush=True)
+    if input_hash:
+        release(input_hash)
+    set_reason(REASON_SUBSYNC_TIMEOUT if attempt.timed_out else REASON_SUBSYNC_FAILED)
+    _notify(data, STAGE_SYNC_FAILED, FAILURE_MESSAGE_TEMPLATE.format(label, reason), sub_lang)
+    return RESULT_FAILED
@@ -0,0 +1,236 @@
+"""
+Fast alignment of a subtitle against a correctly timed reference subtitle.
+
+When the video has an embedded text subtitle track, or another subtitle next
+to it has already been synced, the cue timings of that reference are enough
+to sync the target: both are rasterized into "speech present" signals, and
+the offset (and, for frame rate conversions, the speed factor) maximizing
+their FFT cross-correlation is applied to the target's cues. This takes well
+under a second, against minutes for speech recognition; when the correlation
+of the best alignment is too low the caller falls back to audio sync.
+"""
+import os
+import re
+import subprocess
+import tempfile
+from dataclasses import dataclass
+
+import numpy as np
+
+from .config import SUBTITLE_ALIGN_MIN_SCORE, SUBTITLE_ALIGN_MAX_OFFSET, AUDIO_EXTRACT_TIMEOUT
+from .plex_api import PlexMetadata, STREAM_SUBTITLE
+from .scheduling import priority_prefix
+
+# Seconds per sample of the rasterized cue signals
+RESOLUTION = 0.02
+# Speed factors tried: unchanged, and 23.976 <-> 25 fps conversions
+SCALES = (1.0, 25 / 23.976, 23.976 / 25)
+# Embedded subtitle codecs ffmpeg can convert to SRT
+TEXT_SUBTITLE_CODECS = ("srt", "subrip", "ass", "ssa", "mov_text", "tx3g", "webvtt", "vtt", "text")
+
+_TIME_RE = re.compile(
+    r"(\d+):(\d{1,2}):(\d{1,2})[,.](\d{1,3})\s*-->\s*(\d+):(\d{1,2}):(\d{1,2})[,.](\d{1,3})(.*)"
+)
+
+
+@dataclass
+class Subtitle:
+    """Cues of an SRT file: start and end times in seconds, and the text lines of each cue."""
+    starts: np.ndarray
+    ends: np.ndarray
+    texts: list[str]
+    encoding: str = "utf-8"
+
+
+@dataclass
+class Alignment:
+    """Best mapping t -> t * scale + offset of the target onto a reference, and its correlation score (0-1)."""
+    reference: str
+    offset: float
+    scale: float
+    score: float
+
+
+def _seconds(h: str, m: str, s: str, ms: str) -> float:
+    return int(h) * 3600 + int(m) * 60 + int(s) + int(ms.ljust(3, "0")) / 1000
+
+
+def parse_srt(text: str, encoding: str = "utf-8") -> Subtitle:
+    """Parse SRT text; blocks without a valid timing line are skipped."""
+    starts, ends, texts = [], [], []
+    for block in re.split(r"\r?\n\s*\r?\n", text.strip()):
+        lines = block.splitlines()
+        for i, line in enumerate(lines[:2]):
+            match = _TIME_RE.match(line.strip())
+            if match:
+                g = match.groups()
+                starts.append(_seconds(*g[0:4]))
+                ends.append(_seconds(*g[4:8]))
+                texts.append("\n".join(lines[i + 1:]))
+                break
+    return Subtitle(np.array(starts, dtype=float), np.array(ends, dtype=float), texts, encoding)
+
+
+def read_srt(path: str) -> Subtitle | None:
+    """Read an SRT file, or return None if it cannot be read or has no cues."""
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    # The result is written back in the encoding (and with the BOM) of the original
+    utf8 = "utf-8-sig" if data.startswith(b"\xef\xbb\xbf") else "utf-8"
+    for encoding in (utf8, "cp1252", "latin-1"):
+        try:
+            subtitle = parse_srt(data.decode(encoding), encoding)
+            break
+        except UnicodeDecodeError:
+            continue
+    return subtitle if len(subtitle.starts) else None
+
+
+def _timestamp(seconds: float) -> str:
+    ms = int(round(max(0.0, seconds) * 1000))
+    return f"{ms // 3600000:02d}:{ms // 60000 % 60:02d}:{ms // 1000 % 60:02d},{ms % 1000:03d}"
+
+
+def format_srt(subtitle: Subtitle) -> str:
+    blocks = [
+        f"{i}\n{_timestamp(start)} --> {_timestamp(end)}\n{text}"
+        for i, (start, end, text) in enumerate(zip(subtitle.starts, subtitle.ends, subtitle.texts), 1)
+    ]
+    return "\n\n".join(blocks) + "\n"
+
+
+def _signal(starts: np.ndarray, ends: np.ndarray, length: int) -> np.ndarray:
+    """Rasterize cues into a 0/1 signal of `length` samples."""
+    edges = np.zeros(length + 1)
+    first = np.clip((starts / RESOLUTION).astype(int), 0, length)
+    last = np.clip((ends / RESOLUTION).astype(int), 0, length)
+    np.add.at(edges, first, 1)
+    np.add.at(edges, last, -1)
+    return (np.cumsum(edges[:-1]) > 0).astype(float)
+
+
+def _centered(signal: np.ndarray) -> np.ndarray:
+    """
+    Subtract the mean over the span from the first to the last cue, and zero
+    the signal outside it, so correlations measure how gaps line up rather
+    than where the subtitle starts and ends.
+    """
+    active = np.flatnonzero(signal)
+    centered = np.zeros_like(signal)
+    if len(active):
+        span = slice(active[0], active[-1] + 1)
+        centered[span] = signal[span] - signal[span].mean()
+    return centered
+
+
+def best_alignment(reference: Subtitle, target: Subtitle, max_offset: float = SUBTITLE_ALIGN_MAX_OFFSET,
+                   scales=SCALES) -> tuple[float, float, float]:
+    """
+    Return (offset, scale, score) maximizing the overlap of the target's cues
+    with the reference's; the score is their correlation (1 for identical timing).
+    """
+    max_lag = int(max_offset / RESOLUTION)
+    span = max(reference.ends.max(), target.ends.max() * max(scales))
+    length = int(span / RESOLUTION) + 1
+    size = 1 << int(np.ceil(np.log2(length + max_lag + 1)))
+    # Centered signals correlate to their covariance: the overlap expected by
+    # chance is removed, so dense unrelated subtitles score near 0 rather than
+    # near the reference's speech density
+    ref_signal = _centered(_signal(reference.starts, reference.ends, length))
+    ref_spectrum = np.fft.rfft(ref_signal, size)
+    ref_norm = np.sqrt(np.dot(ref_signal, ref_signal))
+    best = (0.0, 1.0, 0.0)
+    for scale in scales:
+        target_signal = _centered(_signal(target.starts * scale, target.ends * scale, length))
+        norm = ref_norm * np.sqrt(np.dot(target_signal, target_signal))
+        if norm == 0:
+            continue
+        # correlation[k] = sum_t ref[t] * target[t - k]: the covariance when the target is delayed by k samples
+        correlation = np.fft.irfft(ref_spectrum * np.conj(np.fft.rfft(target_signal, size)), size)
+        lags = np.concatenate((correlation[:max_lag + 1], correlation[size - max_lag:]))
+        index = int(np.argmax(lags))
+        lag = index if index <= max_lag else index - len(lags)
+        score = lags[index] / norm
+        if score > best[2]:
+            best = (lag * RESOLUTION, scale, float(score))
+    return best
+
+
+def align_subtitle(references: list[tuple[str, Subtitle]], srt_file: str, out_file: str,
+                   min_score: float = SUBTITLE_ALIGN_MIN_SCORE) -> Alignment | None:
+    """
+    Align srt_file to the best matching reference and write the result to
+    out_file. Returns None, leaving the files untouched, when no reference
+    aligns with a score of at least min_score.
+    """
+    # Other formats (ASS, WebVTT) would lose their styling when rewritten as SRT
+    target = read_srt(srt_file) if srt_file.lower().endswith(".srt") else None
+    if target is None:
+        return None
+    best = None
+    for name, reference in references:
+        offset, scale, score = best_alignment(reference, target)
+        print(f"Alignment against {name}: offset={offset:+.2f}s, scale={scale:.5f}, score={score:.3f}", flush=True)
+        if best is None or score > best.score:
+            best = Alignment(name, offset, scale, score)
+    if best is None or best.score < min_score:
+        return None
+    starts = target.starts * best.scale + best.offset
+    ends = target.ends * best.scale + best.offset
+    # Cues shifted entirely before the start of the video are dropped
+    keep = ends > 0
+    aligned = Subtitle(starts[keep], ends[keep], [t for t, k in zip(target.texts, keep) if k], target.encoding)
+    directory, name = os.path.split(out_file)
+    tmp_path = os.path.join(directory, f".{name}.align.tmp")
+    try:
+        with open(tmp_path, "w", encoding=target.encoding, errors="replace", newline="") as f:
+            f.write(format_srt(aligned))
+        os.replace(tmp_path, out_file)
+    except OSError as e:
+        print(f"Could not write aligned subtitle {out_file}: {e}", flush=True)
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        return None
+    return best
+
+
+def embedded_text_streams(metadata: PlexMetadata | None) -> list[int]:
+    """Return the file stream indexes of the embedded text subtitle tracks Plex reports."""
+    if metadata is None or not metadata.parts:
+        return []
+    return [
+        stream.index for stream in metadata.parts[0].streams
+        # Streams with a key are sidecar files rather than embedded tracks
+        if stream.stream_type == STREAM_SUBTITLE and stream.index is not None and not stream.key
+        and not stream.forced and (stream.codec or "").lower() in TEXT_SUBTITLE_CODECS
+    ]
+
+
+def extract_embedded(video_path: str, stream_indexes: list[int]) -> dict[int, Subtitle]:
+    """
+    Convert embedded subtitle tracks to SRT with a single ffmpeg pass over the
+    video and parse them; returns the tracks that have cues, by stream index.
+    """
+    if not stream_indexes:
+        return {}
+    with tempfile.TemporaryDirectory(prefix="subsync-tracks-") as tmp_dir:
+        args = ["ffmpeg", "-nostdin", "-v", "error", "-i", video_path]
+        for index in stream_indexes:
+            args += ["-map", f"0:{index}", "-f", "srt", os.path.join(tmp_dir, f"{index}.srt")]
+        try:
+            subprocess.run(priority_prefix() + args, check=True, capture_output=True, timeout=AUDIO_EXTRACT_TIMEOUT)
+        except (OSError, subprocess.SubprocessError) as e:
+            reason = getattr(e, "stderr", None) or str(e)
+            print(f"Subtitle track extraction failed for {video_path}: {reason}", flush=True)
+            return {}
+        tracks = {}
+        for index in stream_indexes:
+            subtitle = read_srt(os.path.join(tmp_dir, f"{index}.srt"))
+            if subtitle is not None:
+                tracks[index] = subtitle
+        return tracks
@@ -0,0 +1,188 @@
+"""
+Backups of subtitles taken before they are synced, so a bad sync can be reverted.
+
+Originals are stored gzip-compressed under SUBTITLE_BACKUP_DIR, named by the
+SHA-256 of their content, so syncing the same subtitle again does not store
+another copy. A version table records, per sync, the original's hash and the
+hash of the synced output.
+"""
+import gzip
+import os
+import sqlite3
+import threading
+import time
+
+from .config import SUBTITLE_BACKUP_DIR, SUBTITLE_BACKUP_VERSIONS
+from .db import open_database
+from .sync_cache import file_hash, keep_current
+
+_lock = threading.Lock()
+_conn: sqlite3.Connection | None = None
+_conn_path: str | None = None
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS versions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    media_id INTEGER NOT NULL,
+    subtitle_path TEXT NOT NULL,
+    sub_lang TEXT NOT NULL,
+    original_hash TEXT NOT NULL,
+    synced_hash TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS versions_media ON versions (media_id, subtitle_path);
+"""
+
+
+class RevertError(Exception):
+    """Raised when a subtitle cannot be restored from its backup."""
+
+
+def _connection() -> sqlite3.Connection | None:
+    """Open (once) the version database; returns None when backups are disabled or unavailable."""
+    global _conn, _conn_path
+    if not SUBTITLE_BACKUP_DIR:
+        return None
+    path = os.path.join(SUBTITLE_BACKUP_DIR, "versions.db")
+    if _conn is not None and _conn_path == path:
+        return _conn
+    conn = open_database(path, _SCHEMA, "Subtitle backups")
+    if conn is None:
+        return None
+    _conn, _conn_path = conn, path
+    return conn
+
+
+def _blob_path(content_hash: str) -> str:
+    return os.path.join(SUBTITLE_BACKUP_DIR, content_hash[:2], content_hash + ".gz")
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    # Write next to the target and rename, so readers never see a partial file
+    directory, name = os.path.split(path)
+    tmp_path = os.path.join(directory, f".{name}.tmp")
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def backup(subtitle_path: str, content_hash: str | None) -> bool:
+    """Store the current content of a subtitle unless a copy with this hash exists."""
+    if not SUBTITLE_BACKUP_DIR or not content_hash:
+        return False
+    blob = _blob_path(content_hash)
+    if os.path.exists(blob):
+        return True
+    try:
+        with open(subtitle_path, "rb") as f:
+            data = f.read()
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        _write_atomic(blob, gzip.compress(data))
+    except OSError as e:
+        print(f"Could not back up {subtitle_path}: {e}", flush=True)
+        return False
+    return True
+
+
+def record_version(media_id: int, subtitle_path: str, sub_lang: str, original_hash: str | None) -> None:
+    """Record a completed sync of subtitle_path and drop versions beyond SUBTITLE_BACKUP_VERSIONS."""
+    synced_hash = file_hash(subtitle_path)
+    if not original_hash or synced_hash is None or not os.path.exists(_blob_path(original_hash)):
+        return
+    with _lock:
+        conn = _connection()
+        if conn is None:
+            return
+        with conn:
+            expired = [row[0] for row in conn.execute(
+                "SELECT original_hash FROM versions WHERE subtitle_path = ? ORDER BY id DESC LIMIT -1 OFFSET ?",
+                (subtitle_path, max(1, SUBTITLE_BACKUP_VERSIONS) - 1),
+            )]
+            conn.execute(
+                "INSERT INTO versions (media_id, subtitle_path, sub_lang, original_hash, synced_hash, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (media_id, subtitle_path, sub_lang, original_hash, synced_hash, time.time()),
+            )
+            conn.execute(
+                "DELETE FROM versions WHERE subtitle_path = ? AND id NOT IN"
+                " (SELECT id FROM versions WHERE subtitle_path = ? ORDER BY id DESC LIMIT ?)",
+                (subtitle_path, subtitle_path, max(1, SUBTITLE_BACKUP_VERSIONS)),
+            )
+    release(*expired)
+
+
+def release(*content_hashes: str) -> None:
+    """Delete the stored originals with these hashes that no version refers to."""
+    if not content_hashes:
+        return
+    with _lock:
+        conn = _connection()
+        if conn is None:
+            return
+        for content_hash in set(content_hashes):
+            if conn.execute("SELECT 1 FROM versions WHERE original_hash = ? LIMIT 1", (content_hash,)).fetchone():
+                continue
+            try:
+                os.remove(_blob_path(content_hash))
+            except OSError:
+                pass
+
+
+def versions(media_id: int) -> list[dict]:
+    """Return the recorded syncs of a media item, newest first."""
+    with _lock:
+        conn = _connection()
+        if conn is None:
+            return []
+        rows = conn.execute(
+            "SELECT id, subtitle_path, sub_lang, original_hash, synced_hash, created_at FROM versions"
+            " WHERE media_id = ? ORDER BY id DESC",
+            (media_id,),
+        ).fetchall()
+    keys = ("id", "subtitle_path", "sub_lang", "original_hash", "synced_hash", "created_at")
+    return [dict(zip(keys, row)) for row in rows]
+
+
+def revert(media_id: int, sub_lang: str | None = None, force: bool = False) -> list[str]:
+    """
+    Restore the original of the latest sync of each subtitle of media_id
+    (optionally only for sub_lang) and return the restored paths. A subtitle
+    changed since it was synced is only overwritten when force is set.
+    Raises RevertError when nothing can be reverted.
+    """
+    latest: dict[str, dict] = {}
+    for version in versions(media_id):
+        if sub_lang is None or version["sub_lang"] == sub_lang:
+            latest.setdefault(version["subtitle_path"], version)
+    if not latest:
+        raise RevertError(f"No synced subtitle versions recorded for {media_id}")
+    if not force:
+        for path, version in latest.items():
+            if file_hash(path) != version["synced_hash"]:
+                raise RevertError(f"{path} has changed since it was synced")
+    restored = []
+    for path, version in latest.items():
+        try:
+            with open(_blob_path(version["original_hash"]), "rb") as f:
+                data = gzip.decompress(f.read())
+            _write_atomic(path, data)
+        except OSError as e:
+            raise RevertError(f"Could not restore {path}: {e}") from e
+        with _lock:
+            conn = _connection()
+            if conn is not None:
+                with conn:
+                    conn.execute("DELETE FROM versions WHERE id = ?", (version["id"],))
+        # A reverted subtitle stays as restored rather than being synced again by the next request
+        keep_current(path)
+        print(f"Reverted {path} to its version from before the sync.", flush=True)
+        restored.append(path)
+    release(*(version["original_hash"] for version in latest.values()))
+    return restored
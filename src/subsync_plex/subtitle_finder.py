@@ -1,98 +1,233 @@
 """
 Functions to locate and select subtitle files matching language codes.
+
+The tags between a video's name and a subtitle's extension are classified
+once into a SubtitleCandidate (language, region, forced, SDH, format); the
+classification of each distinct tag sequence is memoized, so a directory
+with hundreds of sidecars costs one pass over its names.
 """
+import functools
 import os
+import re
+from dataclasses import dataclass
+
 from .config import PLEX_LIBRARY_DIR
+from .dir_index import directory_index
+
+ISO_639_1_TO_2 = {
+    "aa": "aar", "ab": "abk", "af": "afr", "ak": "aka", "sq": "sqi",
+    "am": "amh", "ar": "ara", "an": "arg", "hy": "hye", "as": "asm",
+    "av": "ava", "ae": "ave", "ay": "aym", "az": "aze", "ba": "bak",
+    "bm": "bam", "eu": "eus", "be": "bel", "bn": "ben", "bh": "bih",
+    "bi": "bis", "bo": "bod", "bs": "bos", "br": "bre", "bg": "bul",
+    "my": "mya", "ca": "cat", "cs": "ces", "ce": "che", "zh": "zho",
+    "cu": "chu", "cv": "chv", "kw": "cor", "co": "cos", "cr": "cre",
+    "cy": "cym", "da": "dan", "de": "deu", "dv": "div", "dz": "dzo",
+    "el": "ell", "en": "eng", "eo": "epo", "et": "est", "ee": "ewe",
+    "fo": "fao", "fa": "fas", "fj": "fij", "fi": "fin", "fr": "fra",
+    "fy": "fry", "ff": "ful", "gd": "gla", "gl": "glg", "lg": "lug",
+    "ka": "kat", "gu": "guj", "ht": "hat", "ha": "hau", "he": "heb",
+    "hz": "her", "hi": "hin", "ho": "hmo", "hr": "hrv", "hu": "hun",
+    "ig": "ibo", "io": "ido", "ii": "iii", "iu": "iku", "ie": "ile",
+    "ia": "ina", "id": "ind", "ik": "ipk", "is": "isl", "it": "ita",
+    "ja": "jpn", "jv": "jav", "kn": "kan", "kr": "kau", "ks": "kas",
+    "kk": "kaz", "km": "khm", "ki": "kik", "rw": "kin", "ky": "kir",
+    "kv": "kom", "kg": "kon", "ko": "kor", "kj": "kua", "ku": "kur",
+    "lo": "lao", "la": "lat", "lv": "lav", "li": "lim", "ln": "lin",
+    "lt": "lit", "lb": "ltz", "lu": "lub", "mk": "mkd", "mh": "mah",
+    "ml": "mal", "mi": "mri", "mr": "mar", "ms": "msa", "mg": "mlg",
+    "mt": "mlt", "mn": "mon", "na": "nau", "nv": "nav", "nr": "nbl",
+    "nd": "nde", "ng": "ndo", "ne": "nep", "nn": "nno", "nb": "nob",
+    "no": "nor", "oc": "oci", "oj": "oji", "or": "ori", "om": "orm",
+    "os": "oss", "pa": "pan", "pi": "pli", "pl": "pol", "pt": "por",
+    "qu": "que", "rm": "roh", "ro": "ron", "rn": "run", "ru": "rus",
+    "sg": "sag", "sa": "san", "si": "sin", "sk": "slk", "sl": "slv",
+    "se": "sme", "sm": "smo", "sn": "sna", "sd": "snd", "so": "som",
+    "st": "sot", "es": "spa", "sc": "srd", "sr": "srp", "ss": "ssw",
+    "su": "sun", "sw": "swa", "sv": "swe", "ty": "tah", "ta": "tam",
+    "tt": "tat", "te": "tel", "tg": "tgk", "tl": "tgl", "th": "tha",
+    "ti": "tir", "to": "ton", "tn": "tsn", "ts": "tso", "tk": "tuk",
+    "tr": "tur", "tw": "twi", "ug": "uig", "uk": "ukr", "ur": "urd",
+    "uz": "uzb", "ve": "ven", "vi": "vie", "vo": "vol", "wa": "wln",
+    "wo": "wol", "xh": "xho", "yi": "yid", "yo": "yor", "za": "zha",
+    "zu": "zul", "nl": "nld", "ga": "gle", "gn": "grn", "gv": "glv",
+    "kl": "kal", "ny": "nya", "ps": "pus"
+}
+ISO_639_2_TO_1 = {iso2: iso1 for iso1, iso2 in ISO_639_1_TO_2.items()}
+# Bibliographic ISO-639-2/B codes differing from the terminology codes above
+ISO_639_2B_TO_1 = {
+    "alb": "sq", "arm": "hy", "baq": "eu", "bur": "my", "chi": "zh",
+    "cze": "cs", "dut": "nl", "fre": "fr", "geo": "ka", "ger": "de",
+    "gre": "el", "ice": "is", "mac": "mk", "mao": "mi", "may": "ms",
+    "per": "fa", "rum": "ro", "slo": "sk", "tib": "bo", "wel": "cy",
+}
+# Language names used as tags, in English and the language itself
+LANGUAGE_NAMES = {
+    "english": "en", "spanish": "es", "espanol": "es", "español": "es", "french": "fr",
+    "francais": "fr", "français": "fr", "german": "de", "deutsch": "de", "italian": "it",
+    "italiano": "it", "portuguese": "pt", "portugues": "pt", "português": "pt", "dutch": "nl",
+    "nederlands": "nl", "swedish": "sv", "svenska": "sv", "norwegian": "no", "norsk": "no",
+    "danish": "da", "dansk": "da", "finnish": "fi", "suomi": "fi", "polish": "pl",
+    "polski": "pl", "russian": "ru", "ukrainian": "uk", "czech": "cs", "slovak": "sk",
+    "hungarian": "hu", "magyar": "hu", "romanian": "ro", "bulgarian": "bg", "greek": "el",
+    "turkish": "tr", "arabic": "ar", "hebrew": "he", "persian": "fa", "hindi": "hi",
+    "thai": "th", "vietnamese": "vi", "indonesian": "id", "malay": "ms", "chinese": "zh",
+    "japanese": "ja", "korean": "ko", "croatian": "hr", "serbian": "sr", "slovenian": "sl",
+    "estonian": "et", "latvian": "lv", "lithuanian": "lt", "icelandic": "is", "catalan": "ca",
+    "irish": "ga", "welsh": "cy", "tagalog": "tl", "filipino": "tl",
+}
+# Tags marking subtitles for the deaf and hard of hearing. 'hi' is Hindi when
+# it is the first language-like tag and hearing impaired after a language.
+SDH_TAGS = frozenset(("sdh", "hi", "cc"))
+# Preferred subtitle formats, best first; SRT is also the only one that can be aligned
+FORMAT_RANK = {"srt": 0, "ass": 1, "ssa": 1, "vtt": 2}
+
+# How a language was written, most specific first; used to order otherwise equal candidates
+CODE_ISO_639_1, CODE_REGION, CODE_ISO_639_2, CODE_NAME = range(4)
+
+# Language with a region ('en-us', 'pt_br', 'es-419') or script ('zh-hans')
+_REGION_RE = re.compile(r"^([a-z]{2,3})[-_]([a-z]{2}|[0-9]{3}|[a-z]{4})$")
+
+
+@dataclass(frozen=True)
+class SubtitleCandidate:
+    """A sidecar subtitle of a video and what its name says about it."""
+    path: str
+    language: str | None
+    region: str | None
+    forced: bool
+    sdh: bool
+    format: str
+    code: int
+
+    def rank(self, region: str | None = None) -> tuple:
+        """Sort key: wanted region, then format, then non-SDH, then how specifically the language is tagged."""
+        return (
+            region is not None and self.region != region,
+            FORMAT_RANK.get(self.format, len(FORMAT_RANK)),
+            self.sdh,
+            self.code,
+            os.path.basename(self.path),
+        )
+
+
+def _language(tag: str) -> tuple[str | None, str | None, int]:
+    """Return (ISO-639-1 code, region, code kind) for a single tag, or (None, None, 0)."""
+    if tag in ISO_639_1_TO_2:
+        return tag, None, CODE_ISO_639_1
+    if tag in ISO_639_2_TO_1:
+        return ISO_639_2_TO_1[tag], None, CODE_ISO_639_2
+    if tag in ISO_639_2B_TO_1:
+        return ISO_639_2B_TO_1[tag], None, CODE_ISO_639_2
+    if tag in LANGUAGE_NAMES:
+        return LANGUAGE_NAMES[tag], None, CODE_NAME
+    match = _REGION_RE.match(tag)
+    if match:
+        language, _, _ = _language(match.group(1))
+        if language:
+            return language, match.group(2).upper(), CODE_REGION
+    return None, None, 0
+
+
+@functools.lru_cache(maxsize=4096)
+def classify_tags(tags: tuple[str, ...]) -> tuple[str | None, str | None, bool, bool, int]:
+    """
+    Classify lower-cased subtitle name tags in one pass; returns (language,
+    region, forced, sdh, code kind). The first tag naming a language wins.
+    """
+    language = region = None
+    code = 0
+    forced = sdh = False
+    for tag in tags:
+        if tag == "forced":
+            forced = True
+        elif language is not None and tag in SDH_TAGS:
+            sdh = True
+        elif language is None:
+            language, region, code = _language(tag)
+            if language is None and tag in SDH_TAGS:
+                sdh = True
+    return language, region, forced, sdh, code
+
+
+def parse_subtitle_tags(tags: list[str]) -> tuple[str | None, bool]:
+    """
+    Return the ISO-639-1 language code (or None if untagged) and whether the
+    subtitle is forced, from the tags between the video name and extension.
+    """
+    language, _, forced, _, _ = classify_tags(tuple(tags))
+    return language, forced
+
+
+def subtitle_candidates(video_file: str) -> list[SubtitleCandidate]:
+    """Return every sidecar subtitle of the video, in file name order."""
+    video_dir = os.path.join(PLEX_LIBRARY_DIR, os.path.dirname(video_file))
+    video_name = os.path.splitext(os.path.basename(video_file))[0]
+    listing = directory_index.listing(video_dir)
+    if listing is None:
+        return []
+    candidates = []
+    for name, tags in listing.subtitles_for(video_name):
+        language, region, forced, sdh, code = classify_tags(tuple(tags))
+        extension = os.path.splitext(name)[1][1:].lower()
+        candidates.append(
+            SubtitleCandidate(os.path.join(video_dir, name), language, region, forced, sdh, extension, code)
+        )
+    return candidates
+
+
+def rank_candidates(candidates: list[SubtitleCandidate], sub_lang: str) -> list[SubtitleCandidate]:
+    """
+    Return the non-forced candidates in sub_lang, best first. sub_lang may be
+    any tag the file names may use ('en', 'eng', 'en-US', 'English'); with a
+    region, subtitles of that region are preferred.
+    """
+    language, region, _, _, _ = classify_tags((sub_lang.lower(),))
+    if language is None:
+        return []
+    matches = [c for c in candidates if c.language == language and not c.forced]
+    return sorted(matches, key=lambda c: c.rank(region))
+
+
+def best_match(candidates: list[SubtitleCandidate], sub_lang: str) -> str | None:
+    """Return the path of the best candidate for sub_lang, as find_matching_srt does, or None."""
+    ranked = rank_candidates(candidates, sub_lang)
+    if ranked:
+        print(f"Found subtitle(s): {[c.path for c in ranked]}", flush=True)
+        return ranked[0].path
+
+    unforced = [c for c in candidates if not c.forced]
+    if len(unforced) == 1 and unforced[0].language is None:
+        print(f"Error: Subtitle file '{unforced[0].path}' has no language code.", flush=True)
+    return None
+
 
 def find_matching_srt(video_file: str, sub_lang: str) -> str | None:
     """
-    Find a subtitle file in the same directory as the video that matches the given
-    ISO-639-1 subtitle language code (e.g., 'en', 'es').
-    Falls back to ISO-639-2 code if no ISO-639-1 match is found.
-    Does not match '.forced' subtitle files. If the only subtitle file detected
-    has no language code, returns None to signal an error.
+    Find the best subtitle file in the same directory as the video for the
+    given subtitle language code (e.g., 'en', 'es'), matching ISO-639-1 and
+    ISO-639-2 codes, regional tags and language names. Does not match
+    '.forced' subtitle files. If the only subtitle file detected has no
+    language code, returns None to signal an error.
     """
     video_dir = os.path.join(PLEX_LIBRARY_DIR, os.path.dirname(video_file))
     video_name = os.path.splitext(os.path.basename(video_file))[0]
-    # Collect all subtitle files in the same directory whose names start with the video name
     print(f"Searching for subtitles in {video_dir} for files starting with '{video_name}'", flush=True)
-    try:
-        filenames = os.listdir(video_dir)
-    except (FileNotFoundError, NotADirectoryError):
-        return None
-    # Match files that start with the video name and end with .srt (case-insensitive extension)
-    all_candidates = []
-    for fname in filenames:
-        # check .srt extension
-        if not fname.lower().endswith('.srt'):
-            continue
-        # match prefix exactly (avoids glob pattern issues with special chars)
-        if not fname.startswith(video_name):
-            continue
-        all_candidates.append(os.path.join(video_dir, fname))
-    # exclude any forced subtitle files
-    candidates = [c for c in all_candidates if ".forced" not in os.path.basename(c).lower()]
-
-    if not candidates:
-        return None
-
-    def parts(path: str) -> list[str]:
-        name = os.path.splitext(os.path.basename(path))[0]
-        return [p.lower() for p in name.split('.')]
-
-    iso1 = sub_lang.lower()
-    iso1_matches = [c for c in candidates if iso1 in parts(c)[1:]]
-    if iso1_matches:
-        print(f"Found ISO-639-1 subtitle(s): {iso1_matches}", flush=True)
-        return iso1_matches[0]
-
-    ISO_639_1_TO_2 = {
-        "aa": "aar", "ab": "abk", "af": "afr", "ak": "aka", "sq": "sqi",
-        "am": "amh", "ar": "ara", "an": "arg", "hy": "hye", "as": "asm",
-        "av": "ava", "ae": "ave", "ay": "aym", "az": "aze", "ba": "bak",
-        "bm": "bam", "eu": "eus", "be": "bel", "bn": "ben", "bh": "bih",
-        "bi": "bis", "bo": "bod", "bs": "bos", "br": "bre", "bg": "bul",
-        "my": "mya", "ca": "cat", "cs": "ces", "ce": "che", "zh": "zho",
-        "cu": "chu", "cv": "chv", "kw": "cor", "co": "cos", "cr": "cre",
-        "cy": "cym", "da": "dan", "de": "deu", "dv": "div", "dz": "dzo",
-        "el": "ell", "en": "eng", "eo": "epo", "et": "est", "ee": "ewe",
-        "fo": "fao", "fa": "fas", "fj": "fij", "fi": "fin", "fr": "fra",
-        "fy": "fry", "ff": "ful", "gd": "gla", "gl": "glg", "lg": "lug",
-        "ka": "kat", "gu": "guj", "ht": "hat", "ha": "hau", "he": "heb",
-        "hz": "her", "hi": "hin", "ho": "hmo", "hr": "hrv", "hu": "hun",
-        "ig": "ibo", "io": "ido", "ii": "iii", "iu": "iku", "ie": "ile",
-        "ia": "ina", "id": "ind", "ik": "ipk", "is": "isl", "it": "ita",
-        "ja": "jpn", "jv": "jav", "kn": "kan", "kr": "kau", "ks": "kas",
-        "kk": "kaz", "km": "khm", "ki": "kik", "rw": "kin", "ky": "kir",
-        "kv": "kom", "kg": "kon", "ko": "kor", "kj": "kua", "ku": "kur",
-        "lo": "lao", "la": "lat", "lv": "lav", "li": "lim", "ln": "lin",
-        "lt": "lit", "lb": "ltz", "lu": "lub", "mk": "mkd", "mh": "mah",
-        "ml": "mal", "mi": "mri", "mr": "mar", "ms": "msa", "mg": "mlg",
-        "mt": "mlt", "mn": "mon", "na": "nau", "nv": "nav", "nr": "nbl",
-        "nd": "nde", "ng": "ndo", "ne": "nep", "nn": "nno", "nb": "nob",
-        "no": "nor", "oc": "oci", "oj": "oji", "or": "ori", "om": "orm",
-        "os": "oss", "pa": "pan", "pi": "pli", "pl": "pol", "pt": "por",
-        "qu": "que", "rm": "roh", "ro": "ron", "rn": "run", "ru": "rus",
-        "sg": "sag", "sa": "san", "si": "sin", "sk": "slk", "sl": "slv",
-        "se": "sme", "sm": "smo", "sn": "sna", "sd": "snd", "so": "som",
-        "st": "sot", "es": "spa", "sc": "srd", "sr": "srp", "ss": "ssw",
-        "su": "sun", "sw": "swa", "sv": "swe", "ty": "tah", "ta": "tam",
-        "tt": "tat", "te": "tel", "tg": "tgk", "tl": "tgl", "th": "tha",
-        "ti": "tir", "to": "ton", "tn": "tsn", "ts": "tso", "tk": "tuk",
-        "tr": "tur", "tw": "twi", "ug": "uig", "uk": "ukr", "ur": "urd",
-        "uz": "uzb", "ve": "ven", "vi": "vie", "vo": "vol", "wa": "wln",
-        "wo": "wol", "xh": "xho", "yi": "yid", "yo": "yor", "za": "zha",
-        "zu": "zul"
-    }
-    iso2 = ISO_639_1_TO_2.get(iso1)
-    if iso2:
-        iso2_matches = [c for c in candidates if iso2 in parts(c)[1:]]
-        if iso2_matches:
-            print(f"Found ISO-639-2 subtitle(s): {iso2_matches}", flush=True)
-            return iso2_matches[0]
-
-    if len(candidates) == 1 and parts(candidates[0]) == [video_name]:
-        print(f"Error: Subtitle file '{candidates[0]}' has no language code.", flush=True)
-        return None
-
-    return None
\ No newline at end of file
+    return best_match(subtitle_candidates(video_file), sub_lang)
+
+
+def subtitle_languages(candidates: list[SubtitleCandidate]) -> list[str]:
+    """Return the ISO-639-1 codes of the language-tagged, non-forced candidates, in order."""
+    languages = []
+    for candidate in candidates:
+        if candidate.language and not candidate.forced and candidate.language not in languages:
+            languages.append(candidate.language)
+    return languages
+
+
+def find_subtitle_languages(video_file: str) -> list[str]:
+    """
+    Return the ISO-639-1 codes of all language-tagged, non-forced subtitle
+    files next to the video, in file name order.
+    """
+    return subtitle_languages(subtitle_candidates(video_file))
@@ -0,0 +1,133 @@
+"""
+Persistent record of completed syncs, used to skip subtitles that are already
+synchronized against an unchanged video file.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+
+from .config import SYNC_CACHE_PATH
+from .db import open_database
+
+_lock = threading.Lock()
+_conn: sqlite3.Connection | None = None
+_conn_path: str | None = None
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sync_cache (
+    video_path TEXT NOT NULL,
+    subtitle_path TEXT NOT NULL,
+    audio_lang TEXT NOT NULL,
+    sub_lang TEXT NOT NULL,
+    video_size INTEGER NOT NULL,
+    video_mtime_ns INTEGER NOT NULL,
+    input_hash TEXT NOT NULL,
+    output_hash TEXT NOT NULL,
+    synced_at REAL NOT NULL,
+    PRIMARY KEY (video_path, subtitle_path, audio_lang, sub_lang)
+);
+"""
+
+
+def _connection() -> sqlite3.Connection | None:
+    """Open (once) the cache database; returns None when caching is disabled or unavailable."""
+    global _conn, _conn_path
+    path = SYNC_CACHE_PATH
+    if not path:
+        return None
+    if _conn is not None and _conn_path == path:
+        return _conn
+    conn = open_database(path, _SCHEMA, "Sync cache")
+    if conn is None:
+        return None
+    _conn, _conn_path = conn, path
+    return conn
+
+
+def file_hash(path: str) -> str | None:
+    """Return the SHA-256 of a file's content, or None if it cannot be read."""
+    digest = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 16), b""):
+                digest.update(chunk)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+
+def video_fingerprint(path: str) -> tuple[int, int] | None:
+    """Return (size, mtime_ns) of the video file, or None if it cannot be stat'ed."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+def is_already_synced(video_path: str, subtitle_path: str, audio_lang: str, sub_lang: str) -> bool:
+    """
+    Return True if the subtitle is the unchanged output of a previous sync
+    against the same, unchanged video file.
+    """
+    fingerprint = video_fingerprint(video_path)
+    if fingerprint is None:
+        return False
+    with _lock:
+        conn = _connection()
+        if conn is None:
+            return False
+        row = conn.execute(
+            "SELECT video_size, video_mtime_ns, output_hash FROM sync_cache"
+            " WHERE video_path = ? AND subtitle_path = ? AND audio_lang = ? AND sub_lang = ?",
+            (video_path, subtitle_path, audio_lang, sub_lang),
+        ).fetchone()
+    if row is None or (row[0], row[1]) != fingerprint:
+        return False
+    return file_hash(subtitle_path) == row[2]
+
+
+def record_sync(video_path: str, subtitle_path: str, audio_lang: str, sub_lang: str,
+                input_hash: str | None, synced_at: float) -> None:
+    """Remember that subtitle_path was synced against the current video file."""
+    fingerprint = video_fingerprint(video_path)
+    output_hash = file_hash(subtitle_path)
+    if fingerprint is None or output_hash is None:
+        return
+    with _lock:
+        conn = _connection()
+        if conn is None:
+            return
+        conn.execute(
+            "INSERT OR REPLACE INTO sync_cache VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (video_path, subtitle_path, audio_lang, sub_lang, fingerprint[0], fingerprint[1],
+             input_hash or "", output_hash, synced_at),
+        )
+        conn.commit()
+
+
+def keep_current(subtitle_path: str) -> None:
+    """
+    Treat the current content of subtitle_path as its synced output, so a
+    subtitle restored by a revert is not synced again.
+    """
+    output_hash = file_hash(subtitle_path)
+    if output_hash is None:
+        return
+    with _lock:
+        conn = _connection()
+        if conn is None:
+            return
+        conn.execute("UPDATE sync_cache SET output_hash = ? WHERE subtitle_path = ?", (output_hash, subtitle_path))
+        conn.commit()
+
+
+def synced_subtitles() -> dict[str, float]:
+    """Return the time of the latest recorded sync for every subtitle path."""
+    with _lock:
+        conn = _connection()
+        if conn is None:
+            return {}
+        rows = conn.execute("SELECT subtitle_path, MAX(synced_at) FROM sync_cache GROUP BY subtitle_path").fetchall()
+    return dict(rows)
@@ -0,0 +1,211 @@
+"""
+Running subsync with an adaptive effort policy and a wall-clock timeout.
+"""
+import os
+import re
+import signal
+import subprocess
+import threading
+from dataclasses import dataclass
+
+from .config import (
+    SUBSYNC_EFFORTS, SUBSYNC_MIN_CORRELATION, SUBSYNC_MIN_POINTS, SUBSYNC_TIMEOUT, SUBSYNC_JOB_THREADS,
+    SUBSYNC_ENGINE, ENGINE_LIBRARY,
+)
+from .library_engine import get_pool
+from .metrics import SUBSYNC_SECONDS, timed
+from .scheduling import priority_prefix
+
+_POINTS_RE = re.compile(r"(\d+)\s+points", re.IGNORECASE)
+_CORRELATION_RE = re.compile(r"correlation\s*[=:]?\s*([0-9]*\.?[0-9]+)\s*(%?)", re.IGNORECASE)
+
+
+@dataclass
+class SyncPolicy:
+    """Efforts to try in increasing order, the quality needed to stop early, and the per-attempt timeout."""
+    efforts: list[float]
+    min_correlation: float
+    min_points: int
+    timeout: float | None
+
+    @classmethod
+    def from_request(cls, data) -> "SyncPolicy":
+        """Build the policy from configuration and the optional overrides of a request."""
+        effort = getattr(data, "effort", None)
+        min_correlation = getattr(data, "min_correlation", None)
+        timeout = getattr(data, "timeout", None)
+        return cls(
+            efforts=[effort] if effort is not None else list(SUBSYNC_EFFORTS),
+            min_correlation=SUBSYNC_MIN_CORRELATION if min_correlation is None else min_correlation,
+            min_points=SUBSYNC_MIN_POINTS,
+            # 0 disables the timeout
+            timeout=(SUBSYNC_TIMEOUT if timeout is None else timeout) or None,
+        )
+
+
+@dataclass
+class SyncAttempt:
+    """Outcome of one subsync run."""
+    effort: float
+    returncode: int | None
+    output: str
+    timed_out: bool = False
+    correlation: float | None = None
+    points: int | None = None
+    out_file: str | None = None
+
+    @property
+    def succeeded(self) -> bool:
+        return not self.timed_out and self.returncode == 0
+
+    def good_enough(self, policy: SyncPolicy) -> bool:
+        """True if the result meets the policy; a run that did not report its quality does not."""
+        if not self.succeeded or self.correlation is None or self.points is None:
+            return False
+        return self.correlation >= policy.min_correlation and self.points >= policy.min_points
+
+    @property
+    def reason(self) -> str:
+        if self.timed_out:
+            return "subsync timed out"
+        last_line = next((line for line in reversed(self.output.splitlines()) if line.strip()), "")
+        return f"subsync exited with code {self.returncode}" + (f": {last_line.strip()}" if last_line else "")
+
+
+def parse_quality(output: str) -> tuple[float | None, int | None]:
+    """Return the last correlation (as a 0-1 fraction) and point count reported by subsync."""
+    correlation = None
+    points = None
+    matches = _CORRELATION_RE.findall(output)
+    if matches:
+        value, percent = matches[-1]
+        correlation = float(value)
+        if percent or correlation > 1:
+            correlation /= 100
+    point_matches = _POINTS_RE.findall(output)
+    if point_matches:
+        points = int(point_matches[-1])
+    return correlation, points
+
+
+def subsync_args(ref: str, ref_lang: str, sub: str, sub_lang: str, out: str, effort: float) -> list[str]:
+    return [
+        "subsync",
+        "--cli",
+        "sync",
+        "--ref", ref,
+        "--ref-lang", ref_lang,
+        "--sub", sub,
+        "--sub-lang", sub_lang,
+        "--out", out,
+        "--overwrite",
+        "--effort", f"{effort:g}",
+        "--jobs", str(SUBSYNC_JOB_THREADS),
+    ]
+
+
+def run_process(args: list[str], timeout: float | None) -> tuple[int | None, str, bool]:
+    """
+    Run a command in its own process group, echoing and capturing its output.
+    On timeout the whole process group is killed. Returns (returncode, output, timed_out).
+    """
+    proc = subprocess.Popen(
+        args,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        errors="replace",
+        start_new_session=True,
+    )
+    lines = []
+
+    def pump():
+        for line in proc.stdout:
+            lines.append(line)
+            print(line, end="", flush=True)
+
+    reader = threading.Thread(target=pump, daemon=True)
+    reader.start()
+    timed_out = False
+    try:
+        proc.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        timed_out = True
+        print(f"Timed out after {timeout}s; killing {args[0]} (pid {proc.pid}).", flush=True)
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        proc.wait()
+    reader.join(5)
+    return (None if timed_out else proc.returncode), "".join(lines), timed_out
+
+
+def run_subsync(args: list[str], timeout: float | None) -> tuple[int | None, str, bool]:
+    """Run a subsync command line with the configured engine."""
+    if SUBSYNC_ENGINE == ENGINE_LIBRARY:
+        result = get_pool().run(args[1:], timeout)
+        if result is not None:
+            return result
+    return run_process(priority_prefix() + args, timeout)
+
+
+def _attempt_path(out_file: str, effort: float) -> str:
+    # Attempts write next to the target so the accepted one can be renamed into place
+    directory, name = os.path.split(out_file)
+    stem, ext = os.path.splitext(name)
+    return os.path.join(directory, f".{stem}.subsync-{effort:g}{ext}")
+
+
+def _discard(path: str | None) -> None:
+    if path:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def sync_with_policy(ref: str, ref_lang: str, sub: str, sub_lang: str, out_file: str,
+                     policy: SyncPolicy) -> SyncAttempt:
+    """
+    Sync sub against ref, starting at the lowest effort and escalating while the
+    reported quality is below the policy threshold. The accepted (or otherwise
+    best successful) attempt is moved to out_file; a timeout stops escalation,
+    as a higher effort would only take longer.
+    """
+    attempts = []
+    for effort in policy.efforts or [1.0]:
+        attempt_file = _attempt_path(out_file, effort)
+        print(f"Running subsync at effort {effort:g}", flush=True)
+        with timed("subsync", SUBSYNC_SECONDS.labels(engine=SUBSYNC_ENGINE)):
+            returncode, output, timed_out = run_subsync(
+                subsync_args(ref, ref_lang, sub, sub_lang, attempt_file, effort), policy.timeout
+            )
+        correlation, points = parse_quality(output)
+        attempt = SyncAttempt(effort, returncode, output, timed_out, correlation, points,
+                              attempt_file if returncode == 0 and os.path.exists(attempt_file) else None)
+        attempts.append(attempt)
+        print(
+            f"subsync effort {effort:g}: returncode={returncode}, correlation={correlation}, points={points}",
+            flush=True,
+        )
+        if attempt.good_enough(policy) or timed_out:
+            break
+
+    succeeded = [a for a in attempts if a.succeeded and a.out_file]
+    if attempts[-1].good_enough(policy) and attempts[-1].out_file:
+        best = attempts[-1]
+    elif succeeded:
+        # Without reported quality, the highest effort is the best guess
+        best = max(succeeded, key=lambda a: (a.correlation or 0, a.points or 0, a.effort))
+        print(f"No attempt reached the quality threshold; keeping effort {best.effort:g}.", flush=True)
+    else:
+        best = attempts[-1]
+    for attempt in attempts:
+        if attempt is not best or not attempt.out_file:
+            # Also removes partial output left by failed or killed runs
+            _discard(_attempt_path(out_file, attempt.effort))
+    if best.out_file:
+        os.replace(best.out_file, out_file)
+        best.out_file = out_file
+    return best
@@ -0,0 +1,107 @@
+import os
+import subprocess
+
+import pytest
+
+import subsync_plex.audio_cache as audio_cache
+from subsync_plex.plex_api import PlexMetadata, PlexPart, PlexStream, STREAM_AUDIO, STREAM_VIDEO
+
+
+@pytest.fixture(autouse=True)
+def patch_cache_dir(tmp_path, monkeypatch):
+    cache_dir = tmp_path / 'audio_cache'
+    monkeypatch.setattr(audio_cache, 'AUDIO_CACHE_DIR', str(cache_dir))
+    monkeypatch.setattr(audio_cache, 'AUDIO_CACHE_MAX_BYTES', 1024)
+    return cache_dir
+
+
+@pytest.fixture
+def fake_ffmpeg(monkeypatch):
+    runs = []
+
+    def run(args, **kwargs):
+        runs.append(args)
+        with open(args[-1], 'wb') as f:
+            f.write(b'a' * 100)
+        return subprocess.CompletedProcess(args, 0)
+
+    monkeypatch.setattr(subprocess, 'run', run)
+    return runs
+
+
+def make_video(tmp_path, name='movie.mkv', content=b'video'):
+    path = tmp_path / name
+    path.write_bytes(content)
+    return str(path)
+
+
+def test_extracts_once_and_reuses(tmp_path, fake_ffmpeg):
+    video = make_video(tmp_path)
+    first = audio_cache.reference_audio(video, 1)
+    second = audio_cache.reference_audio(video, 1)
+    assert first == second and os.path.exists(first)
+    assert len(fake_ffmpeg) == 1
+    assert fake_ffmpeg[0][fake_ffmpeg[0].index('-map') + 1] == '0:1'
+    # A different stream or a changed video gets its own extraction
+    audio_cache.reference_audio(video, None)
+    assert fake_ffmpeg[1][fake_ffmpeg[1].index('-map') + 1] == '0:a:0'
+    make_video(tmp_path, content=b'replaced video')
+    assert audio_cache.reference_audio(video, 1) != first
+    assert len(fake_ffmpeg) == 3
+    # Locks of finished lookups are not kept
+    assert audio_cache._locks == {}
+
+
+def test_entry_evicted_during_lookup_is_extracted_again(tmp_path, monkeypatch, fake_ffmpeg):
+    video = make_video(tmp_path)
+    path = audio_cache.reference_audio(video, 1)
+
+    def evicted(path, *args, **kwargs):
+        os.remove(path)
+        raise FileNotFoundError(path)
+
+    monkeypatch.setattr(audio_cache.os, 'utime', evicted)
+    assert audio_cache.reference_audio(video, 1) == path
+    assert os.path.exists(path)
+    assert len(fake_ffmpeg) == 2
+
+
+def test_failed_extraction_returns_none(tmp_path, monkeypatch, patch_cache_dir):
+    def run(args, **kwargs):
+        raise subprocess.CalledProcessError(1, args, stderr='no audio')
+
+    monkeypatch.setattr(subprocess, 'run', run)
+    assert audio_cache.reference_audio(make_video(tmp_path), None) is None
+    assert os.listdir(patch_cache_dir) == []
+
+
+def test_disabled_or_missing_video(tmp_path, monkeypatch, fake_ffmpeg):
+    assert audio_cache.reference_audio(str(tmp_path / 'missing.mkv')) is None
+    monkeypatch.setattr(audio_cache, 'AUDIO_CACHE_DIR', '')
+    assert audio_cache.reference_audio(make_video(tmp_path)) is None
+    assert fake_ffmpeg == []
+
+
+def test_evicts_least_recently_used(tmp_path, patch_cache_dir, fake_ffmpeg):
+    paths = []
+    for i in range(12):
+        paths.append(audio_cache.reference_audio(make_video(tmp_path, f'v{i}.mkv'), None))
+        os.utime(paths[-1], (i, i))
+    # Each file is 100 bytes and the cache holds 1024
+    remaining = sorted(os.listdir(patch_cache_dir))
+    assert len(remaining) == 10
+    assert not os.path.exists(paths[0]) and not os.path.exists(paths[1])
+    assert os.path.exists(paths[-1])
+
+
+def test_select_audio_stream():
+    streams = (
+        PlexStream(1, STREAM_VIDEO, 0, 'h264', None, None, False, None),
+        PlexStream(2, STREAM_AUDIO, 1, 'ac3', 'fra', 'fr', False, None),
+        PlexStream(3, STREAM_AUDIO, 2, 'aac', 'eng', None, False, None),
+    )
+    metadata = PlexMetadata(1, 'Movie', 'movie', None, (PlexPart('/m.mkv', None, streams),))
+    assert audio_cache.select_audio_stream(metadata, 'en') == 2
+    assert audio_cache.select_audio_stream(metadata, 'fr') == 1
+    assert audio_cache.select_audio_stream(metadata, 'de') is None
+    assert audio_cache.select_audio_stream(None, 'en') is None
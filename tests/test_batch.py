@@ -0,0 +1,148 @@
+import threading
+import time
+
+import subsync_plex.batch as batch_mod
+from subsync_plex.config import BATCH_FINISHED, BATCH_FAILED, RESULT_SYNCED, RESULT_FAILED
+from subsync_plex.jobs import JobQueue
+from subsync_plex.metrics import REASON_NO_SUBTITLE, REASON_PLEX_LOOKUP_FAILED, set_reason
+
+
+class DummyData:
+    def __init__(self, media_id, batch_id=None):
+        self.media_id = media_id
+        self.batch_id = batch_id
+
+
+def test_batch_runs_all_keys():
+    queue = JobQueue(lambda data: RESULT_FAILED if data.media_id == 3 else RESULT_SYNCED, workers=2, max_size=10)
+    queue.start()
+    runner = batch_mod.BatchRunner(queue, concurrency=2)
+    batch = runner.start_batch(range(1, 6), DummyData)
+    for _ in range(100):
+        if batch.state != batch_mod.BATCH_RUNNING:
+            break
+        threading.Event().wait(0.05)
+    queue.stop(timeout=5)
+    assert batch.state == BATCH_FINISHED
+    assert batch.expanded == batch.submitted == batch.completed == 5
+    assert batch.results == {RESULT_SYNCED: 4, RESULT_FAILED: 1}
+    assert runner.get(batch.id) is batch
+
+
+def test_batch_limits_outstanding_jobs_and_reads_keys_lazily():
+    release = threading.Event()
+    read = []
+
+    def keys():
+        for key in range(10):
+            read.append(key)
+            yield key
+
+    queue = JobQueue(lambda data: release.wait(5) and RESULT_SYNCED, workers=1, max_size=10)
+    queue.start()
+    runner = batch_mod.BatchRunner(queue, concurrency=2)
+    batch = runner.start_batch(keys(), DummyData)
+    threading.Event().wait(0.2)
+    # Two jobs outstanding and the third key read while waiting for a slot
+    assert batch.submitted == 2
+    assert len(read) == 3
+    release.set()
+    for _ in range(100):
+        if batch.state != batch_mod.BATCH_RUNNING:
+            break
+        threading.Event().wait(0.05)
+    queue.stop(timeout=5)
+    assert batch.completed == 10
+
+
+def test_batch_refills_slot_of_first_finished_job():
+    release = threading.Event()
+    started = []
+
+    def handler(data):
+        started.append(data.media_id)
+        # The first job stays running until every other key has been synced
+        if data.media_id == 0:
+            release.wait(5)
+        return RESULT_SYNCED
+
+    queue = JobQueue(handler, workers=2, max_size=10)
+    queue.start()
+    runner = batch_mod.BatchRunner(queue, concurrency=2)
+    batch = runner.start_batch(range(5), DummyData)
+    for _ in range(100):
+        if batch.completed == 4:
+            break
+        threading.Event().wait(0.05)
+    assert batch.completed == 4
+    assert sorted(started) == [0, 1, 2, 3, 4]
+    release.set()
+    for _ in range(100):
+        if batch.state != batch_mod.BATCH_RUNNING:
+            break
+        threading.Event().wait(0.05)
+    queue.stop(timeout=5)
+    assert batch.completed == 5
+
+
+def test_batch_jobs_are_not_debounced():
+    queue = JobQueue(lambda data: RESULT_SYNCED, workers=2, max_size=10, debounce=5)
+    queue.start()
+    runner = batch_mod.BatchRunner(queue, concurrency=2)
+    started = time.monotonic()
+    batch = runner.start_batch(range(6), DummyData)
+    for _ in range(100):
+        if batch.state != batch_mod.BATCH_RUNNING:
+            break
+        threading.Event().wait(0.05)
+    queue.stop(timeout=5)
+    assert batch.completed == 6
+    assert time.monotonic() - started < 2
+
+
+def test_batch_jobs_use_batch_retry_reasons():
+    def handler(data):
+        if data.media_id == 1:
+            set_reason(REASON_NO_SUBTITLE)
+            return RESULT_FAILED
+        return RESULT_SYNCED
+
+    # Queue retries no-subtitle failures after a long backoff; the batch does not
+    queue = JobQueue(handler, workers=1, max_size=10, retry_reasons=(REASON_NO_SUBTITLE,), max_retries=3,
+                     retry_backoff=30)
+    queue.start()
+    runner = batch_mod.BatchRunner(queue, concurrency=1, retry_reasons=(REASON_PLEX_LOOKUP_FAILED,))
+    batch = runner.start_batch(range(3), DummyData)
+    for _ in range(100):
+        if batch.state != batch_mod.BATCH_RUNNING:
+            break
+        threading.Event().wait(0.05)
+    queue.stop(timeout=5)
+    assert batch.state == BATCH_FINISHED
+    assert batch.results == {RESULT_SYNCED: 2, RESULT_FAILED: 1}
+
+
+def test_batch_expansion_error_marks_failed():
+    def keys():
+        yield 1
+        raise RuntimeError("Plex unreachable")
+
+    queue = JobQueue(lambda data: RESULT_SYNCED, workers=1, max_size=10)
+    queue.start()
+    runner = batch_mod.BatchRunner(queue, concurrency=2)
+    batch = runner.start_batch(keys(), DummyData)
+    for _ in range(100):
+        if batch.state != batch_mod.BATCH_RUNNING:
+            break
+        threading.Event().wait(0.05)
+    queue.stop(timeout=5)
+    assert batch.state == BATCH_FAILED
+    assert batch.completed == 1
+    assert "Plex unreachable" in batch.error
+
+
+def test_expand_batch_keys(monkeypatch):
+    monkeypatch.setattr(batch_mod, 'iter_leaf_rating_keys', lambda key: iter([key * 10, key * 10 + 1]))
+    monkeypatch.setattr(batch_mod, 'iter_section_rating_keys', lambda section: iter([section * 100]))
+    keys = batch_mod.expand_batch_keys([1, 2], [3], [4])
+    assert list(keys) == [1, 2, 30, 31, 400]
@@ -0,0 +1,65 @@
+import os
+
+import subsync_plex.dir_index as dir_index
+
+
+def make_dir(tmp_path, names, age=10):
+    for name in names:
+        (tmp_path / name).write_text('')
+    # Move the directory mtime out of the racy window so listings are trusted
+    past = os.stat(tmp_path).st_mtime - age
+    os.utime(tmp_path, (past, past))
+    return str(tmp_path)
+
+
+def test_listing_groups_subtitles_by_stem(tmp_path):
+    path = make_dir(tmp_path, ["video.mkv", "video.en.srt", "video.en.forced.SRT", "video2.es.srt", "other.srt"])
+    listing = dir_index.DirectoryIndex().listing(path)
+    assert listing.subtitles_for("video") == [
+        ("video.en.forced.SRT", ["en", "forced"]),
+        ("video.en.srt", ["en"]),
+        ("video2.es.srt", ["2", "es"]),
+    ]
+    assert listing.subtitles_for("other") == [("other.srt", [])]
+    assert listing.subtitles_for("missing") == []
+
+
+def test_listing_is_cached_until_mtime_changes(tmp_path, monkeypatch):
+    path = make_dir(tmp_path, ["video.en.srt"])
+    index = dir_index.DirectoryIndex()
+    scans = []
+    original_scan = dir_index.DirectoryIndex._scan
+
+    def counting_scan(path, mtime_ns):
+        scans.append(path)
+        return original_scan(path, mtime_ns)
+
+    monkeypatch.setattr(dir_index.DirectoryIndex, '_scan', staticmethod(counting_scan))
+    first = index.listing(path)
+    assert index.listing(path) is first
+    assert len(scans) == 1
+    make_dir(tmp_path, ["video.es.srt"], age=5)
+    second = index.listing(path)
+    assert len(scans) == 2
+    assert [name for name, _ in second.subtitles_for("video")] == ["video.en.srt", "video.es.srt"]
+
+
+def test_recently_modified_directory_is_rescanned(tmp_path):
+    (tmp_path / "video.en.srt").write_text('')
+    index = dir_index.DirectoryIndex()
+    first = index.listing(str(tmp_path))
+    assert index.listing(str(tmp_path)) is not first
+
+
+def test_missing_directory_and_eviction(tmp_path):
+    index = dir_index.DirectoryIndex(max_size=1)
+    assert index.listing(str(tmp_path / "missing")) is None
+    a = tmp_path / "a"
+    b = tmp_path / "b"
+    a.mkdir()
+    b.mkdir()
+    make_dir(a, [])
+    make_dir(b, [])
+    index.listing(str(a))
+    index.listing(str(b))
+    assert list(index._listings) == [str(b)]
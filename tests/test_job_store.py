@@ -0,0 +1,86 @@
+import time
+
+import pytest
+
+from subsync_plex.config import JOB_FAILED, JOB_FINISHED, JOB_QUEUED, RESULT_FAILED, RESULT_SYNCED
+from subsync_plex.job_store import JobStore
+from subsync_plex.jobs import Job, JobQueue
+
+
+class DummyData:
+    def __init__(self, media_id):
+        self.media_id = media_id
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.db"), flush_interval=60)
+    assert store.open()
+    yield store
+    store.close()
+
+
+def test_unfinished_jobs_are_recovered(store, tmp_path):
+    queued = Job({"media_id": 1}, attempts=2, not_before=123.0)
+    done = Job({"media_id": 2}, state=JOB_FINISHED)
+    store.record(queued)
+    store.record(done)
+    store.close()
+    reopened = JobStore(str(tmp_path / "jobs.db"))
+    assert reopened.open()
+    assert reopened.unfinished() == [(queued.id, {"media_id": 1}, 2, 123.0)]
+    reopened.discard(queued.id)
+    assert reopened.unfinished() == []
+    reopened.close()
+
+
+def test_latest_state_wins_within_a_flush(store):
+    job = Job({"media_id": 1})
+    store.record(job)
+    job.state = JOB_FAILED
+    store.record(job)
+    store.flush()
+    assert store.unfinished() == []
+
+
+def test_compact_removes_expired_finished_jobs(store):
+    old = Job({"media_id": 1}, state=JOB_FINISHED)
+    pending = Job({"media_id": 2}, state=JOB_QUEUED)
+    store.record(old)
+    store.record(pending)
+    store.flush()
+    store.retention = -1
+    assert store.compact() == 1
+    assert [row[0] for row in store.unfinished()] == [pending.id]
+
+
+def test_queue_journals_and_retries_transient_failures(store):
+    results = [RESULT_FAILED, RESULT_SYNCED]
+
+    def handler(data):
+        return results.pop(0)
+
+    queue = JobQueue(handler, workers=1, max_size=10, journal=store,
+                     retry_reasons=(RESULT_FAILED,), max_retries=1, retry_backoff=0.05)
+    queue.start()
+    job = queue.submit(DummyData(5))
+    assert job.wait(5)
+    queue.stop()
+    assert job.state == JOB_FINISHED
+    assert job.attempts == 1
+    store.flush()
+    assert store.unfinished() == []
+
+
+def test_retries_stop_after_max_retries():
+    calls = []
+    queue = JobQueue(lambda data: calls.append(data) or RESULT_FAILED, workers=1, max_size=10,
+                     retry_reasons=(RESULT_FAILED,), max_retries=2, retry_backoff=0.01)
+    queue.start()
+    start = time.time()
+    job = queue.submit(DummyData(6))
+    assert job.wait(5)
+    queue.stop()
+    assert job.state == JOB_FAILED
+    assert len(calls) == 3
+    assert time.time() - start >= 0.03
@@ -0,0 +1,140 @@
+import threading
+
+import pytest
+
+import subsync_plex.jobs as jobs
+from subsync_plex.config import RESULT_SYNCED, RESULT_FAILED
+
+
+class DummyData:
+    def __init__(self, media_id):
+        self.media_id = media_id
+
+
+def test_submit_and_run():
+    results = []
+    queue = jobs.JobQueue(lambda data: results.append(data.media_id) or RESULT_SYNCED, workers=1, max_size=5)
+    queue.start()
+    job = queue.submit(DummyData(1))
+    assert queue.join(timeout=5)
+    queue.stop(timeout=5)
+    assert results == [1]
+    assert job.state == jobs.JOB_FINISHED
+    assert job.result == RESULT_SYNCED
+    assert job.queue_wait is not None and job.duration is not None
+    assert queue.get(job.id) is job
+
+
+def test_failed_result_and_exception():
+    def handler(data):
+        if data.media_id == 1:
+            return RESULT_FAILED
+        raise RuntimeError("boom")
+
+    queue = jobs.JobQueue(handler, workers=1, max_size=5)
+    queue.start()
+    failed = queue.submit(DummyData(1))
+    raised = queue.submit(DummyData(2))
+    assert queue.join(timeout=5)
+    queue.stop(timeout=5)
+    assert failed.state == jobs.JOB_FAILED
+    assert raised.state == jobs.JOB_FAILED
+    assert raised.error == "boom"
+
+
+def test_queue_full_and_position():
+    queue = jobs.JobQueue(lambda data: None, workers=1, max_size=2)
+    first = queue.submit(DummyData(1))
+    second = queue.submit(DummyData(2))
+    assert queue.position(first) == 1
+    assert queue.position(second) == 2
+    with pytest.raises(jobs.QueueFullError):
+        queue.submit(DummyData(3))
+
+
+def test_workers_limit_concurrency():
+    lock = threading.Lock()
+    running = [0]
+    peak = [0]
+    release = threading.Event()
+
+    def handler(data):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        release.wait(5)
+        with lock:
+            running[0] -= 1
+
+    queue = jobs.JobQueue(handler, workers=2, max_size=10)
+    queue.start()
+    submitted = [queue.submit(DummyData(i)) for i in range(6)]
+    release.set()
+    assert queue.join(timeout=5)
+    queue.stop(timeout=5)
+    assert peak[0] <= 2
+    assert all(job.state == jobs.JOB_FINISHED for job in submitted)
+
+
+def test_duplicates_coalesce_while_queued():
+    queue = jobs.JobQueue(lambda data: RESULT_SYNCED, workers=1, max_size=5,
+                          key_func=lambda data: data.media_id, debounce=60)
+    first = queue.submit(DummyData(1))
+    second = queue.submit(DummyData(1))
+    other = queue.submit(DummyData(2))
+    assert second is first
+    assert first.coalesced == 1
+    assert other is not first
+    assert queue.pending_count() == 2
+
+
+def test_debounce_delays_start_and_recent_jobs_coalesce():
+    calls = []
+    queue = jobs.JobQueue(lambda data: calls.append(data.media_id) or RESULT_SYNCED, workers=1, max_size=5,
+                          key_func=lambda data: data.media_id, debounce=0.2)
+    queue.start()
+    job = queue.submit(DummyData(1))
+    assert job.state == jobs.JOB_QUEUED
+    assert queue.submit(DummyData(1)) is job
+    assert queue.join(timeout=5)
+    # A duplicate arriving right after the run finished is still coalesced
+    assert queue.submit(DummyData(1)) is job
+    queue.stop(timeout=5)
+    assert calls == [1]
+    assert job.coalesced == 2
+    assert job.started_at - job.submitted_at >= 0.2
+    # The debounce is not counted as waiting for a worker
+    assert job.queue_wait < 0.2
+
+
+def test_duplicate_after_debounce_window_runs_again():
+    queue = jobs.JobQueue(lambda data: RESULT_SYNCED, workers=1, max_size=5,
+                          key_func=lambda data: data.media_id, debounce=0)
+    queue.start()
+    first = queue.submit(DummyData(1))
+    assert queue.join(timeout=5)
+    second = queue.submit(DummyData(1))
+    assert queue.join(timeout=5)
+    queue.stop(timeout=5)
+    assert second is not first
+    assert second.state == jobs.JOB_FINISHED
+
+
+def test_deferred_job_is_requeued_without_an_attempt():
+    calls = []
+
+    def handler(data):
+        calls.append(data.media_id)
+        if len(calls) == 1:
+            raise jobs.JobDeferred("mount-busy", 0.1)
+        return RESULT_SYNCED
+
+    queue = jobs.JobQueue(handler, workers=1, max_size=5)
+    queue.start()
+    job = queue.submit(DummyData(1))
+    assert job.wait(timeout=5)
+    queue.stop(timeout=5)
+    assert calls == [1, 1]
+    assert job.state == jobs.JOB_FINISHED
+    assert job.attempts == 0
+    assert job.started_at - job.submitted_at >= 0.1
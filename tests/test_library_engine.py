@@ -0,0 +1,97 @@
+import time
+
+import pytest
+
+import subsync_plex.library_engine as library_engine
+
+FAKE_SUBSYNC = '''
+import os
+import sys
+import time
+
+from subsync.synchro.dictionary import loadDictionary
+
+def subsync():
+    args = sys.argv[1:]
+    loadDictionary("en", "es", minLen=2)
+    if "--sleep" in args:
+        time.sleep(30)
+    print("pid", os.getpid(), "args", " ".join(args))
+    print("[+] done, 120 points, correlation=99.50%")
+    if "--fail" in args:
+        sys.exit(2)
+'''
+
+FAKE_DICTIONARY = '''
+loads = []
+
+def loadDictionary(lang1, lang2, minLen=0):
+    loads.append((lang1, lang2))
+    print("dictionary loads", len(loads))
+    return object()
+'''
+
+
+@pytest.fixture
+def fake_subsync(tmp_path, monkeypatch):
+    package = tmp_path / 'subsync'
+    package.mkdir()
+    (package / '__init__.py').write_text('')
+    (package / '__main__.py').write_text(FAKE_SUBSYNC)
+    (package / 'synchro').mkdir()
+    (package / 'synchro' / '__init__.py').write_text('')
+    (package / 'synchro' / 'dictionary.py').write_text(FAKE_DICTIONARY)
+    # Spawned workers inherit the parent's sys.path
+    monkeypatch.syspath_prepend(str(tmp_path))
+    return tmp_path
+
+
+def test_workers_are_reused(fake_subsync):
+    pool = library_engine.LibraryEnginePool(1)
+    try:
+        first = pool.run(['--cli', 'sync'], timeout=60)
+        second = pool.run(['--fail'], timeout=60)
+    finally:
+        pool.shutdown()
+    assert first[0] == 0 and not first[2]
+    assert 'correlation=99.50%' in first[1]
+    assert second[0] == 2
+    # The same worker process served both jobs, loading the dictionary once
+    assert first[1].split('pid ')[1].split()[0] == second[1].split('pid ')[1].split()[0]
+    assert 'dictionary loads 1' in first[1]
+    assert 'dictionary loads' not in second[1]
+
+
+def test_memoize_caches_by_arguments():
+    calls = []
+    load = library_engine._memoize(lambda lang, minLen=0: calls.append(lang) or [lang])
+    assert load('en') is load('en')
+    load('es', minLen=2)
+    load(['unhashable'])
+    load(['unhashable'])
+    assert calls == ['en', 'es', ['unhashable'], ['unhashable']]
+
+
+def test_timeout_kills_and_replaces_worker(fake_subsync):
+    pool = library_engine.LibraryEnginePool(1)
+    try:
+        started = time.monotonic()
+        assert pool.run(['--sleep'], timeout=1) == (None, '', True)
+        assert time.monotonic() - started < 20
+        returncode, output, timed_out = pool.run(['ok'], timeout=60)
+    finally:
+        pool.shutdown()
+    assert returncode == 0 and not timed_out
+
+
+def test_unavailable_without_subsync(tmp_path, monkeypatch):
+    # Shadow any installed subsync with a package that fails to import
+    (tmp_path / 'subsync').mkdir()
+    (tmp_path / 'subsync' / '__init__.py').write_text('raise ImportError("not installed")')
+    monkeypatch.syspath_prepend(str(tmp_path))
+    pool = library_engine.LibraryEnginePool(1)
+    try:
+        assert pool.run(['--cli'], timeout=60) is None
+        assert not pool.available
+    finally:
+        pool.shutdown()
@@ -0,0 +1,97 @@
+import os
+
+import pytest
+
+import subsync_plex.library_scanner as scanner
+import subsync_plex.sync_cache as sync_cache
+from subsync_plex.dir_index import directory_index
+
+
+@pytest.fixture(autouse=True)
+def patch_paths(tmp_path, monkeypatch):
+    library = tmp_path / 'library'
+    library.mkdir()
+    age(library)
+    monkeypatch.setattr(scanner, 'PLEX_LIBRARY_DIR', str(library))
+    monkeypatch.setattr(scanner, 'LIBRARY_INDEX_PATH', str(tmp_path / 'library_index.db'))
+    monkeypatch.setattr(scanner, '_conn', None)
+    monkeypatch.setattr(sync_cache, 'SYNC_CACHE_PATH', str(tmp_path / 'sync_cache.db'))
+    monkeypatch.setattr(sync_cache, '_conn', None)
+    directory_index.clear()
+    yield library
+    directory_index.clear()
+
+
+def age(path, seconds=10):
+    past = os.stat(path).st_mtime - seconds
+    os.utime(path, (past, past))
+
+
+def create_files(root, directory, filenames, seconds=10):
+    dir_path = root / directory
+    created = [p for p in [dir_path, *dir_path.parents] if not p.exists()]
+    dir_path.mkdir(parents=True, exist_ok=True)
+    for name in filenames:
+        (dir_path / name).write_text('')
+    # Age the changed directories so the scan trusts their mtimes
+    for path in {dir_path, *created, *(p.parent for p in created)}:
+        age(path, seconds)
+    return dir_path
+
+
+def test_scan_indexes_videos_and_subtitles(patch_paths):
+    create_files(patch_paths, 'movies/Movie (2020)', ['Movie.mkv', 'Movie.en.srt', 'Movie.eng.forced.srt', 'notes.txt'])
+    create_files(patch_paths, 'tv/Show/Season 1', ['s01e01.mkv', 's01e01.es.srt', 's01e02.mkv'])
+    create_files(patch_paths, 'tv/.grab', ['hidden.mkv'])
+    result = scanner.scan_library(workers=2)
+    assert result.videos == 3
+    assert result.subtitles == 3
+    assert result.rescanned == result.directories == 6
+    entries = scanner.load_entries()
+    entry = entries[str(patch_paths / 'movies' / 'Movie (2020)')]
+    assert entry.videos == ['Movie.mkv']
+    assert [name for name, _ in entry.subtitles] == ['Movie.en.srt', 'Movie.eng.forced.srt']
+
+
+def test_rescan_is_incremental(patch_paths):
+    create_files(patch_paths, 'movies/A', ['A.mkv', 'A.en.srt'])
+    create_files(patch_paths, 'movies/B', ['B.mkv'])
+    scanner.scan_library()
+    create_files(patch_paths, 'movies/B', ['B.en.srt'], seconds=5)
+    result = scanner.scan_library()
+    assert result.rescanned == 1
+    assert result.subtitles == 2
+    (patch_paths / 'movies' / 'A' / 'A.en.srt').unlink()
+    (patch_paths / 'movies' / 'A' / 'A.mkv').unlink()
+    (patch_paths / 'movies' / 'A').rmdir()
+    age(patch_paths / 'movies', 3)
+    result = scanner.scan_library()
+    assert result.removed == 1
+    assert str(patch_paths / 'movies' / 'A') not in scanner.load_entries()
+
+
+def test_scan_primes_directory_index(patch_paths, monkeypatch):
+    dir_path = create_files(patch_paths, 'movies/A', ['A.mkv', 'A.en.srt'])
+    scanner.scan_library()
+    directory_index.clear()
+    assert scanner.load_library_index() == 3
+
+    def fail_scan(path, mtime_ns):
+        raise AssertionError("directory should be served from the index")
+
+    monkeypatch.setattr(type(directory_index), '_scan', staticmethod(fail_scan))
+    listing = directory_index.listing(str(dir_path))
+    assert listing.subtitles_for('A') == [('A.en.srt', ['en'])]
+
+
+def test_find_unsynced(patch_paths):
+    dir_path = create_files(patch_paths, 'movies/A', ['A.mkv', 'A.en.srt', 'A.spa.forced.srt', 'A.srt', 'B.en.srt'])
+    scanner.scan_library()
+    video = str(dir_path / 'A.mkv')
+    sync_cache.record_sync(video, str(dir_path / 'A.en.srt'), 'en', 'en', 'input', 2e9)
+    unsynced = {item['subtitle']: item for item in scanner.find_unsynced()}
+    assert set(unsynced) == {str(dir_path / 'A.spa.forced.srt'), str(dir_path / 'A.srt')}
+    forced = unsynced[str(dir_path / 'A.spa.forced.srt')]
+    assert forced['video'] == os.path.join('movies', 'A', 'A.mkv')
+    assert forced['language'] == 'es' and forced['forced']
+    assert unsynced[str(dir_path / 'A.srt')]['language'] is None
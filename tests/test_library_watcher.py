@@ -0,0 +1,30 @@
+import subsync_plex.library_watcher as watcher
+
+
+def touch(path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text('')
+    return path
+
+
+def test_video_for_subtitle_prefers_longest_stem(tmp_path):
+    touch(tmp_path / 'Movie.mkv')
+    touch(tmp_path / 'Movie 2.mkv')
+    srt = touch(tmp_path / 'Movie 2.en.forced.srt')
+    assert watcher.video_for_subtitle(str(srt)) == (str(tmp_path / 'Movie 2.mkv'), ['en', 'forced'])
+    assert watcher.video_for_subtitle(str(touch(tmp_path / 'Other.en.srt'))) is None
+
+
+def test_handle_subtitle_submits_sync(tmp_path, monkeypatch):
+    touch(tmp_path / 'Movie.mkv')
+    monkeypatch.setattr(watcher.path_index, 'lookup', lambda path: 42 if path.endswith('Movie.mkv') else None)
+    submitted = []
+    submit = lambda media_id, sub_lang: submitted.append((media_id, sub_lang))
+    assert watcher.handle_subtitle(str(touch(tmp_path / 'Movie.spa.srt')), submit)
+    assert watcher.handle_subtitle(str(touch(tmp_path / 'Movie.ger.ass')), submit)
+    # Forced, untagged, hidden attempt files and other extensions are ignored
+    assert not watcher.handle_subtitle(str(touch(tmp_path / 'Movie.en.forced.srt')), submit)
+    assert not watcher.handle_subtitle(str(touch(tmp_path / 'Movie.srt')), submit)
+    assert not watcher.handle_subtitle(str(touch(tmp_path / '.Movie.en.subsync-0.2.srt')), submit)
+    assert not watcher.handle_subtitle(str(touch(tmp_path / 'Movie.en.nfo')), submit)
+    assert submitted == [(42, 'es'), (42, 'de')]
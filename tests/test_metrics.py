@@ -0,0 +1,81 @@
+import json
+
+import subsync_plex.metrics as metrics
+from subsync_plex.config import RESULT_FAILED, RESULT_SYNCED
+from subsync_plex.jobs import JobQueue
+
+
+class DummyData:
+    def __init__(self, media_id):
+        self.media_id = media_id
+
+
+def test_timed_accumulates_stage_durations():
+    before = metrics.PLEX_LOOKUP_SECONDS._sum.get()
+    with metrics.job_context("job1") as context:
+        with metrics.timed("plex_lookup", metrics.PLEX_LOOKUP_SECONDS):
+            pass
+        with metrics.timed("plex_lookup", metrics.PLEX_LOOKUP_SECONDS):
+            pass
+        metrics.set_reason(metrics.REASON_NO_SUBTITLE)
+        metrics.set_reason(metrics.REASON_SUBSYNC_FAILED)
+    assert list(context.stages) == ["plex_lookup"]
+    assert context.reason == metrics.REASON_NO_SUBTITLE
+    assert metrics.PLEX_LOOKUP_SECONDS._sum.get() >= before
+    assert metrics.current_job() is None
+
+
+def test_job_records_reason_stages_and_outcome(capsys):
+    def handler(data):
+        with metrics.timed("subtitle_search", metrics.SUBTITLE_SEARCH_SECONDS):
+            pass
+        metrics.set_reason(metrics.REASON_NO_SUBTITLE)
+        return RESULT_FAILED
+
+    counter = metrics.JOBS_TOTAL.labels(result=RESULT_FAILED, reason=metrics.REASON_NO_SUBTITLE)
+    before = counter._value.get()
+    queue = JobQueue(handler, workers=1, max_size=10)
+    queue.start()
+    job = queue.submit(DummyData(7))
+    assert job.wait(5)
+    queue.stop()
+    assert job.reason == metrics.REASON_NO_SUBTITLE
+    assert "subtitle_search" in job.to_dict()["stages"]
+    assert counter._value.get() == before + 1
+    assert metrics.JOBS_IN_FLIGHT._value.get() == 0
+    events = [json.loads(line) for line in capsys.readouterr().out.splitlines() if line.startswith("{")]
+    assert [e["event"] for e in events] == ["job-started", "job-finished"]
+    assert all(e["job_id"] == job.id for e in events)
+    assert events[1]["reason"] == metrics.REASON_NO_SUBTITLE
+
+
+def test_successful_job_reason_is_result():
+    queue = JobQueue(lambda data: RESULT_SYNCED, workers=1, max_size=10)
+    queue.start()
+    job = queue.submit(DummyData(8))
+    assert job.wait(5)
+    queue.stop()
+    assert job.reason == RESULT_SYNCED
+
+
+def test_retried_job_counts_and_reports_only_its_final_outcome():
+    reported = []
+
+    def handler(data):
+        metrics.set_reason(metrics.REASON_NO_SUBTITLE)
+        metrics.when_final(lambda: reported.append(metrics.current_job().attempt))
+        return RESULT_FAILED
+
+    counter = metrics.JOBS_TOTAL.labels(result=RESULT_FAILED, reason=metrics.REASON_NO_SUBTITLE)
+    before = counter._value.get()
+    queue = JobQueue(handler, workers=1, max_size=10, retry_reasons=(metrics.REASON_NO_SUBTITLE,),
+                     max_retries=2, retry_backoff=0.1)
+    queue.start()
+    job = queue.submit(DummyData(9))
+    assert job.wait(5)
+    queue.stop()
+    assert job.attempts == 2
+    assert counter._value.get() == before + 1
+    assert reported == [2]
+    # Queue wait is measured from the end of the last backoff (0.2s)
+    assert job.queue_wait < 0.1
@@ -13,20 +13,66 @@ class DummyResponse:
             raise self._raise_exc
 
 
-def test_send_notification_success(monkeypatch, capsys):
+@pytest.fixture(autouse=True)
+def webhook(monkeypatch):
     monkeypatch.setattr(notifier, 'HOME_ASSISTANT_WEBHOOK_URL', 'http://example.com/webhook')
-    monkeypatch.setattr(requests, 'post', lambda url, json: DummyResponse())
+    monkeypatch.setattr(notifier, 'NOTIFY_BACKOFF', 0)
+
+
+def test_send_notification_success(monkeypatch, capsys):
+    sent = []
+    monkeypatch.setattr(notifier._session, 'post', lambda url, json, timeout: sent.append(json) or DummyResponse())
     notifier.send_home_assistant_notification('stage', 'message', 1, 'entity')
+    assert notifier.flush_notifications(timeout=5)
     captured = capsys.readouterr()
     assert 'Home Assistant webhook sent successfully.' in captured.out
+    assert sent == [{'stage': 'stage', 'message': 'message', 'media_id': 1, 'entity_id': 'entity'}]
 
 
 def test_send_notification_failure(monkeypatch, capsys):
-    monkeypatch.setattr(notifier, 'HOME_ASSISTANT_WEBHOOK_URL', 'http://example.com/webhook')
-    def dummy_post(url, json):
+    attempts = []
+    def dummy_post(url, json, timeout):
+        attempts.append(json)
         return DummyResponse(raise_exc=requests.RequestException('fail'))
 
-    monkeypatch.setattr(requests, 'post', dummy_post)
+    monkeypatch.setattr(notifier._session, 'post', dummy_post)
     notifier.send_home_assistant_notification('stage', 'message', 2, 'entity2')
+    assert notifier.flush_notifications(timeout=5)
     captured = capsys.readouterr()
-    assert 'Failed to send Home Assistant webhook' in captured.out
\ No newline at end of file
+    assert 'Failed to send Home Assistant webhook' in captured.out
+    assert len(attempts) == notifier.NOTIFY_RETRIES + 1
+
+
+def test_deliver_does_not_retry_client_errors(monkeypatch):
+    attempts = []
+    def dummy_post(url, json, timeout):
+        attempts.append(json)
+        response = requests.Response()
+        response.status_code = 404
+        return DummyResponse(raise_exc=requests.HTTPError('not found', response=response))
+
+    monkeypatch.setattr(notifier._session, 'post', dummy_post)
+    assert notifier.deliver({'stage': 'stage'}) is False
+    assert len(attempts) == 1
+
+
+def test_batch_notifications_are_coalesced(monkeypatch):
+    sent = []
+    monkeypatch.setattr(notifier, 'NOTIFY_BATCH_SIZE', 2)
+    monkeypatch.setattr(notifier._session, 'post', lambda url, json, timeout: sent.append(json) or DummyResponse())
+    notifier.send_home_assistant_notification(notifier.STAGE_SYNC_START, 'started', 1, 'entity', batch_id='b1')
+    notifier.send_home_assistant_notification('sync-success', 'ok', 1, 'entity', batch_id='b1')
+    notifier.send_home_assistant_notification('sync-failed', 'bad', 2, 'entity', batch_id='b1')
+    notifier.send_home_assistant_notification('sync-success', 'ok', 3, 'entity', batch_id='b1')
+    assert notifier.flush_notifications(timeout=5)
+    # One summary per two finished syncs, the remainder flushed; start notifications are dropped
+    assert [s['stage'] for s in sent] == [notifier.STAGE_SYNC_BATCH, notifier.STAGE_SYNC_BATCH]
+    assert sent[0]['counts'] == {'sync-success': 1, 'sync-failed': 1}
+    assert [item['media_id'] for item in sent[1]['items']] == [3]
+
+
+def test_notification_skipped_without_webhook(monkeypatch):
+    monkeypatch.setattr(notifier, 'HOME_ASSISTANT_WEBHOOK_URL', None)
+    monkeypatch.setattr(notifier._session, 'post', lambda *args, **kwargs: pytest.fail('should not post'))
+    notifier.send_home_assistant_notification('stage', 'message', 1, 'entity')
+    assert notifier.flush_notifications(timeout=5)
@@ -14,10 +14,26 @@ class DummyResponse:
             raise self._raise_exc
 
 
+@pytest.fixture(autouse=True)
+def clear_cache():
+    plex_api.clear_plex_cache()
+    yield
+    plex_api.clear_plex_cache()
+
+
+def patch_get(monkeypatch, dummy, calls=None):
+    def fake_get(url, params=None, timeout=None):
+        if calls is not None:
+            calls.append(url)
+        return dummy
+
+    monkeypatch.setattr(plex_api._session, 'get', fake_get)
+
+
 def test_get_plex_file_path_success(monkeypatch):
     xml = '<MediaContainer><Video><Part file="/media/movie.mp4"/></Video></MediaContainer>'
     dummy = DummyResponse(text=xml)
-    monkeypatch.setattr(requests, 'get', lambda url: dummy)
+    patch_get(monkeypatch, dummy)
     path = plex_api.get_plex_file_path(123)
     assert path == "/media/movie.mp4"
 
@@ -25,7 +41,7 @@ def test_get_plex_file_path_success(monkeypatch):
 def test_get_plex_file_path_failure(monkeypatch, capsys):
     err = requests.RequestException("bad request")
     dummy = DummyResponse(text='', raise_exc=err)
-    monkeypatch.setattr(requests, 'get', lambda url: dummy)
+    patch_get(monkeypatch, dummy)
     path = plex_api.get_plex_file_path(456)
     assert path is None
     captured = capsys.readouterr()
@@ -35,7 +51,7 @@ def test_get_plex_file_path_failure(monkeypatch, capsys):
 def test_get_plex_media_title_video(monkeypatch):
     xml = '<MediaContainer><Video title="Test Movie"/></MediaContainer>'
     dummy = DummyResponse(text=xml)
-    monkeypatch.setattr(requests, 'get', lambda url: dummy)
+    patch_get(monkeypatch, dummy)
     title = plex_api.get_plex_media_title(123)
     assert title == "Test Movie"
 
@@ -43,14 +59,94 @@ def test_get_plex_media_title_video(monkeypatch):
 def test_get_plex_media_title_directory(monkeypatch):
     xml = '<MediaContainer><Directory title="Test Folder"/></MediaContainer>'
     dummy = DummyResponse(text=xml)
-    monkeypatch.setattr(requests, 'get', lambda url: dummy)
+    patch_get(monkeypatch, dummy)
     title = plex_api.get_plex_media_title(789)
     assert title == "Test Folder"
 
 
 def test_get_plex_media_title_none(monkeypatch, capsys):
-    monkeypatch.setattr(requests, 'get', lambda url: DummyResponse(text='<bad>'))
+    patch_get(monkeypatch, DummyResponse(text='<bad>'))
     title = plex_api.get_plex_media_title(0)
     assert title is None
     captured = capsys.readouterr()
-    assert "Error getting Plex media title" in captured.out
\ No newline at end of file
+    assert "Error getting Plex metadata" in captured.out
+
+
+def test_get_plex_metadata_record(monkeypatch):
+    xml = (
+        '<MediaContainer><Video ratingKey="5" type="episode" title="Pilot" duration="1800000">'
+        '<Media><Part file="/tv/show/s01e01.mkv" duration="1800000">'
+        '<Stream id="1" streamType="1" index="0" codec="h264"/>'
+        '<Stream id="2" streamType="2" index="1" codec="aac" languageCode="eng" languageTag="en"/>'
+        '<Stream id="3" streamType="3" index="2" codec="subrip" languageCode="spa" forced="1"/>'
+        '<Stream id="4" streamType="3" codec="srt" languageCode="eng" key="/library/streams/4"/>'
+        '</Part></Media></Video></MediaContainer>'
+    )
+    patch_get(monkeypatch, DummyResponse(text=xml))
+    metadata = plex_api.get_plex_metadata(5)
+    assert metadata.title == "Pilot"
+    assert metadata.type == "episode"
+    assert metadata.duration == 1800000
+    assert metadata.files == ["/tv/show/s01e01.mkv"]
+    assert metadata.audio_languages == ["eng"]
+    assert metadata.subtitle_languages == ["spa", "eng"]
+    streams = metadata.parts[0].streams
+    assert streams[2].forced and streams[3].key == "/library/streams/4"
+
+
+def test_get_plex_metadata_is_cached(monkeypatch):
+    xml = '<MediaContainer><Video title="Cached"><Part file="/m.mkv"/></Video></MediaContainer>'
+    calls = []
+    patch_get(monkeypatch, DummyResponse(text=xml), calls)
+    assert plex_api.get_plex_file_path(7) == "/m.mkv"
+    assert plex_api.get_plex_media_title(7) == "Cached"
+    assert len(calls) == 1
+    plex_api.get_plex_metadata(8)
+    assert len(calls) == 2
+
+
+def test_get_plex_metadata_cache_expires(monkeypatch):
+    xml = '<MediaContainer><Video title="Cached"/></MediaContainer>'
+    calls = []
+    patch_get(monkeypatch, DummyResponse(text=xml), calls)
+    monkeypatch.setattr(plex_api, 'PLEX_CACHE_TTL', 0)
+    plex_api.get_plex_metadata(7)
+    plex_api.get_plex_metadata(7)
+    assert len(calls) == 2
+
+
+def test_get_plex_metadata_cache_evicts_oldest(monkeypatch):
+    xml = '<MediaContainer><Video title="Cached"/></MediaContainer>'
+    calls = []
+    patch_get(monkeypatch, DummyResponse(text=xml), calls)
+    monkeypatch.setattr(plex_api, 'PLEX_CACHE_SIZE', 2)
+    for key in (1, 2, 1, 3, 1, 2):
+        plex_api.get_plex_metadata(key)
+    # 2 was the least recently used entry when 3 was added
+    assert len(calls) == 4
+
+
+def test_iter_section_rating_keys_pages_and_expands(monkeypatch):
+    pages = {
+        ("/library/sections/1/all", 0): '<MediaContainer totalSize="3">'
+            '<Video ratingKey="1" type="movie"/><Directory ratingKey="2" type="show"/></MediaContainer>',
+        ("/library/sections/1/all", 2): '<MediaContainer totalSize="3">'
+            '<Video ratingKey="3" type="movie"/></MediaContainer>',
+        ("/library/metadata/2/allLeaves", 0): '<MediaContainer totalSize="2">'
+            '<Video ratingKey="21" type="episode"/><Video ratingKey="22" type="episode"/></MediaContainer>',
+    }
+    requested = []
+
+    def fake_get(url, params=None, timeout=None):
+        path = url[len(str(plex_api.PLEX_URL)):]
+        requested.append((path, params["X-Plex-Container-Start"], params["X-Plex-Container-Size"]))
+        return DummyResponse(text=pages[(path, params["X-Plex-Container-Start"])])
+
+    monkeypatch.setattr(plex_api._session, 'get', fake_get)
+    monkeypatch.setattr(plex_api, 'PLEX_PAGE_SIZE', 2)
+    assert list(plex_api.iter_section_rating_keys(1)) == [1, 21, 22, 3]
+    assert requested == [
+        ("/library/sections/1/all", 0, 2),
+        ("/library/metadata/2/allLeaves", 0, 2),
+        ("/library/sections/1/all", 2, 2),
+    ]
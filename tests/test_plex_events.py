@@ -0,0 +1,52 @@
+import json
+
+import pytest
+
+import subsync_plex.plex_events as events
+
+
+def webhook(event='library.new', rating_key='42', media_type='movie', section='1'):
+    return json.dumps({
+        'event': event,
+        'Metadata': {'ratingKey': rating_key, 'type': media_type, 'librarySectionID': section},
+    })
+
+
+def test_parse_webhook():
+    event = events.parse_webhook(webhook())
+    assert event == events.PlexEvent('library.new', 42, 'movie', 1)
+
+
+def test_parse_webhook_rejects_invalid_payload():
+    with pytest.raises(ValueError):
+        events.parse_webhook('not json')
+    with pytest.raises(ValueError):
+        events.parse_webhook('[]')
+
+
+def test_ignore_reason_filters_events_types_and_sections(monkeypatch):
+    monkeypatch.setattr(events, 'PLEX_WEBHOOK_SECTIONS', [1])
+    assert events.ignore_reason(events.parse_webhook(webhook())) is None
+    assert events.ignore_reason(events.parse_webhook(webhook(media_type='season'))) is None
+    assert 'event' in events.ignore_reason(events.parse_webhook(webhook(event='media.pause')))
+    assert 'media type' in events.ignore_reason(events.parse_webhook(webhook(media_type='track')))
+    assert 'section' in events.ignore_reason(events.parse_webhook(webhook(section='2')))
+    assert events.ignore_reason(events.parse_webhook(webhook(rating_key=None))) == 'no rating key'
+
+
+def test_path_index_rebuilds_on_miss_at_most_once_per_refresh(monkeypatch):
+    monkeypatch.setattr(events, 'PLEX_LIBRARY_DIR', '/media')
+    monkeypatch.setattr(events, 'get_library_sections', lambda: [(1, 'movie'), (2, 'artist')])
+    listings = []
+
+    def fake_files(section_id):
+        listings.append(section_id)
+        return iter([(7, '/movies/Movie (2020)/Movie.mkv')])
+
+    monkeypatch.setattr(events, 'iter_section_files', fake_files)
+    index = events.PathIndex(refresh=300)
+    assert index.lookup('/media/movies/Movie (2020)/Movie.mkv') == 7
+    assert index.lookup('/media/movies/Movie (2020)/Movie.mkv') == 7
+    assert index.lookup('/media/movies/Other.mkv') is None
+    # Music sections are skipped and a miss within the refresh interval does not list again
+    assert listings == [1]
@@ -0,0 +1,54 @@
+import pytest
+
+import subsync_plex.scheduling as scheduling
+from subsync_plex.jobs import JobDeferred
+
+
+def test_parse_cpus_and_ionice():
+    assert scheduling.parse_cpus("0-2, 5") == {0, 1, 2, 5}
+    assert scheduling.parse_ionice("idle") == ("3", None)
+    assert scheduling.parse_ionice("best-effort:7") == ("2", "7")
+    assert scheduling.parse_ionice("") is None
+    assert scheduling.parse_ionice("lazy") is None
+
+
+def test_priority_prefix(monkeypatch):
+    monkeypatch.setattr(scheduling, "_available", lambda tool: True)
+    monkeypatch.setattr(scheduling, "SYNC_NICE", 10)
+    monkeypatch.setattr(scheduling, "SYNC_IONICE", "idle")
+    monkeypatch.setattr(scheduling, "SYNC_CPUS", "2-3")
+    assert scheduling.priority_prefix() == ["nice", "-n", "10", "ionice", "-c", "3", "taskset", "-c", "2-3"]
+    monkeypatch.setattr(scheduling, "SYNC_NICE", 0)
+    monkeypatch.setattr(scheduling, "SYNC_IONICE", "")
+    monkeypatch.setattr(scheduling, "SYNC_CPUS", "")
+    assert scheduling.priority_prefix() == []
+
+
+def test_mount_limiter_defers_busy_mount(tmp_path, monkeypatch):
+    monkeypatch.setattr(scheduling, "PLEX_LIBRARY_DIR", str(tmp_path))
+    scheduling.mount_key.cache_clear()
+    (tmp_path / "movies").mkdir()
+    (tmp_path / "tv").mkdir()
+    limiter = scheduling.MountLimiter(1)
+    with limiter.slot("movies/Movie/Movie.mkv"):
+        # Folders on the same filesystem share the limit
+        with pytest.raises(JobDeferred) as deferred:
+            with limiter.slot("tv/Show/Season 01/Episode.mkv"):
+                pass
+        assert deferred.value.reason == scheduling.REASON_MOUNT_BUSY
+    with limiter.slot("tv/Show/Season 01/Episode.mkv"):
+        pass
+    scheduling.mount_key.cache_clear()
+
+
+def test_pause_while_transcoding_caches_sessions(monkeypatch):
+    calls = []
+    monkeypatch.setattr(scheduling, "get_transcode_count", lambda: calls.append(1) or 1)
+    monkeypatch.setattr(scheduling, "_transcode_checked", float("-inf"))
+    monkeypatch.setattr(scheduling, "PAUSE_WHILE_TRANSCODING", True)
+    for _ in range(3):
+        with pytest.raises(JobDeferred):
+            scheduling.pause_while_transcoding()
+    assert calls == [1]
+    monkeypatch.setattr(scheduling, "PAUSE_WHILE_TRANSCODING", False)
+    scheduling.pause_while_transcoding()
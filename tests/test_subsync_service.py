@@ -1,6 +1,41 @@
-import subprocess
+import os
+
+import pytest
 
 import subsync_plex.subsync_service as service
+import subsync_plex.sync_cache as sync_cache
+import subsync_plex.subtitle_backup as subtitle_backup
+from subsync_plex.plex_api import PlexMetadata, PlexPart
+from subsync_plex.subtitle_finder import SubtitleCandidate
+from subsync_plex.sync_engine import SyncAttempt
+
+
+@pytest.fixture(autouse=True)
+def patch_sync_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(sync_cache, 'SYNC_CACHE_PATH', str(tmp_path / 'sync_cache.db'))
+    monkeypatch.setattr(sync_cache, '_conn', None)
+    monkeypatch.setattr(subtitle_backup, 'SUBTITLE_BACKUP_DIR', str(tmp_path / 'backups'))
+    monkeypatch.setattr(subtitle_backup, '_conn', None)
+    monkeypatch.setattr(service, 'reference_audio', lambda video, stream: None)
+
+
+def fake_metadata(media_id):
+    part = PlexPart(file="movies/video.mp4", duration=None, streams=())
+    return PlexMetadata(rating_key=media_id, title="Test Video", type="movie", duration=None, parts=(part,))
+
+
+def fake_subtitles(monkeypatch, paths):
+    """Make {language: path} the sidecar subtitles of every video."""
+    candidates = [SubtitleCandidate(path, lang, None, False, False, 'srt', 1) for lang, path in paths.items()]
+    monkeypatch.setattr(service, 'subtitle_candidates', lambda video_file: candidates)
+
+
+def fake_sync(runs, returncode=0):
+    def sync(ref, ref_lang, sub, sub_lang, out_file, policy):
+        runs.append((ref, ref_lang, sub, sub_lang, out_file, policy))
+        return SyncAttempt(1.0, returncode, "", out_file=out_file if returncode == 0 else None)
+
+    return sync
 
 
 class DummyData:
@@ -13,12 +48,11 @@ class DummyData:
 
 def test_process_subsync_no_srt(monkeypatch, capsys):
     # Setup: no matching subtitle
-    monkeypatch.setattr(service, 'get_plex_file_path', lambda media_id: "movies/video.mp4")
-    monkeypatch.setattr(service, 'get_plex_media_title', lambda media_id: "Test Video")
-    monkeypatch.setattr(service, 'find_matching_srt', lambda video_file, lang: None)
+    monkeypatch.setattr(service, 'get_plex_metadata', fake_metadata)
+    fake_subtitles(monkeypatch, {})
     calls = []
 
-    def fake_notify(stage, message, media_id, entity_id):
+    def fake_notify(stage, message, media_id, entity_id, sub_lang=None, batch_id=None):
         calls.append((stage, message, media_id, entity_id))
 
     monkeypatch.setattr(service, 'send_home_assistant_notification', fake_notify)
@@ -34,23 +68,18 @@ def test_process_subsync_no_srt(monkeypatch, capsys):
 
 
 def test_process_subsync_success(monkeypatch):
-    monkeypatch.setattr(service, 'get_plex_file_path', lambda media_id: "movies/video.mp4")
-    monkeypatch.setattr(service, 'get_plex_media_title', lambda media_id: "Test Video")
+    monkeypatch.setattr(service, 'get_plex_metadata', fake_metadata)
     # Provide a fake subtitle path
     srt_path = "/media/movies/video.en.srt"
-    monkeypatch.setattr(service, 'find_matching_srt', lambda video_file, lang: srt_path)
+    fake_subtitles(monkeypatch, {'en': srt_path})
     calls = []
 
-    def fake_notify(stage, message, media_id, entity_id):
+    def fake_notify(stage, message, media_id, entity_id, sub_lang=None, batch_id=None):
         calls.append((stage, message, media_id, entity_id))
 
     monkeypatch.setattr(service, 'send_home_assistant_notification', fake_notify)
-    # Dummy subprocess run
-    class DummyCompleted:
-        def __init__(self):
-            self.stdout = "ok"
-
-    monkeypatch.setattr(subprocess, 'run', lambda *args, **kwargs: DummyCompleted())
+    runs = []
+    monkeypatch.setattr(service, 'sync_with_policy', fake_sync(runs))
     data = DummyData(media_id=43, entity_id='ent2', audio_lang='en', sub_lang='en')
     service.process_subsync(data)
     # Two notifications: start and finish
@@ -59,4 +88,169 @@ def test_process_subsync_success(monkeypatch):
     assert calls[1][0] == service.STAGE_SYNC_FINISHED
     # Check media_id and entity_id propagation
     assert calls[0][2] == 43 and calls[0][3] == 'ent2'
-    assert calls[1][2] == 43 and calls[1][3] == 'ent2'
\ No newline at end of file
+    assert calls[1][2] == 43 and calls[1][3] == 'ent2'
+    # Without cached audio the video itself is the reference
+    assert runs[0][0] == os.path.join(service.PLEX_LIBRARY_DIR, "movies/video.mp4")
+
+def test_sync_job_key_uses_default_languages(monkeypatch):
+    monkeypatch.setattr(service, 'DEFAULT_AUDIO_LANG', 'en')
+    monkeypatch.setattr(service, 'DEFAULT_SUB_LANG', 'es')
+    assert service.sync_job_key(DummyData(media_id=1)) == (1, 'en', 'es')
+    assert service.sync_job_key(DummyData(media_id=1, audio_lang='de', sub_lang='fr')) == (1, 'de', 'fr')
+
+
+
+def test_process_subsync_already_synced(monkeypatch):
+    monkeypatch.setattr(service, 'get_plex_metadata', fake_metadata)
+    fake_subtitles(monkeypatch, {'en': "/media/movies/video.en.srt"})
+    monkeypatch.setattr(service, 'is_already_synced', lambda *args: True)
+    calls = []
+    monkeypatch.setattr(service, 'send_home_assistant_notification', lambda *args, **kwargs: calls.append(args))
+
+    def fail_sync(*args, **kwargs):
+        raise AssertionError("subsync should not run")
+
+    monkeypatch.setattr(service, 'sync_with_policy', fail_sync)
+    result = service.process_subsync(DummyData(media_id=44, entity_id='ent3'))
+    assert result == service.RESULT_ALREADY_SYNCED
+    assert [c[0] for c in calls] == [service.STAGE_SYNC_SKIPPED]
+
+
+def test_process_subsync_plex_unavailable(monkeypatch):
+    monkeypatch.setattr(service, 'get_plex_metadata', lambda media_id: None)
+    assert service.process_subsync(DummyData(media_id=45)) == service.RESULT_FAILED
+
+
+def test_process_subsync_uses_cached_reference_audio(monkeypatch):
+    monkeypatch.setattr(service, 'get_plex_metadata', fake_metadata)
+    fake_subtitles(monkeypatch, {'en': "/media/movies/video.en.srt"})
+    monkeypatch.setattr(service, 'send_home_assistant_notification', lambda *args, **kwargs: None)
+    monkeypatch.setattr(service, 'reference_audio', lambda video, stream: "/config/audio_cache/abc.flac")
+    runs = []
+    monkeypatch.setattr(service, 'sync_with_policy', fake_sync(runs))
+    service.process_subsync(DummyData(media_id=46))
+    assert runs[0][0] == "/config/audio_cache/abc.flac"
+
+
+def test_requested_languages(monkeypatch):
+    monkeypatch.setattr(service, 'DEFAULT_SUB_LANG', 'en')
+    assert service.requested_languages(None) == ['en']
+    assert service.requested_languages('ES') == ['es']
+    assert service.requested_languages(['es', 'fr', 'es']) == ['es', 'fr']
+    assert service.requested_languages('all') is None
+    assert service.requested_languages(['es', 'all']) is None
+
+
+def test_sync_job_key_multiple_languages():
+    assert service.sync_job_key(DummyData(1, audio_lang='en', sub_lang=['fr', 'es'])) == (1, 'en', ('es', 'fr'))
+    assert service.sync_job_key(DummyData(1, audio_lang='en', sub_lang='all')) == (1, 'en', 'all')
+
+
+def test_map_plex_path(monkeypatch):
+    monkeypatch.setattr(service, 'PLEX_API_PATH_PREFIX', '\\\\server\\share\\movies')
+    assert service.map_plex_path('\\\\server\\share\\movies\\A\\A.mkv') == 'A/A.mkv'
+    assert service.map_plex_path('/other/A.mkv') == 'other/A.mkv'
+
+
+def test_process_subsync_multiple_languages_share_reference(monkeypatch):
+    monkeypatch.setattr(service, 'get_plex_metadata', fake_metadata)
+    fake_subtitles(monkeypatch, {'en': '/media/movies/video.en.srt', 'es': '/media/movies/video.es.srt'})
+    listings = []
+    monkeypatch.setattr(service, 'subtitle_candidates',
+                        lambda video_file, listed=service.subtitle_candidates: listings.append(video_file) or listed(video_file))
+    monkeypatch.setattr(service, 'is_already_synced', lambda video, srt, audio, sub: sub == 'es')
+    extractions = []
+    monkeypatch.setattr(service, 'reference_audio', lambda video, stream: extractions.append(video) or "/cache/a.flac")
+    calls = []
+    monkeypatch.setattr(service, 'send_home_assistant_notification',
+                        lambda stage, message, media_id, entity_id, sub_lang=None, batch_id=None: calls.append((stage, message, sub_lang)))
+    runs = []
+    monkeypatch.setattr(service, 'sync_with_policy', fake_sync(runs))
+    result = service.process_subsync(DummyData(media_id=47, sub_lang=['es', 'fr', 'en']))
+    # fr has no subtitle, es is already synced, en is synced
+    assert result == service.RESULT_FAILED
+    # The directory is listed and the audio decoded once for all languages
+    assert len(runs) == 1 and len(extractions) == 1 and len(listings) == 1
+    assert [(stage, lang) for stage, _, lang in calls] == [
+        (service.STAGE_SYNC_SKIPPED, 'es'),
+        (service.STAGE_SYNC_FAILED, 'fr'),
+        (service.STAGE_SYNC_START, 'en'),
+        (service.STAGE_SYNC_FINISHED, 'en'),
+    ]
+    assert calls[0][1] == service.SKIPPED_MESSAGE_TEMPLATE.format("Test Video [es]")
+
+
+def test_process_subsync_sync_failure(monkeypatch):
+    monkeypatch.setattr(service, 'get_plex_metadata', fake_metadata)
+    fake_subtitles(monkeypatch, {'en': "/media/movies/video.en.srt"})
+    calls = []
+    monkeypatch.setattr(service, 'send_home_assistant_notification', lambda *args, **kwargs: calls.append(args))
+    monkeypatch.setattr(service, 'sync_with_policy', fake_sync([], returncode=1))
+    assert service.process_subsync(DummyData(media_id=48)) == service.RESULT_FAILED
+    assert calls[-1][0] == service.STAGE_SYNC_FAILED
+    assert "exited with code 1" in calls[-1][1]
+
+
+def test_process_subsync_aligns_to_synced_sidecar(monkeypatch, tmp_path):
+    from subsync_plex.subtitle_align import Subtitle, format_srt
+    starts = [float(i * 4) for i in range(1, 200)]
+    for lang, shift in (('es', 0.0), ('en', 3.0)):
+        subtitle = Subtitle([s + shift for s in starts], [s + shift + 2 for s in starts], ['x'] * len(starts))
+        (tmp_path / f'video.{lang}.srt').write_text(format_srt(subtitle))
+    monkeypatch.setattr(service, 'get_plex_metadata', fake_metadata)
+    fake_subtitles(monkeypatch, {lang: str(tmp_path / f'video.{lang}.srt') for lang in ('en', 'es')})
+    monkeypatch.setattr(service, 'is_already_synced', lambda video, srt, audio, sub: sub == 'es')
+    monkeypatch.setattr(service, 'send_home_assistant_notification', lambda *args, **kwargs: None)
+    extractions = []
+    monkeypatch.setattr(service, 'reference_audio', lambda video, stream: extractions.append(video))
+    runs = []
+    monkeypatch.setattr(service, 'sync_with_policy', fake_sync(runs))
+    assert service.process_subsync(DummyData(media_id=48, sub_lang='en')) == service.RESULT_SYNCED
+    # Aligned without decoding the audio or running subsync
+    assert runs == [] and extractions == []
+    assert (tmp_path / 'video.en.srt').read_text() == (tmp_path / 'video.es.srt').read_text()
+
+
+def test_retried_job_notifies_only_final_outcome(monkeypatch):
+    from subsync_plex.jobs import JobQueue
+    from subsync_plex.metrics import REASON_NO_SUBTITLE
+    monkeypatch.setattr(service, 'get_plex_metadata', fake_metadata)
+    fake_subtitles(monkeypatch, {'es': '/media/movies/video.es.srt'})
+    monkeypatch.setattr(service, 'is_already_synced', lambda video, srt, audio, sub: True)
+    calls = []
+    monkeypatch.setattr(service, 'send_home_assistant_notification',
+                        lambda stage, message, media_id, entity_id, sub_lang=None, batch_id=None: calls.append((stage, sub_lang)))
+    queue = JobQueue(service.process_subsync, workers=1, max_size=10, retry_reasons=(REASON_NO_SUBTITLE,),
+                     max_retries=2, retry_backoff=0.01)
+    queue.start()
+    job = queue.submit(DummyData(media_id=49, sub_lang=['es', 'fr']))
+    assert job.wait(5)
+    queue.stop()
+    # Three attempts, but es is reported skipped and fr failed only once
+    assert job.attempts == 2
+    assert calls == [(service.STAGE_SYNC_SKIPPED, 'es'), (service.STAGE_SYNC_FAILED, 'fr')]
+
+
+def test_reverted_subtitle_is_not_synced_again(monkeypatch, tmp_path):
+    (tmp_path / 'movies').mkdir()
+    (tmp_path / 'movies' / 'video.mp4').write_bytes(b'video')
+    srt = tmp_path / 'movies' / 'video.en.srt'
+    srt.write_text('original')
+    monkeypatch.setattr(service, 'PLEX_LIBRARY_DIR', str(tmp_path))
+    monkeypatch.setattr(service, 'get_plex_metadata', fake_metadata)
+    fake_subtitles(monkeypatch, {'en': str(srt)})
+    monkeypatch.setattr(service, 'send_home_assistant_notification', lambda *args, **kwargs: None)
+    runs = []
+
+    def sync(ref, ref_lang, sub, sub_lang, out_file, policy):
+        runs.append(sub)
+        with open(out_file, 'w') as f:
+            f.write('synced')
+        return SyncAttempt(1.0, 0, "", out_file=out_file)
+
+    monkeypatch.setattr(service, 'sync_with_policy', sync)
+    assert service.process_subsync(DummyData(media_id=50)) == service.RESULT_SYNCED
+    assert subtitle_backup.revert(50) == [str(srt)]
+    assert srt.read_text() == 'original'
+    assert service.process_subsync(DummyData(media_id=50)) == service.RESULT_ALREADY_SYNCED
+    assert len(runs) == 1
@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+
+import subsync_plex.subtitle_align as align
+from subsync_plex.plex_api import PlexMetadata, PlexPart, PlexStream
+
+
+def cues(count=400, seed=1):
+    rng = np.random.default_rng(seed)
+    starts = np.cumsum(rng.uniform(1, 6, count))
+    return starts, starts + rng.uniform(0.8, 3, count)
+
+
+def write_srt(path, starts, ends):
+    subtitle = align.Subtitle(np.asarray(starts), np.asarray(ends), [f'line {i}' for i in range(len(starts))])
+    path.write_text(align.format_srt(subtitle), encoding='utf-8')
+    return subtitle
+
+
+def test_parse_and_format_round_trip():
+    text = '1\n00:00:01,500 --> 00:00:03,000\nHello\nthere\n\n2\n01:02:03.004 --> 01:02:04,250\nBye\n'
+    subtitle = align.parse_srt(text)
+    assert subtitle.starts.tolist() == [1.5, 3723.004]
+    assert subtitle.ends.tolist() == [3.0, 3724.25]
+    assert subtitle.texts == ['Hello\nthere', 'Bye']
+    assert align.parse_srt(align.format_srt(subtitle)).texts == subtitle.texts
+
+
+def test_best_alignment_finds_offset_and_frame_rate_scale():
+    starts, ends = cues()
+    reference = align.Subtitle(starts, ends, [])
+    scale = 25 / 23.976
+    target = align.Subtitle((starts - 12.34) / scale, (ends - 12.34) / scale, [])
+    offset, found_scale, score = align.best_alignment(reference, target)
+    assert offset == pytest.approx(12.34, abs=align.RESOLUTION)
+    assert found_scale == pytest.approx(scale)
+    assert score > 0.95
+
+
+def test_align_subtitle_writes_shifted_cues(tmp_path):
+    starts, ends = cues()
+    reference = align.Subtitle(starts, ends, [])
+    srt = tmp_path / 'Movie.en.srt'
+    write_srt(srt, starts + 4.2, ends + 4.2)
+    result = align.align_subtitle([('reference', reference)], str(srt), str(srt))
+    assert result.reference == 'reference'
+    assert result.offset == pytest.approx(-4.2, abs=align.RESOLUTION)
+    aligned = align.read_srt(str(srt))
+    assert np.allclose(aligned.starts, starts, atol=align.RESOLUTION)
+    assert aligned.texts[0] == 'line 0'
+
+
+def test_align_subtitle_rejects_unrelated_reference(tmp_path):
+    reference = align.Subtitle(*cues(seed=1), [])
+    srt = tmp_path / 'Movie.en.srt'
+    write_srt(srt, *cues(seed=2))
+    before = srt.read_text()
+    assert align.align_subtitle([('reference', reference)], str(srt), str(srt)) is None
+    assert srt.read_text() == before
+
+
+def test_embedded_text_streams_skips_sidecars_images_and_forced():
+    streams = (
+        PlexStream(1, 3, 2, 'srt', 'eng', 'en', False, None),
+        PlexStream(2, 3, 3, 'pgs', 'eng', 'en', False, None),
+        PlexStream(3, 3, 4, 'ass', 'eng', 'en', True, None),
+        PlexStream(4, 3, None, 'srt', 'eng', 'en', False, '/library/streams/4'),
+        PlexStream(5, 2, 1, 'aac', 'eng', 'en', False, None),
+    )
+    metadata = PlexMetadata(1, 'Movie', 'movie', None, (PlexPart('/m.mkv', None, streams),))
+    assert align.embedded_text_streams(metadata) == [2]
+
+
+@pytest.mark.parametrize('gaps', [(0.2, 1.0), (0.5, 2.0)])
+def test_best_alignment_scores_unrelated_dense_cues_low(gaps):
+    # Dense unrelated subtitles used to score close to the reference's speech density
+    rng = np.random.default_rng(3)
+    durations = rng.uniform(1, 4, 1500)
+    starts = np.cumsum(rng.uniform(0.2, 1.0, 1500) + np.concatenate(([0], durations[:-1])))
+    reference = align.Subtitle(starts, starts + durations, [])
+    starts = np.cumsum(rng.uniform(*gaps, 1500))
+    target = align.Subtitle(starts, starts + rng.uniform(*gaps, 1500), [])
+    assert align.best_alignment(reference, target)[2] < 0.2
+
+
+def test_extract_embedded_reads_all_tracks_in_one_pass(monkeypatch):
+    calls = []
+
+    def fake_run(args, **kwargs):
+        calls.append(args)
+        outputs = [arg for arg in args if arg.endswith('.srt')]
+        for out in outputs[:-1]:
+            with open(out, 'w') as f:
+                f.write('1\n00:00:01,000 --> 00:00:02,000\nHello\n')
+        # The last track has no cues
+        open(outputs[-1], 'w').close()
+
+    monkeypatch.setattr(align.subprocess, 'run', fake_run)
+    tracks = align.extract_embedded('/media/movie.mkv', [2, 3, 5])
+    assert len(calls) == 1
+    assert [calls[0][i + 1] for i, arg in enumerate(calls[0]) if arg == '-map'] == ['0:2', '0:3', '0:5']
+    assert sorted(tracks) == [2, 3]
+    assert tracks[2].starts.tolist() == [1.0]
+    assert align.extract_embedded('/media/movie.mkv', []) == {}
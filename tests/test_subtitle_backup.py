@@ -0,0 +1,68 @@
+import pytest
+
+import subsync_plex.subtitle_backup as backup_mod
+from subsync_plex.sync_cache import file_hash
+
+
+@pytest.fixture(autouse=True)
+def backup_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(backup_mod, 'SUBTITLE_BACKUP_DIR', str(tmp_path / 'backups'))
+    monkeypatch.setattr(backup_mod, '_conn', None)
+    return tmp_path / 'backups'
+
+
+def sync(srt, content, media_id=1, sub_lang='en'):
+    """Back up srt, overwrite it like a sync would, and record the version."""
+    original_hash = file_hash(str(srt))
+    assert backup_mod.backup(str(srt), original_hash)
+    srt.write_text(content)
+    backup_mod.record_version(media_id, str(srt), sub_lang, original_hash)
+
+
+def blobs(backup_dir):
+    return sorted(p.name for p in backup_dir.glob('*/*.gz'))
+
+
+def test_revert_restores_original(tmp_path, backup_dir):
+    srt = tmp_path / 'Movie.en.srt'
+    srt.write_text('original')
+    sync(srt, 'synced')
+    assert backup_mod.revert(1) == [str(srt)]
+    assert srt.read_text() == 'original'
+    assert backup_mod.versions(1) == []
+    assert blobs(backup_dir) == []
+    with pytest.raises(backup_mod.RevertError):
+        backup_mod.revert(1)
+
+
+def test_backups_are_deduplicated_by_content(tmp_path, backup_dir):
+    srt = tmp_path / 'Movie.en.srt'
+    srt.write_text('original')
+    sync(srt, 'synced')
+    srt.write_text('original')
+    sync(srt, 'synced again')
+    assert len(backup_mod.versions(1)) == 2
+    assert len(blobs(backup_dir)) == 1
+
+
+def test_revert_refuses_changed_subtitle_unless_forced(tmp_path):
+    srt = tmp_path / 'Movie.en.srt'
+    srt.write_text('original')
+    sync(srt, 'synced')
+    srt.write_text('edited by hand')
+    with pytest.raises(backup_mod.RevertError):
+        backup_mod.revert(1)
+    assert backup_mod.revert(1, force=True) == [str(srt)]
+    assert srt.read_text() == 'original'
+
+
+def test_old_versions_are_pruned(tmp_path, backup_dir, monkeypatch):
+    monkeypatch.setattr(backup_mod, 'SUBTITLE_BACKUP_VERSIONS', 2)
+    srt = tmp_path / 'Movie.en.srt'
+    for i in range(4):
+        srt.write_text(f'version {i}')
+        sync(srt, f'synced {i}')
+    assert len(backup_mod.versions(1)) == 2
+    assert len(blobs(backup_dir)) == 2
+    backup_mod.revert(1)
+    assert srt.read_text() == 'version 3'
@@ -49,4 +49,45 @@ def test_no_language_code(tmp_path):
     dir_path = create_files(tmp_path, "movies", ["video.srt"])
     video_file = os.path.join("movies", "video.mp4")
     result = sf.find_matching_srt(video_file, "en")
-    assert result is None
\ No newline at end of file
+    assert result is None
+
+
+def test_find_subtitle_languages(tmp_path):
+    create_files(tmp_path, "movies", [
+        "video.en.srt", "video.spa.srt", "video.en.sdh.srt", "video.fr.forced.srt", "video.srt", "other.de.srt",
+    ])
+    video_file = os.path.join("movies", "video.mp4")
+    assert sf.find_subtitle_languages(video_file) == ["en", "es"]
+    assert sf.find_subtitle_languages("missing/video.mp4") == []
+
+
+def test_classify_tags():
+    assert sf.classify_tags(("en-us", "sdh")) == ("en", "US", False, True, sf.CODE_REGION)
+    assert sf.classify_tags(("ger", "forced")) == ("de", None, True, False, sf.CODE_ISO_639_2)
+    assert sf.classify_tags(("english",)) == ("en", None, False, False, sf.CODE_NAME)
+    # 'hi' is Hindi on its own and hearing impaired after a language
+    assert sf.classify_tags(("hi",))[:4] == ("hi", None, False, False)
+    assert sf.classify_tags(("en", "hi"))[:4] == ("en", None, False, True)
+    assert sf.classify_tags(("default",))[0] is None
+
+
+def test_regional_names_and_bibliographic_codes(tmp_path):
+    dir_path = create_files(tmp_path, "movies", ["video.pt-BR.srt", "video.French.srt", "video.fre.ass"])
+    video_file = os.path.join("movies", "video.mp4")
+    assert sf.find_matching_srt(video_file, "pt") == str(dir_path / "video.pt-BR.srt")
+    # SRT is preferred over other formats
+    assert sf.find_matching_srt(video_file, "fr") == str(dir_path / "video.French.srt")
+    assert sf.find_subtitle_languages(video_file) == ["fr", "pt"]
+
+
+def test_rank_candidates(tmp_path):
+    dir_path = create_files(tmp_path, "movies", [
+        "video.en.sdh.srt", "video.en.vtt", "video.eng.srt", "video.en-GB.srt", "video.en.srt", "video.en.forced.srt",
+    ])
+    candidates = sf.subtitle_candidates(os.path.join("movies", "video.mp4"))
+    assert len(candidates) == 6
+    ranked = [os.path.basename(c.path) for c in sf.rank_candidates(candidates, "en")]
+    assert ranked == ["video.en.srt", "video.en-GB.srt", "video.eng.srt", "video.en.sdh.srt", "video.en.vtt"]
+    assert os.path.basename(sf.rank_candidates(candidates, "en-gb")[0].path) == "video.en-GB.srt"
+    assert sf.rank_candidates(candidates, "de") == []
+    assert str(dir_path / "video.en.srt") == sf.rank_candidates(candidates, "eng")[0].path
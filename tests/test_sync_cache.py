@@ -0,0 +1,57 @@
+import os
+
+import pytest
+
+import subsync_plex.sync_cache as sync_cache
+
+
+@pytest.fixture(autouse=True)
+def patch_cache_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(sync_cache, 'SYNC_CACHE_PATH', str(tmp_path / 'cache' / 'sync_cache.db'))
+    monkeypatch.setattr(sync_cache, '_conn', None)
+    return tmp_path
+
+
+def make_files(tmp_path):
+    video = tmp_path / 'video.mkv'
+    video.write_bytes(b'video')
+    srt = tmp_path / 'video.en.srt'
+    srt.write_text('synced')
+    return str(video), str(srt)
+
+
+def test_not_synced_without_record(tmp_path):
+    video, srt = make_files(tmp_path)
+    assert not sync_cache.is_already_synced(video, srt, 'en', 'en')
+
+
+def test_synced_after_record(tmp_path):
+    video, srt = make_files(tmp_path)
+    sync_cache.record_sync(video, srt, 'en', 'en', 'input', 1.0)
+    assert sync_cache.is_already_synced(video, srt, 'en', 'en')
+    # Different languages are tracked separately
+    assert not sync_cache.is_already_synced(video, srt, 'en', 'es')
+
+
+def test_subtitle_change_invalidates(tmp_path):
+    video, srt = make_files(tmp_path)
+    sync_cache.record_sync(video, srt, 'en', 'en', 'input', 1.0)
+    with open(srt, 'w') as f:
+        f.write('new download')
+    assert not sync_cache.is_already_synced(video, srt, 'en', 'en')
+
+
+def test_video_change_invalidates(tmp_path):
+    video, srt = make_files(tmp_path)
+    sync_cache.record_sync(video, srt, 'en', 'en', 'input', 1.0)
+    with open(video, 'wb') as f:
+        f.write(b'replaced video file')
+    assert not sync_cache.is_already_synced(video, srt, 'en', 'en')
+
+
+def test_disabled_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(sync_cache, 'SYNC_CACHE_PATH', '')
+    video, srt = make_files(tmp_path)
+    sync_cache.record_sync(video, srt, 'en', 'en', 'input', 1.0)
+    assert not sync_cache.is_already_synced(video, srt, 'en', 'en')
+    assert not os.path.exists(tmp_path / 'cache')
@@ -0,0 +1,128 @@
+import os
+import sys
+import time
+
+import subsync_plex.sync_engine as engine
+
+
+class DummyData:
+    def __init__(self, effort=None, min_correlation=None, timeout=None):
+        self.effort = effort
+        self.min_correlation = min_correlation
+        self.timeout = timeout
+
+
+def policy(efforts=(0.2, 0.5, 1.0), min_correlation=0.99, min_points=20, timeout=10):
+    return engine.SyncPolicy(list(efforts), min_correlation, min_points, timeout)
+
+
+def test_parse_quality():
+    output = "progress 50%, 10 points, correlation=90.00%\n[+] done, 1534 points, correlation=99.93%\n"
+    correlation, points = engine.parse_quality(output)
+    assert abs(correlation - 0.9993) < 1e-9
+    assert points == 1534
+    assert engine.parse_quality("correlation: 0.95") == (0.95, None)
+    assert engine.parse_quality("nothing useful") == (None, None)
+
+
+def test_policy_from_request(monkeypatch):
+    monkeypatch.setattr(engine, 'SUBSYNC_EFFORTS', [0.2, 1.0])
+    monkeypatch.setattr(engine, 'SUBSYNC_TIMEOUT', 600)
+    default = engine.SyncPolicy.from_request(DummyData())
+    assert default.efforts == [0.2, 1.0] and default.timeout == 600
+    override = engine.SyncPolicy.from_request(DummyData(effort=0.7, min_correlation=0.5, timeout=0))
+    assert override.efforts == [0.7]
+    assert override.min_correlation == 0.5
+    assert override.timeout is None
+
+
+def fake_runs(monkeypatch, outcomes):
+    runs = []
+
+    def run_process(args, timeout):
+        effort = float(args[args.index("--effort") + 1])
+        returncode, output, timed_out = outcomes[len(runs)]
+        runs.append(effort)
+        if returncode == 0:
+            with open(args[args.index("--out") + 1], "w") as f:
+                f.write(f"effort {effort}")
+        return returncode, output, timed_out
+
+    monkeypatch.setattr(engine, 'run_process', run_process)
+    return runs
+
+
+def test_stops_at_first_good_attempt(tmp_path, monkeypatch):
+    out = tmp_path / "video.en.srt"
+    out.write_text("original")
+    runs = fake_runs(monkeypatch, [(0, "500 points, correlation=99.5%", False)])
+    attempt = engine.sync_with_policy("ref.mkv", "en", str(out), "en", str(out), policy())
+    assert runs == [0.2]
+    assert attempt.out_file == str(out)
+    assert out.read_text() == "effort 0.2"
+    assert os.listdir(tmp_path) == ["video.en.srt"]
+
+
+def test_escalates_and_keeps_best(tmp_path, monkeypatch):
+    out = tmp_path / "video.en.srt"
+    out.write_text("original")
+    runs = fake_runs(monkeypatch, [
+        (0, "100 points, correlation=95%", False),
+        (1, "could not synchronize", False),
+        (0, "300 points, correlation=97%", False),
+    ])
+    attempt = engine.sync_with_policy("ref.mkv", "en", str(out), "en", str(out), policy())
+    assert runs == [0.2, 0.5, 1.0]
+    assert attempt.effort == 1.0
+    assert out.read_text() == "effort 1.0"
+    assert os.listdir(tmp_path) == ["video.en.srt"]
+
+
+def test_unreported_quality_escalates(tmp_path, monkeypatch):
+    out = tmp_path / "video.en.srt"
+    out.write_text("original")
+    runs = fake_runs(monkeypatch, [(0, "done", False), (0, "done", False), (0, "done", False)])
+    attempt = engine.sync_with_policy("ref.mkv", "en", str(out), "en", str(out), policy())
+    assert runs == [0.2, 0.5, 1.0]
+    assert attempt.effort == 1.0
+    assert out.read_text() == "effort 1.0"
+    assert os.listdir(tmp_path) == ["video.en.srt"]
+
+
+def test_timeout_stops_escalation_and_leaves_original(tmp_path, monkeypatch):
+    out = tmp_path / "video.en.srt"
+    out.write_text("original")
+    runs = fake_runs(monkeypatch, [(None, "", True)])
+    attempt = engine.sync_with_policy("ref.mkv", "en", str(out), "en", str(out), policy())
+    assert runs == [0.2]
+    assert attempt.out_file is None
+    assert attempt.reason == "subsync timed out"
+    assert out.read_text() == "original"
+
+
+def test_run_process_captures_output():
+    returncode, output, timed_out = engine.run_process(
+        [sys.executable, "-c", "print('42 points, correlation=99%'); raise SystemExit(3)"], timeout=10
+    )
+    assert returncode == 3
+    assert "42 points" in output
+    assert not timed_out
+
+
+def test_run_process_kills_process_tree_on_timeout():
+    started = time.monotonic()
+    returncode, _, timed_out = engine.run_process(["sh", "-c", "sleep 30 & sleep 30"], timeout=0.5)
+    assert timed_out and returncode is None
+    assert time.monotonic() - started < 10
+
+
+def test_run_subsync_falls_back_to_cli(monkeypatch):
+    class UnavailablePool:
+        def run(self, args, timeout):
+            assert args[0] == "--cli"
+            return None
+
+    monkeypatch.setattr(engine, 'SUBSYNC_ENGINE', engine.ENGINE_LIBRARY)
+    monkeypatch.setattr(engine, 'get_pool', lambda: UnavailablePool())
+    monkeypatch.setattr(engine, 'run_process', lambda args, timeout: (0, "cli", False))
+    assert engine.run_subsync(["subsync", "--cli", "sync"], 10) == (0, "cli", False)